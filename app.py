@@ -6,15 +6,27 @@ Flask Webhook Server
 """
 
 import os
+import time
 from datetime import datetime, timezone, timedelta
-from flask import Flask, request, abort
-from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
-from linebot.models import MessageEvent, TextMessage, TextSendMessage
-from dotenv import load_dotenv
 
 from config.settings import config
-from services.query_router import route_message
+from utils.startup import startup_profile
+
+# 冷啟動量測：STARTUP_PROFILE=True 時記錄以下每個模組的 import 時間（預熱完成後寫入 log 與 /metrics）
+startup_profile.begin(trace_imports=config.STARTUP_PROFILE)
+
+from flask import Flask, Response, jsonify, request, abort                                  # noqa: E402
+from linebot import LineBotApi, WebhookHandler                                              # noqa: E402
+from linebot.exceptions import InvalidSignatureError                                        # noqa: E402
+from linebot.models import MessageEvent, TextMessage, LocationMessage, TextSendMessage      # noqa: E402
+from dotenv import load_dotenv                                                              # noqa: E402
+
+from services import warmup                                                                 # noqa: E402
+from services.query_router import route_message, route_location                             # noqa: E402
+from services.reply_dispatcher import ReplyDispatcher                                       # noqa: E402
+from utils.metrics import registry, CONTENT_TYPE                                            # noqa: E402
+
+startup_profile.mark("imports")
 
 # 載入環境變數
 load_dotenv()
@@ -62,7 +74,7 @@ def callback():
     
     # 驗證 signature
     try:
-        handler.handle(body, signature)
+        _dispatch_events(body, signature)
     except InvalidSignatureError:
         app.logger.error("Invalid signature. Please check your channel secret.")
         abort(400)
@@ -70,6 +82,44 @@ def callback():
     return "OK"
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    """就緒檢查（Cloud Run startup probe）：預熱完成前回 503，完成後回 200 與各階段耗時"""
+    if not warmup.is_ready():
+        # 未經 gunicorn.conf.py 預熱的啟動方式（例如 flask run）：第一次檢查時開始背景預熱
+        warmup.start_warm_up(config)
+    return jsonify(warmup.status()), (200 if warmup.is_ready() else 503)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus 指標（行程內：分流延遲、OpenAI 呼叫與 token、快取、回覆佇列）"""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+def _dispatch_events(body, signature):
+    """
+    驗證簽章後分派文字 / 位置訊息事件（同一使用者依序、不同使用者並行）。
+    非同步模式：交給背景 worker，立即回 200
+    同步模式：單一事件直接處理；多個事件並行處理，全部完成後才回 200
+    """
+    received_at = time.monotonic()
+    events = [
+        event for event in handler.parser.parse(body, signature)
+        if isinstance(event, MessageEvent)
+        and isinstance(event.message, (TextMessage, LocationMessage))
+    ]
+    if config.WEBHOOK_ASYNC:
+        # 佇列已滿時 submit 會就地處理（仍依同一使用者的順序），不丟訊息
+        for event in events:
+            reply_dispatcher.submit(event, received_at)
+    elif len(events) == 1:
+        reply_now(events[0])
+    elif events:
+        if not reply_dispatcher.run_batch(events, received_at, timeout=config.REPLY_TOKEN_TTL_SECONDS):
+            app.logger.warning("部分事件未在 reply token 效期內完成，將改以 push 回覆")
+
+
 # ============================================================
 # Line Bot 事件處理
 # ============================================================
@@ -85,9 +135,12 @@ def get_now_str():
     return f"{now.year}年{now.month}月{now.day}日（{wd}）{now.strftime('%H:%M')}"
 
 
-@handler.add(MessageEvent, message=TextMessage)
-def handle_text_message(event):
-    """處理文字訊息：用 ChatGPT 依課程／館區／環教說明回覆，並解析興趣度"""
+def compose_reply(event):
+    """依訊息產生回覆文字（文字：課程／館區／環教說明並解析興趣度；位置：附近館區）"""
+    if isinstance(event.message, LocationMessage):
+        reply_text, _ = route_location(event.message.latitude, event.message.longitude, config)
+        return reply_text
+
     user_message = event.message.text.strip()
     user_id = event.source.user_id
 
@@ -100,13 +153,67 @@ def handle_text_message(event):
         reply_text, interest = route_message(user_message, config, now_str, now_dt)
         if interest:
             app.logger.info(f"興趣度: {interest}")
+        if conversation_logger:
+            conversation_logger.log_exchange(user_id, user_message, reply_text, intent_label=interest)
+    return reply_text
 
+
+def reply_now(event):
+    """同步模式：產生回覆後以 reply token 回覆"""
+    reply_text = compose_reply(event)
     line_bot_api.reply_message(
         event.reply_token,
         TextSendMessage(text=reply_text)
     )
 
 
+def _create_conversation_logger():
+    """對話紀錄需要 SQLAlchemy（import 約 0.3 秒），停用時不載入。"""
+    from database.db import SessionLocal
+    from services.conversation_logger import ConversationLogger
+    return ConversationLogger(
+        SessionLocal,
+        max_queue=config.CONVERSATION_LOG_QUEUE_SIZE,
+        batch_size=config.CONVERSATION_LOG_BATCH_SIZE,
+        flush_interval=config.CONVERSATION_LOG_FLUSH_SECONDS,
+        drop_policy=config.CONVERSATION_LOG_DROP_POLICY,
+    )
+
+
+conversation_logger = _create_conversation_logger() if config.CONVERSATION_LOG_ENABLED else None
+
+registry.callback(
+    "zoo_conversation_log_pending", "對話紀錄佇列中尚未寫入的筆數",
+    lambda: conversation_logger.pending() if conversation_logger else None,
+)
+
+reply_dispatcher = ReplyDispatcher(
+    compose=compose_reply,
+    reply=lambda token, text: line_bot_api.reply_message(token, TextSendMessage(text=text)),
+    push=lambda to, text: line_bot_api.push_message(to, TextSendMessage(text=text)),
+    workers=config.REPLY_WORKERS,
+    max_queue=config.REPLY_QUEUE_SIZE,
+    token_ttl=config.REPLY_TOKEN_TTL_SECONDS,
+)
+
+registry.callback(
+    "zoo_reply_queue_events_total", "回覆佇列事件數",
+    lambda: {(k,): v for k, v in reply_dispatcher.stats().items()
+             if k in ("submitted", "rejected", "overflowed", "completed", "failed", "deadline_misses")},
+    labelnames=("event",), type_name="counter",
+)
+registry.callback(
+    "zoo_reply_queue_depth", "回覆佇列目前待處理事件數（含等待同一使用者前一則訊息者）",
+    lambda: reply_dispatcher.stats()["queue_depth"],
+)
+registry.callback(
+    "zoo_reply_active_lanes", "目前有事件處理中的使用者數",
+    lambda: reply_dispatcher.stats()["active_lanes"],
+)
+
+startup_profile.mark("app_init")
+
+
 # ============================================================
 # 啟動伺服器
 # ============================================================
@@ -123,4 +230,6 @@ if __name__ == "__main__":
     print(f"🔧 除錯模式：{'開啟' if debug else '關閉'}")
     print("=" * 60)
     
+    # 開發模式：背景預熱，完成前 /ready 回 503（gunicorn 由 gunicorn.conf.py 預熱）
+    warmup.start_warm_up(config)
     app.run(host=host, port=port, debug=debug)
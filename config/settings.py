@@ -26,11 +26,68 @@ class Config:
     OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     GPT_MAX_TOKENS = int(os.getenv("GPT_MAX_TOKENS", "1200"))
     GPT_TEMPERATURE = float(os.getenv("GPT_TEMPERATURE", "0.7"))
+    # 連線池與逾時（OPENAI_BASE_URL 可指向本機 OpenAI 相容 stub）
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "30"))
+    OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "10"))
+    OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+    OPENAI_RETRY_BACKOFF = float(os.getenv("OPENAI_RETRY_BACKOFF", "0.5"))
+    # 每則訊息的 GPT 延遲預算（秒，從進入路由起算；0 = 不限），需小於 REPLY_TOKEN_TTL_SECONDS
+    GPT_LATENCY_BUDGET_SECONDS = float(os.getenv("GPT_LATENCY_BUDGET_SECONDS", "20"))
+    # 斷路器：連續失敗（或慢於 SLOW 秒）達 FAILURES 次即暫停呼叫 OPEN 秒，期間改用本地回覆（FAILURES=0 停用）
+    GPT_BREAKER_FAILURES = int(os.getenv("GPT_BREAKER_FAILURES", "5"))
+    GPT_BREAKER_SLOW_SECONDS = float(os.getenv("GPT_BREAKER_SLOW_SECONDS", "12"))
+    GPT_BREAKER_OPEN_SECONDS = float(os.getenv("GPT_BREAKER_OPEN_SECONDS", "30"))
+    # 串流回覆：記錄首個 token 時間，內容超過 LINE 長度上限即中止生成
+    GPT_STREAM = os.getenv("GPT_STREAM", "True").lower() == "true"
+    # GPT 輸入 token 預算（本地估算；0 = 不限）：超出時依序截短檢索段落、附加資料、課程詳細、課程摘要；
+    # full 模式的固定前綴本身超出預算時自動改用 retrieval
+    GPT_INPUT_TOKEN_BUDGET = int(os.getenv("GPT_INPUT_TOKEN_BUDGET", "3000"))
+    # 當日已篩選課程（摘要 + 詳細）至少保留的 token 數，預算不足時也不截到此下限以下
+    GPT_DAY_COURSES_MIN_TOKENS = int(os.getenv("GPT_DAY_COURSES_MIN_TOKENS", "1200"))
+    # Prompt 參考資料：retrieval = 課程總覽 + 依問題檢索的段落（token 預算內）；full = 整份資料
+    PROMPT_CONTEXT_MODE = os.getenv("PROMPT_CONTEXT_MODE", "retrieval")
+    PROMPT_CONTEXT_TOP_K = int(os.getenv("PROMPT_CONTEXT_TOP_K", "6"))
+    PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "900"))
+    # 回覆快取（LRU + TTL；SQLite 路徑留空則只用記憶體）
+    REPLY_CACHE_ENABLED = os.getenv("REPLY_CACHE_ENABLED", "True").lower() == "true"
+    REPLY_CACHE_TTL_SECONDS = int(os.getenv("REPLY_CACHE_TTL_SECONDS", "3600"))
+    REPLY_CACHE_MAX_ENTRIES = int(os.getenv("REPLY_CACHE_MAX_ENTRIES", "512"))
+    REPLY_CACHE_MAX_BYTES = int(os.getenv("REPLY_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+    REPLY_CACHE_SQLITE_PATH = os.getenv("REPLY_CACHE_SQLITE_PATH", "")
+    # 相同問題同時進來時只呼叫一次 OpenAI（鎖目錄留空則只合併同一 worker 內的請求；
+    # 跨 worker 需搭配 REPLY_CACHE_SQLITE_PATH 共用結果）
+    SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+    SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", "45"))
+    SINGLE_FLIGHT_LOCK_DIR = os.getenv("SINGLE_FLIGHT_LOCK_DIR", "")
+    
+    # ============================================================
+    # Webhook 回覆派送（非同步：先回 200，背景 worker 產生回覆；
+    # 同步：多事件並行處理後回 200。同一使用者的訊息皆依序處理）
+    # 非同步模式在回應後仍需 CPU：Cloud Run 須設定 CPU 一律配置（--no-cpu-throttling）
+    # ============================================================
+    WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "False").lower() == "true"
+    REPLY_WORKERS = int(os.getenv("REPLY_WORKERS", "4"))
+    REPLY_QUEUE_SIZE = int(os.getenv("REPLY_QUEUE_SIZE", "100"))
+    REPLY_TOKEN_TTL_SECONDS = float(os.getenv("REPLY_TOKEN_TTL_SECONDS", "50"))
+    # worker 結束（SIGTERM）時等待背景回覆送完的秒數（Cloud Run 收到 SIGTERM 後約 10 秒即強制結束）
+    REPLY_SHUTDOWN_SECONDS = float(os.getenv("REPLY_SHUTDOWN_SECONDS", "8"))
     
     # ============================================================
     # 資料庫設定
     # ============================================================
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///zoo_bot.db")
+    # SQLAlchemy 是否把每條 SQL（含使用者訊息內容）寫入 log，只在本機除錯時開啟
+    DATABASE_ECHO = os.getenv("DATABASE_ECHO", "False").lower() == "true"
+    # SQLite 寫入遇到其他 worker 持有鎖時最多等待的毫秒數（busy_timeout，另開啟 WAL）
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    # 對話紀錄 write-behind（背景批次寫入 conversations / users）
+    CONVERSATION_LOG_ENABLED = os.getenv("CONVERSATION_LOG_ENABLED", "True").lower() == "true"
+    CONVERSATION_LOG_QUEUE_SIZE = int(os.getenv("CONVERSATION_LOG_QUEUE_SIZE", "1000"))
+    CONVERSATION_LOG_BATCH_SIZE = int(os.getenv("CONVERSATION_LOG_BATCH_SIZE", "50"))
+    CONVERSATION_LOG_FLUSH_SECONDS = float(os.getenv("CONVERSATION_LOG_FLUSH_SECONDS", "2"))
+    CONVERSATION_LOG_DROP_POLICY = os.getenv("CONVERSATION_LOG_DROP_POLICY", "drop_newest")
     
     # ============================================================
     # Flask 設定
@@ -43,16 +100,32 @@ class Config:
     # 模型路徑
     # ============================================================
     BERT_MODEL_PATH = os.getenv("BERT_MODEL_PATH", "models/intent_classifier")
+    # 本地意圖分類（CPU）：啟用後每則文字訊息的興趣度標籤由模型產生
+    INTENT_CLASSIFIER_ENABLED = os.getenv("INTENT_CLASSIFIER_ENABLED", "False").lower() == "true"
+    INTENT_BATCH_SIZE = int(os.getenv("INTENT_BATCH_SIZE", "16"))
+    INTENT_BATCH_WAIT_MS = float(os.getenv("INTENT_BATCH_WAIT_MS", "5"))
+    INTENT_TIMEOUT_MS = float(os.getenv("INTENT_TIMEOUT_MS", "300"))
+    INTENT_THREADS = int(os.getenv("INTENT_THREADS", "1"))
+    INTENT_QUANTIZE = os.getenv("INTENT_QUANTIZE", "True").lower() == "true"
     
     # ============================================================
     # 資料路徑
     # ============================================================
-    COURSES_CSV_PATH = os.getenv("COURSES_CSV_PATH", "data/courses-February.csv")
+    # 課程目錄：COURSES_DIR 內所有月份課表合併，檔案變動時背景重建換版
+    COURSES_DIR = os.getenv("COURSES_DIR", "data")
+    COURSES_GLOB = os.getenv("COURSES_GLOB", "courses-*.csv")
+    COURSES_RELOAD_SECONDS = float(os.getenv("COURSES_RELOAD_SECONDS", "10"))
+    COURSES_CSV_PATH = os.getenv("COURSES_CSV_PATH", "data/courses-February.csv")  # 資料夾內無課表時使用
     ZOO_AREAS_CSV_PATH = os.getenv("ZOO_AREAS_CSV_PATH", "data/zoo_areas.csv")
     ENV_EDU_NOTES_PATH = os.getenv("ENV_EDU_NOTES_PATH", "data/環教時數說明.txt")
     ZOO_AREAS_JSON_PATH = os.getenv("ZOO_AREAS_JSON_PATH", "data/zoo_areas.json")
     FACILITIES_JSON_PATH = os.getenv("FACILITIES_JSON_PATH", "data/facilities.json")
     
+    # 分流分類器：關鍵字表漏接的訊息，信心 ≥ 門檻時改由本地回應（不呼叫 GPT）
+    ROUTE_CLASSIFIER_ENABLED = os.getenv("ROUTE_CLASSIFIER_ENABLED", "True").lower() == "true"
+    ROUTE_CLASSIFIER_PATH = os.getenv("ROUTE_CLASSIFIER_PATH", "data/route_classifier.json")
+    ROUTE_CLASSIFIER_THRESHOLD = float(os.getenv("ROUTE_CLASSIFIER_THRESHOLD", "0.6"))
+    
     # ============================================================
     # 提醒機制參數
     # ============================================================
@@ -108,6 +181,13 @@ class Config:
     # ============================================================
     PORT = int(os.getenv("PORT", "5001"))
     HOST = os.getenv("HOST", "0.0.0.0")
+    # 啟動預熱：worker 接收請求前先載入資料、建索引、建立 OpenAI 連線池（/ready 在完成前回 503）
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "True").lower() == "true"
+    WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "20"))
+    # 預熱時先與 OpenAI 建立一條連線（TCP + TLS，GET /models，不耗 token）
+    WARMUP_OPENAI_CONNECT = os.getenv("WARMUP_OPENAI_CONNECT", "True").lower() == "true"
+    # 記錄每個模組的 import 時間（啟動較慢，僅供量測冷啟動）
+    STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "False").lower() == "true"
     
     # ============================================================
     # 日誌設定
@@ -4,17 +4,38 @@
 資料庫連線設定
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from config.settings import config
 from database.models import Base
 
 
+def create_db_engine(url, echo=False, busy_timeout_ms=5000):
+    """
+    建立資料庫引擎。
+    SQLite：每條連線開啟 WAL（讀寫互不阻塞）並設定 busy_timeout，
+    多個 gunicorn worker 同時寫入時等待鎖釋放，而不是立即回報 database is locked。
+    """
+    engine = create_engine(
+        url,
+        echo=echo,  # 顯示 SQL（含使用者訊息，只在本機除錯時開啟）
+        pool_pre_ping=True  # 連線前檢查
+    )
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _sqlite_pragmas(dbapi_conn, _record):
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+            cursor.close()
+    return engine
+
+
 # 建立資料庫引擎
-engine = create_engine(
+engine = create_db_engine(
     config.DATABASE_URL,
-    echo=config.FLASK_DEBUG,  # 在除錯模式下顯示 SQL
-    pool_pre_ping=True  # 連線前檢查
+    echo=config.DATABASE_ECHO,
+    busy_timeout_ms=config.SQLITE_BUSY_TIMEOUT_MS,
 )
 
 # 建立 Session 工廠
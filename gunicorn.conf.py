@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+gunicorn 設定（Dockerfile：gunicorn -c gunicorn.conf.py ...）
+
+每個 worker fork 後、開始接收請求前先完成預熱（資料、索引、OpenAI 連線池），
+第一位使用者不必負擔冷啟動；預熱期間每完成一步就回報 heartbeat，避免被 arbiter 判定逾時。
+worker 結束（SIGTERM）時先把背景回覆佇列送完，非同步模式下排隊中的回覆不會遺失。
+"""
+
+import sys
+
+
+def post_worker_init(worker):
+    from config.settings import config
+    from services.warmup import warm_up
+
+    warm_up(config, notify=worker.notify)
+
+
+def worker_exit(server, worker):
+    app = sys.modules.get("app")
+    dispatcher = getattr(app, "reply_dispatcher", None)
+    if dispatcher is None:
+        return
+    from config.settings import config
+    dispatcher.shutdown(timeout=config.REPLY_SHUTDOWN_SECONDS)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+單次解析（parse_message）vs 舊的逐函式解析：每則訊息的解析延遲，並核對兩者結果一致。
+
+- 舊路徑 = scan_message + 路由的 detect_query_weekday / detect_query_date + GPT 請求再算一次
+  星期與日期 + 公休目標日（相對日期、日期、星期、月份各自 search）+ 開放時間場館；
+  舊函式已移除，下面保留原本的實作作為對照
+- 新路徑 = parse_message（Aho-Corasick 一次掃描 + 預先編譯的日期 regex 一次 finditer）
+- 訊息：training_data/route_seed.csv + scripts/bench_corpus.csv + 日期 / 公休樣本
+
+用法：
+    python scripts/bench_query_parser.py
+    python scripts/bench_query_parser.py --iterations 500 --max-p99-us 300   # 超過時 exit 1
+"""
+
+import os
+import re
+import sys
+import csv
+import time
+import argparse
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.query_router import parse_message, scan_message, TW_TZ   # noqa: E402
+
+_EXTRA_MESSAGES = [
+    "明天大貓熊館有開嗎", "下週一穿山甲館公休嗎", "禮拜天有開嗎", "下個月哪天休館",
+    "十二月公休日", "3月企鵝館休息嗎", "2月18日有什麼課", "星期三下午的課程", "後天有活動嗎",
+    "酷Cool節能屋幾點開", "遊客列車幾點到幾點", "這週日新光特展館有開嗎", "本月公休",
+]
+
+# ── 舊路徑（本次改版前 chatgpt_service / query_router 的實作） ──────
+
+_WEEKDAY_ZH = ["週一", "週二", "週三", "週四", "週五", "週六", "週日"]
+_RELATIVE = {"今天": 0, "今日": 0, "昨天": -1, "昨日": -1, "明天": 1, "明日": 1, "後天": 2, "前天": -2}
+_ZH_MONTHS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7,
+              "八": 8, "九": 9, "十": 10, "十一": 11, "十二": 12}
+_DATE_RE = re.compile(r'(\d{1,2})[月/](\d{1,2})[日號]?')
+_MONTH_RE = re.compile(r'(\d{1,2}|十[一二]?|[一二三四五六七八九])月(?!\s*\d)')
+_WEEK_RE = re.compile(r'(下|這|本)?(?:週|星期|禮拜)([一二三四五六日天])')
+_HOURS_VENUES = {"遊客列車": "遊客列車", "列車": "遊客列車", "酷cool": "酷Cool節能屋",
+                 "節能屋": "酷Cool節能屋", "動物展示": "動物展示"}
+
+
+def legacy_weekday(message, now):
+    wd = now.weekday()
+    for kw, offset in _RELATIVE.items():
+        if kw in message:
+            return _WEEKDAY_ZH[(wd + offset) % 7]
+    for i, zh in enumerate(_WEEKDAY_ZH):
+        if zh in message or zh.replace("週", "星期") in message:
+            return zh
+    m = re.search(r'(\d{1,2})[月/](\d{1,2})[日號]?', message)
+    if m:
+        try:
+            return _WEEKDAY_ZH[datetime(now.year, int(m.group(1)), int(m.group(2))).weekday()]
+        except ValueError:
+            pass
+    return None
+
+
+def legacy_date(message, now):
+    for kw, offset in _RELATIVE.items():
+        if kw in message:
+            return now.date() + timedelta(days=offset)
+    m = _DATE_RE.search(message)
+    if m:
+        try:
+            return date(now.year, int(m.group(1)), int(m.group(2)))
+        except ValueError:
+            pass
+    return None
+
+
+def legacy_closure_target(message, now):
+    today = now.date()
+    for kw, offset in _RELATIVE.items():
+        if kw in message:
+            return ("day", today + timedelta(days=offset))
+    m = _DATE_RE.search(message)
+    if m:
+        try:
+            return ("day", date(today.year, int(m.group(1)), int(m.group(2))))
+        except ValueError:
+            pass
+    m = _WEEK_RE.search(message)
+    if m:
+        wd = "一二三四五六日天".index(m.group(2)) % 7 if m.group(2) != "天" else 6
+        if m.group(1) == "下":
+            d = today - timedelta(days=today.weekday()) + timedelta(days=7 + wd)
+        elif m.group(1) in ("這", "本"):
+            d = today - timedelta(days=today.weekday()) + timedelta(days=wd)
+        else:
+            d = today + timedelta(days=(wd - today.weekday()) % 7)
+        return ("day", d)
+    if "下個月" in message or "下月" in message:
+        return ("month", (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1))
+    if "這個月" in message or "本月" in message:
+        return ("month", (today.year, today.month))
+    m = _MONTH_RE.search(message)
+    if m:
+        token = m.group(1)
+        month = int(token) if token.isdigit() else _ZH_MONTHS[token]
+        if 1 <= month <= 12:
+            return ("month", (today.year, month))
+    return None
+
+
+def legacy_hours_venue(message):
+    for kw, venue in _HOURS_VENUES.items():
+        if kw.lower() in message.lower():
+            return venue
+    return None
+
+
+def legacy_parse(message, now):
+    matches = scan_message(message)
+    weekday = legacy_weekday(message, now)          # 路由：課程日期查詢
+    target_date = legacy_date(message, now)
+    legacy_weekday(message, now)                    # get_reply_and_interest 再算一次
+    legacy_date(message, now)
+    return weekday, target_date, legacy_closure_target(message, now), legacy_hours_venue(message), matches
+
+
+def new_fields(parsed):
+    target = parsed.closure_target
+    if target is not None:
+        target = (target.kind, target.date) if target.kind == "day" else (target.kind, (target.year, target.month))
+    return parsed.weekday, parsed.date, target, parsed.hours_venue
+
+
+# ── 量測 ────────────────────────────────────────────────────────
+
+def load_messages(seed_path, corpus_path):
+    seen = dict.fromkeys(_EXTRA_MESSAGES)
+    with open(seed_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            seen.setdefault(row["text"].strip())
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            seen.setdefault(row["message"].strip())
+    return [m for m in seen if m]
+
+
+def time_calls(fn, messages, iterations):
+    samples = []
+    for _ in range(iterations):
+        for m in messages:
+            t0 = time.perf_counter_ns()
+            fn(m)
+            samples.append((time.perf_counter_ns() - t0) / 1000)
+    samples.sort()
+    n = len(samples)
+    return {
+        "mean": sum(samples) / n,
+        "p50": samples[n // 2],
+        "p95": samples[min(n - 1, int(n * 0.95))],
+        "p99": samples[min(n - 1, int(n * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="單次解析 vs 逐函式解析")
+    parser.add_argument("--seed", default=os.path.join(ROOT, "training_data", "route_seed.csv"))
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "scripts", "bench_corpus.csv"))
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--now", default="2026-02-16 10:00")
+    parser.add_argument("--max-p99-us", type=float, default=500.0, help="parse_message p99 上限（微秒）")
+    args = parser.parse_args()
+
+    now_dt = datetime.strptime(args.now, "%Y-%m-%d %H:%M").replace(tzinfo=TW_TZ)
+    messages = load_messages(args.seed, args.corpus)
+
+    # 結果一致性（關鍵字命中兩者共用同一個自動機，只比日期、星期、公休目標與場館）
+    diffs = [m for m in messages if legacy_parse(m, now_dt)[:4] != new_fields(parse_message(m, now_dt))]
+    for m in diffs[:10]:
+        print(f"不一致：{m!r} 舊={legacy_parse(m, now_dt)[:4]} 新={new_fields(parse_message(m, now_dt))}")
+
+    scan_message(messages[0])                       # 先建好自動機，不計入量測
+    legacy = time_calls(lambda m: legacy_parse(m, now_dt), messages, args.iterations)
+    single = time_calls(lambda m: parse_message(m, now_dt), messages, args.iterations)
+    print(f"訊息 {len(messages)} 則 × {args.iterations} 輪；結果不一致 {len(diffs)} 則\n")
+    print(f"{'解析':<12}{'mean µs':>10}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}")
+    for name, row in (("legacy", legacy), ("parse_once", single)):
+        print(f"{name:<12}" + "".join(f"{row[k]:>10.1f}" for k in ("mean", "p50", "p95", "p99")))
+    print(f"\nmean 加速 {legacy['mean'] / single['mean']:.2f}×")
+
+    if diffs:
+        sys.exit(1)
+    if single["p99"] > args.max_p99_us:
+        print(f"\n❌ parse_message p99 {single['p99']:.1f} µs 超過 {args.max_p99_us:.0f} µs")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
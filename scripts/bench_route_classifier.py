@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分流分類器 vs 關鍵字路由：單則判定延遲、載入耗時，以及關鍵字漏接（原本交 GPT）的訊息中
+分類器在門檻下接手了多少。
+
+- 關鍵字路由的判定 = scan_message（Aho-Corasick 一次掃描）+ detect_query_weekday
+- 分類器判定 = RouteClassifier.predict（純 Python TF-IDF · 權重）
+- 訊息：training_data/route_seed.csv + scripts/bench_corpus.csv
+
+用法：
+    python scripts/bench_route_classifier.py
+    python scripts/bench_route_classifier.py --threshold 0.7 --max-p99-us 1000   # 超過時 exit 1
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+from collections import Counter
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config.settings import Config                                    # noqa: E402
+from services.chatgpt_service import detect_query_weekday              # noqa: E402
+from services.query_router import scan_message, TW_TZ                  # noqa: E402
+from services.route_classifier import parse_route_model                # noqa: E402
+
+
+def load_messages(seed_path, corpus_path):
+    """[(訊息, 標註分流或 None)]，依訊息去重。"""
+    seen = {}
+    with open(seed_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            seen.setdefault(row["text"].strip(), row["label"].strip())
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            seen.setdefault(row["message"].strip(), None)
+    return [(m, label) for m, label in seen.items() if m]
+
+
+def keyword_route(message, now_dt):
+    """關鍵字路由的判定（不產生回覆）。"""
+    matches = scan_message(message)
+    if matches.has("nearby"):
+        return "nearby"
+    query_type = matches.first("visitor")
+    if query_type:
+        return query_type
+    if detect_query_weekday(message, now_dt):
+        return "course_date"
+    return None
+
+
+def time_calls(fn, messages, iterations):
+    samples = []
+    for _ in range(iterations):
+        for m in messages:
+            t0 = time.perf_counter_ns()
+            fn(m)
+            samples.append((time.perf_counter_ns() - t0) / 1000)
+    samples.sort()
+    n = len(samples)
+    return {
+        "mean": sum(samples) / n,
+        "p50": samples[n // 2],
+        "p95": samples[min(n - 1, int(n * 0.95))],
+        "p99": samples[min(n - 1, int(n * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分流分類器 vs 關鍵字路由")
+    parser.add_argument("--model", default=os.path.join(ROOT, Config.ROUTE_CLASSIFIER_PATH))
+    parser.add_argument("--seed", default=os.path.join(ROOT, "training_data", "route_seed.csv"))
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "scripts", "bench_corpus.csv"))
+    parser.add_argument("--threshold", type=float, default=Config.ROUTE_CLASSIFIER_THRESHOLD)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--now", default="2026-02-16 10:00")
+    parser.add_argument("--max-p99-us", type=float, default=1000.0, help="分類器 p99 上限（微秒）")
+    args = parser.parse_args()
+
+    now_dt = datetime.strptime(args.now, "%Y-%m-%d %H:%M").replace(tzinfo=TW_TZ)
+    messages = load_messages(args.seed, args.corpus)
+    texts = [m for m, _ in messages]
+
+    t0 = time.perf_counter()
+    classifier = parse_route_model(args.model)
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    keyword = time_calls(lambda m: keyword_route(m, now_dt), texts, args.iterations)
+    model = time_calls(classifier.predict, texts, args.iterations)
+    print(f"訊息 {len(texts)} 則 × {args.iterations} 輪；模型載入 {load_ms:.1f} ms"
+          f"（{len(classifier.features)} 個 n-gram）\n")
+    print(f"{'判定':<12}{'mean µs':>10}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}")
+    for name, row in (("keyword", keyword), ("classifier", model)):
+        print(f"{name:<12}" + "".join(f"{row[k]:>10.1f}" for k in ("mean", "p50", "p95", "p99")))
+
+    # 關鍵字漏接的訊息：分類器在門檻下接手多少、接手得對不對（有標註者）
+    missed = [(m, label) for m, label in messages if keyword_route(m, now_dt) is None]
+    taken = Counter()
+    correct = wrong = 0
+    for m, label in missed:
+        route, confidence = classifier.predict(m)
+        if route == "open_ended" or confidence < args.threshold:
+            continue
+        taken[route] += 1
+        if label is not None:
+            if label == route:
+                correct += 1
+            else:
+                wrong += 1
+    missed_routable = sum(1 for _, label in missed if label not in (None, "open_ended"))
+    print(f"\n關鍵字漏接 {len(missed)} 則（其中標註為可本地回應 {missed_routable} 則），"
+          f"門檻 {args.threshold} 下分類器接手 {sum(taken.values())} 則：{dict(taken)}")
+    print(f"有標註者：正確 {correct}、錯誤 {wrong}（訓練資料內的訊息，僅供檢查接線，非泛化準確率）")
+
+    if model["p99"] > args.max_p99_us:
+        print(f"\n❌ 分類器 p99 {model['p99']:.1f} µs 超過 {args.max_p99_us:.0f} µs")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+路由效能基準：把訊息語料重播進 route_message，統計各分流的延遲與記憶體配置。
+
+- OpenAI 以行程內的固定替身取代（openai_client.install_client），不需網路與金鑰
+- 回覆快取關閉，GPT 分流每次都會組 prompt、呼叫替身
+- 分流：nearby / visitor / course / gpt（語料 scripts/bench_corpus.csv 的 branch 欄）
+- 冷啟動：清空 data_store 後第一輪的耗時（資料載入路徑的退化會反映在這裡）
+- 記憶體：tracemalloc 量測每次呼叫的峰值配置與呼叫後仍保留的位元組
+
+用法：
+    python scripts/bench_routing.py                          # 印出結果
+    python scripts/bench_routing.py --save-baseline bench.json
+    python scripts/bench_routing.py --baseline bench.json    # 退化超過 --tolerance 時 exit 1
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+from types import SimpleNamespace
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config.settings import Config                      # noqa: E402
+from services import openai_client                      # noqa: E402
+from services.data_store import data_store              # noqa: E402
+from services.query_router import route_message, TW_TZ  # noqa: E402
+
+BRANCHES = ("nearby", "visitor", "course", "gpt")
+FAKE_REPLY = "[興趣度: maybe_interest]\n（benchmark 替身回覆）{question}"
+
+
+# ── OpenAI 替身 ─────────────────────────────────────────────────
+
+class FakeCompletions:
+    """chat.completions 替身：固定回覆，可選擇模擬生成延遲；stream=True 時逐段回傳。"""
+
+    def __init__(self, latency_s=0.0):
+        self.latency_s = latency_s
+        self.calls = 0
+
+    def create(self, messages, stream=False, **kwargs):
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        question = messages[-1]["content"] if messages else ""
+        content = FAKE_REPLY.format(question=question[:30])
+        if stream:
+            return iter([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + 8]))])
+                for i in range(0, len(content), 8)
+            ])
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_chars,
+                completion_tokens=len(content),
+                total_tokens=prompt_chars + len(content),
+            ),
+        )
+
+
+class FakeOpenAI:
+    def __init__(self, latency_s=0.0):
+        self.chat = SimpleNamespace(completions=FakeCompletions(latency_s))
+
+
+class BenchConfig(Config):
+    OPENAI_API_KEY = "bench"
+    REPLY_CACHE_ENABLED = False
+
+
+# ── 統計 ────────────────────────────────────────────────────────
+
+def percentile(sorted_values, p):
+    """最近秩百分位數（sorted_values 已排序）。"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def load_corpus(path):
+    corpus = []
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            branch = (row.get("branch") or "").strip()
+            message = (row.get("message") or "").strip()
+            if branch in BRANCHES and message:
+                corpus.append((branch, message))
+    return corpus
+
+
+def _route(message, config, now_str, now_dt):
+    return route_message(message, config, now_str=now_str, now_dt=now_dt)
+
+
+def check_branches(corpus, config, now_str, now_dt, fake):
+    """確認語料標記的分流與實際是否一致（以是否呼叫 GPT 替身判斷）。"""
+    mismatches = []
+    for branch, message in corpus:
+        before = fake.calls
+        _route(message, config, now_str, now_dt)
+        called = fake.calls > before
+        if called != (branch == "gpt"):
+            mismatches.append((branch, message))
+    return mismatches
+
+
+def measure_cold(corpus, config, now_str, now_dt):
+    """清空 data_store 後跑一輪，回傳各分流第一輪總耗時（毫秒）。"""
+    data_store.clear()
+    cold = {b: 0.0 for b in BRANCHES}
+    for branch, message in corpus:
+        t0 = time.perf_counter_ns()
+        _route(message, config, now_str, now_dt)
+        cold[branch] += (time.perf_counter_ns() - t0) / 1e6
+    return cold
+
+
+def measure_latency(corpus, config, now_str, now_dt, iterations):
+    samples = {b: [] for b in BRANCHES}
+    wall = {b: 0.0 for b in BRANCHES}
+    for _ in range(iterations):
+        for branch, message in corpus:
+            t0 = time.perf_counter_ns()
+            _route(message, config, now_str, now_dt)
+            elapsed = time.perf_counter_ns() - t0
+            samples[branch].append(elapsed / 1e6)
+            wall[branch] += elapsed / 1e9
+    return samples, wall
+
+
+def measure_allocations(corpus, config, now_str, now_dt, iterations):
+    """每次呼叫的峰值配置（KiB）與整段執行後仍保留的位元組。"""
+    peaks = {b: [] for b in BRANCHES}
+    retained = {b: 0 for b in BRANCHES}
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            for branch, message in corpus:
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                _route(message, config, now_str, now_dt)
+                after, peak = tracemalloc.get_traced_memory()
+                peaks[branch].append((peak - before) / 1024)
+                retained[branch] += after - before
+    finally:
+        tracemalloc.stop()
+    return peaks, retained
+
+
+def run(args):
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        sys.exit(f"語料為空：{args.corpus}")
+    now_dt = datetime.strptime(args.now, "%Y-%m-%d %H:%M").replace(tzinfo=TW_TZ)
+    now_str = now_dt.strftime("%Y年%m月%d日 %H:%M")
+    config = BenchConfig()
+    fake = FakeOpenAI(args.gpt_latency_ms / 1000)
+    openai_client.install_client(fake)
+    try:
+        cold = measure_cold(corpus, config, now_str, now_dt)
+        mismatches = check_branches(corpus, config, now_str, now_dt, fake.chat.completions)
+        samples, wall = measure_latency(corpus, config, now_str, now_dt, args.iterations)
+        peaks, retained = measure_allocations(corpus, config, now_str, now_dt, args.alloc_iterations)
+    finally:
+        openai_client.install_client(None)
+
+    results = {}
+    for branch in BRANCHES:
+        lat = sorted(samples[branch])
+        if not lat:
+            continue
+        calls = len(lat)
+        alloc_calls = len(peaks[branch]) or 1
+        results[branch] = {
+            "calls": calls,
+            "cold_ms": round(cold[branch], 3),
+            "p50_ms": round(percentile(lat, 50), 4),
+            "p95_ms": round(percentile(lat, 95), 4),
+            "p99_ms": round(percentile(lat, 99), 4),
+            "mean_ms": round(sum(lat) / calls, 4),
+            "throughput_per_s": round(calls / wall[branch], 1) if wall[branch] else 0.0,
+            "peak_kib_per_call": round(sum(peaks[branch]) / alloc_calls, 2),
+            "retained_bytes_per_call": round(retained[branch] / alloc_calls, 1),
+        }
+    return {
+        "meta": {
+            "now": args.now,
+            "iterations": args.iterations,
+            "alloc_iterations": args.alloc_iterations,
+            "gpt_latency_ms": args.gpt_latency_ms,
+            "messages": len(corpus),
+            "python": sys.version.split()[0],
+        },
+        "branches": results,
+        "mismatches": [{"branch": b, "message": m} for b, m in mismatches],
+    }
+
+
+# ── 輸出與基準比較 ─────────────────────────────────────────────
+
+_COLUMNS = [
+    ("calls", "calls", "{:>7}"),
+    ("cold_ms", "cold ms", "{:>9.2f}"),
+    ("p50_ms", "p50 ms", "{:>9.3f}"),
+    ("p95_ms", "p95 ms", "{:>9.3f}"),
+    ("p99_ms", "p99 ms", "{:>9.3f}"),
+    ("throughput_per_s", "req/s", "{:>10.1f}"),
+    ("peak_kib_per_call", "peak KiB", "{:>9.1f}"),
+    ("retained_bytes_per_call", "kept B", "{:>8.0f}"),
+]
+# 與基準比較的指標（數值越大越差）
+_COMPARED = ("cold_ms", "p50_ms", "p95_ms", "p99_ms", "peak_kib_per_call")
+
+
+def print_report(report):
+    header = f"{'branch':<8}" + "".join(f"{title:>{len(fmt.format(0))}}" for _, title, fmt in _COLUMNS)
+    print(header)
+    print("-" * len(header))
+    for branch, row in report["branches"].items():
+        print(f"{branch:<8}" + "".join(fmt.format(row[key]) for key, _, fmt in _COLUMNS))
+    if report["mismatches"]:
+        print("\n⚠️  語料分流標記與實際不符：")
+        for m in report["mismatches"]:
+            print(f"  [{m['branch']}] {m['message']}")
+
+
+def compare(report, baseline, tolerance, min_delta_ms, min_delta_cold_ms):
+    """回傳退化清單 [(branch, metric, baseline, current), ...]。"""
+    regressions = []
+    for branch, row in report["branches"].items():
+        base = baseline.get("branches", {}).get(branch)
+        if not base:
+            continue
+        for key in _COMPARED:
+            old, new = base.get(key), row.get(key)
+            if old is None or new is None:
+                continue
+            # 毫秒指標需同時超過絕對門檻，避免微秒級抖動誤報；
+            # 冷啟動只跑一輪，且共用資料由哪個分流先載入會影響歸屬，門檻放寬
+            if key == "cold_ms":
+                floor = min_delta_cold_ms
+            else:
+                floor = min_delta_ms if key.endswith("_ms") else 0.0
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append((branch, key, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="route_message 各分流效能基準")
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "scripts", "bench_corpus.csv"))
+    parser.add_argument("--now", default="2026-02-16 10:00", help="模擬的台灣時間（課表月份內）")
+    parser.add_argument("--iterations", type=int, default=200, help="延遲量測輪數")
+    parser.add_argument("--alloc-iterations", type=int, default=5, help="記憶體量測輪數")
+    parser.add_argument("--gpt-latency-ms", type=float, default=0.0, help="替身模擬的生成延遲")
+    parser.add_argument("--json", dest="json_out", help="完整結果寫入 JSON")
+    parser.add_argument("--save-baseline", help="把本次結果存成基準")
+    parser.add_argument("--baseline", help="與基準比較，退化時 exit 1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允許的退化比例")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="毫秒指標的最小退化量")
+    parser.add_argument("--min-delta-cold-ms", type=float, default=10.0, help="冷啟動的最小退化量")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    report = run(args)
+    print_report(report)
+
+    for path in (args.json_out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        print(f"\n💾 基準已存至 {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms, args.min_delta_cold_ms)
+        if regressions:
+            print(f"\n❌ 相對基準退化（容許 {args.tolerance:.0%}）：")
+            for branch, key, old, new in regressions:
+                print(f"  {branch:<8} {key:<18} {old} → {new}")
+            sys.exit(1)
+        print(f"\n✅ 未超過基準容許範圍（{args.tolerance:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+把訓練好的意圖分類模型（transformers 格式）匯出成 ONNX，並做動態 int8 量化，
+供 services/intent_classifier.py 以 onnxruntime 在 CPU 推論。
+
+輸出（寫回同一個模型目錄，或 --output）：
+    model.onnx        — fp32
+    model.quant.onnx  — 動態 int8 量化（分類器優先載入）
+    tokenizer.json    — fast tokenizer（推論時免載入 transformers）
+
+用法：
+    python scripts/export_intent_model.py                       # 使用 BERT_MODEL_PATH
+    python scripts/export_intent_model.py --model models/intent_classifier --no-quantize
+需要：torch、transformers、onnxruntime
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config.settings import Config  # noqa: E402
+
+SAMPLES = ["我想參加環境教育課程", "有什麼活動", "門票多少錢"]
+
+
+def export(model_path, output, max_length, opset):
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path)
+    model.eval()
+    os.makedirs(output, exist_ok=True)
+    tokenizer.save_pretrained(output)
+
+    dummy = tokenizer(SAMPLES, padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+    names = list(dummy.keys())
+    onnx_path = os.path.join(output, "model.onnx")
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic["logits"] = {0: "batch"}
+    with torch.inference_mode():
+        torch.onnx.export(
+            model, tuple(dummy[n] for n in names), onnx_path,
+            input_names=names, output_names=["logits"],
+            dynamic_axes=dynamic, opset_version=opset,
+        )
+        reference = model(**dummy).logits.numpy()
+    return onnx_path, reference, {k: v.numpy() for k, v in dummy.items()}
+
+
+def quantize(onnx_path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quant_path = onnx_path.replace("model.onnx", "model.quant.onnx")
+    quantize_dynamic(onnx_path, quant_path, weight_type=QuantType.QInt8)
+    return quant_path
+
+
+def check(path, features, reference, iterations=20):
+    """與 torch 輸出比較：argmax 一致率、最大誤差與單批延遲。"""
+    import onnxruntime as ort
+    session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+    feed = {i.name: features[i.name].astype(np.int64) for i in session.get_inputs()}
+    logits = session.run(None, feed)[0]
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        session.run(None, feed)
+    ms = (time.perf_counter() - t0) / iterations * 1000
+    agree = float((logits.argmax(1) == reference.argmax(1)).mean())
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    print(f"  {os.path.basename(path):<18} {size_mb:7.1f} MB  argmax 一致 {agree:.0%}  "
+          f"max |Δ| {np.abs(logits - reference).max():.4f}  {ms:.1f} ms/批（{len(reference)} 句）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="匯出意圖分類模型為 ONNX（含 int8 量化）")
+    parser.add_argument("--model", default=Config.BERT_MODEL_PATH, help="transformers 模型目錄")
+    parser.add_argument("--output", help="輸出目錄（預設同 --model）")
+    parser.add_argument("--max-length", type=int, default=Config.BERT_MAX_LENGTH)
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--no-quantize", action="store_true", help="只輸出 fp32 model.onnx")
+    args = parser.parse_args()
+
+    output = args.output or args.model
+    onnx_path, reference, features = export(args.model, output, args.max_length, args.opset)
+    print(f"✅ 已匯出 {onnx_path}")
+    paths = [onnx_path]
+    if not args.no_quantize:
+        paths.append(quantize(onnx_path))
+        print(f"✅ 已量化 {paths[-1]}")
+    for path in paths:
+        check(path, features, reference)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本機 OpenAI 相容 stub：只實作 POST /v1/chat/completions 與 GET /v1/models（啟動預熱用），不需網路與金鑰。
+
+用法：
+    python scripts/openai_stub_server.py --port 8089 --delay 0.3 --fail-rate 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stub python app.py
+
+--delay        每次回應前等待秒數（模擬生成時間）
+--fail-rate    以此機率回 503（測試重試）
+--chunk-delay  stream=true 時每段內容之間的秒數（模擬逐 token 生成）
+--repeat       回覆內容重複次數（模擬長篇課程列表，測試提前中止）
+"""
+
+import json
+import time
+import itertools
+import random
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_REPLY = "[興趣度: maybe_interest]\n這是本機 stub 的回覆：{question}"
+
+
+STREAM_CHUNK_CHARS = 8
+
+
+def build_content(body, repeat=1):
+    messages = body.get("messages") or []
+    question = messages[-1]["content"] if messages else ""
+    content = STUB_REPLY.format(question=question[:50])
+    return content + "".join(f"\n第 {i + 2} 段：{question[:50]}" for i in range(repeat - 1))
+
+
+def build_completion(body, repeat=1):
+    """依請求內容組出 chat.completion 回應 dict。"""
+    messages = body.get("messages") or []
+    content = build_content(body, repeat)
+    prompt_chars = sum(len(m.get("content", "")) for m in messages)
+    return {
+        "id": f"chatcmpl-stub-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_chars,
+            "completion_tokens": len(content),
+            "total_tokens": prompt_chars + len(content),
+        },
+    }
+
+
+def stream_chunks(body, repeat=1):
+    """stream=true：依序產生 chat.completion.chunk dict（第一段帶 role，最後一段帶 finish_reason）。"""
+    content = build_content(body, repeat)
+    base = {
+        "id": f"chatcmpl-stub-{int(time.time() * 1000)}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+    }
+    yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+    for start in range(0, len(content), STREAM_CHUNK_CHARS):
+        piece = content[start:start + STREAM_CHUNK_CHARS]
+        yield {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive，才能觀察連線池是否重用
+    delay = 0.0
+    fail_rate = 0.0
+    chunk_delay = 0.0
+    repeat = 1
+
+    def do_GET(self):
+        if not self.path.endswith("/models"):
+            return self._send(404, {"error": {"message": "not found"}})
+        self._send(200, {"object": "list", "data": [{"id": "stub", "object": "model", "created": 0, "owned_by": "stub"}]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": "not found"}})
+        if random.random() < self.fail_rate:
+            return self._send(503, {"error": {"message": "stub unavailable"}})
+        if self.delay:
+            time.sleep(self.delay)
+        if body.get("stream"):
+            return self._send_stream(body)
+        self._send(200, build_completion(body, self.repeat))
+
+    def _send_stream(self, body):
+        """Server-sent events；用戶端提前關閉連線時停止輸出。"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = itertools.chain(
+            (f"data: {json.dumps(c, ensure_ascii=False)}\n\n" for c in stream_chunks(body, self.repeat)),
+            ["data: [DONE]\n\n"],
+        )
+        try:
+            for event in events:
+                data = event.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+                if self.chunk_delay:
+                    time.sleep(self.chunk_delay)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 相容 stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    StubHandler.fail_rate = args.fail_rate
+    StubHandler.chunk_delay = args.chunk_delay
+    StubHandler.repeat = max(1, args.repeat)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"🧪 OpenAI stub 啟動於 http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+量測冷啟動：在全新的行程中 import app（與 gunicorn worker 相同的路徑）並執行預熱，
+印出各階段耗時與 self 時間最長的模組 import（等同 STARTUP_PROFILE=True 時寫入 log 的內容）。
+
+用法：
+    python scripts/profile_startup.py
+    python scripts/profile_startup.py --top 30
+    python scripts/profile_startup.py --module services.query_router   # 只量測指定模組（不需 LINE SDK）
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷啟動量測（import + 預熱）")
+    parser.add_argument("--module", default="app", help="要 import 的進入點模組")
+    parser.add_argument("--top", type=int, default=20, help="列出 self 時間最長的前幾個模組")
+    args = parser.parse_args()
+
+    os.environ["STARTUP_PROFILE"] = "True"
+    started = time.perf_counter()
+    from config.settings import config
+    from utils.startup import startup_profile
+    # app.py 會自行 begin()；其他模組由這裡開始量測
+    if args.module != "app":
+        startup_profile.begin(trace_imports=True)
+    importlib.import_module(args.module)
+    if args.module != "app":
+        startup_profile.mark("imports")
+    imported = time.perf_counter()
+
+    from services.warmup import status, warm_up
+    warm_up(config)
+    done = time.perf_counter()
+
+    print(startup_profile.report(args.top))
+    print(f"\nimport {args.module}：{(imported - started) * 1000:.0f} ms；"
+          f"預熱：{(done - imported) * 1000:.0f} ms；預熱錯誤：{status()['errors'] or '無'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+訓練查詢分流分類器（字元 n-gram TF-IDF + LogisticRegression），輸出純 Python 推論用的 JSON。
+
+- 訓練資料：text,label CSV（training_data/route_seed.csv，標籤見 services/route_classifier.ROUTES）
+- 分層 k-fold 交叉驗證：印出準確率，以及各信心門檻下「非 open_ended 判定」的精確率與涵蓋率，
+  供設定 ROUTE_CLASSIFIER_THRESHOLD
+- 匯出前確認 JSON 推論與 sklearn predict_proba 一致
+
+用法：
+    python scripts/train_route_classifier.py
+    python scripts/train_route_classifier.py --data my.csv --output data/route_classifier.json --C 20
+需要：scikit-learn
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+from collections import Counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.route_classifier import ROUTES, RouteClassifier, char_ngrams  # noqa: E402
+
+THRESHOLDS = (0.3, 0.4, 0.5, 0.6, 0.7, 0.8)
+
+
+def load_rows(path):
+    texts, labels = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            text = (row.get("text") or "").strip()
+            label = (row.get("label") or "").strip()
+            if not text:
+                continue
+            if label not in ROUTES:
+                sys.exit(f"未知的標籤 {label!r}（{text}）")
+            texts.append(text)
+            labels.append(label)
+    return texts, labels
+
+
+def build_pipeline(n_max, C):
+    from sklearn.pipeline import make_pipeline
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(
+        analyzer=lambda text: char_ngrams(text, 1, n_max),
+        sublinear_tf=True,
+    )
+    return make_pipeline(vectorizer, LogisticRegression(C=C, max_iter=2000))
+
+
+def cross_validate(texts, labels, n_max, C, folds):
+    """回傳 (準確率, {門檻: (精確率, 涵蓋率)})；涵蓋率 = 非 open_ended 訊息中被判定接手的比例。"""
+    from sklearn.model_selection import StratifiedKFold
+    y = np.array(labels)
+    predicted = np.empty(len(texts), dtype=object)
+    confidence = np.zeros(len(texts))
+    for train, test in StratifiedKFold(folds, shuffle=True, random_state=0).split(texts, y):
+        model = build_pipeline(n_max, C).fit([texts[i] for i in train], y[train])
+        probs = model.predict_proba([texts[i] for i in test])
+        predicted[test] = model.classes_[probs.argmax(1)]
+        confidence[test] = probs.max(1)
+    accuracy = float((predicted == y).mean())
+    table = {}
+    routed_truth = y != "open_ended"
+    for t in THRESHOLDS:
+        taken = (confidence >= t) & (predicted != "open_ended")
+        precision = float((predicted[taken] == y[taken]).mean()) if taken.any() else 1.0
+        coverage = float((taken & routed_truth).sum() / max(1, routed_truth.sum()))
+        table[t] = (precision, coverage)
+    return accuracy, table
+
+
+def export(model, n_max):
+    """sklearn pipeline → JSON dict（n-gram → [idf, 各類別權重...]）。"""
+    vectorizer, clf = model.steps[0][1], model.steps[1][1]
+    idf = vectorizer.idf_
+    coef = clf.coef_
+    features = {}
+    for gram, col in vectorizer.vocabulary_.items():
+        features[gram] = [round(float(idf[col]), 5)] + [round(float(w), 5) for w in coef[:, col]]
+    return {
+        "labels": [str(c) for c in clf.classes_],
+        "ngram_range": [1, n_max],
+        "bias": [round(float(b), 5) for b in clf.intercept_],
+        "features": features,
+    }
+
+
+def check_export(model, exported, texts):
+    """JSON 推論與 sklearn 的 argmax / 機率是否一致。"""
+    scorer = RouteClassifier.from_dict(exported)
+    probs = model.predict_proba(texts)
+    classes = list(model.classes_)
+    worst = 0.0
+    for text, row in zip(texts, probs):
+        label, p = scorer.predict(text)
+        if label != classes[int(row.argmax())]:
+            sys.exit(f"匯出後分類不一致：{text}")
+        worst = max(worst, abs(p - float(row.max())))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="訓練查詢分流分類器")
+    parser.add_argument("--data", default=os.path.join(ROOT, "training_data", "route_seed.csv"))
+    parser.add_argument("--output", default=os.path.join(ROOT, "data", "route_classifier.json"))
+    parser.add_argument("--ngram-max", type=int, default=2)
+    parser.add_argument("--C", type=float, default=20.0, help="LogisticRegression 正則化強度的倒數")
+    parser.add_argument("--folds", type=int, default=5)
+    args = parser.parse_args()
+
+    texts, labels = load_rows(args.data)
+    print(f"訓練資料：{len(texts)} 筆 {dict(Counter(labels))}")
+
+    accuracy, table = cross_validate(texts, labels, args.ngram_max, args.C, args.folds)
+    print(f"\n{args.folds}-fold 準確率：{accuracy:.1%}")
+    print("門檻   精確率   涵蓋率（非 open_ended 判定）")
+    for t, (precision, coverage) in table.items():
+        print(f"{t:>4.1f}  {precision:>7.1%}  {coverage:>7.1%}")
+
+    model = build_pipeline(args.ngram_max, args.C).fit(texts, labels)
+    exported = export(model, args.ngram_max)
+    worst = check_export(model, exported, texts)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(exported, f, ensure_ascii=False, separators=(",", ":"))
+    size_kib = os.path.getsize(args.output) / 1024
+    print(f"\n💾 {args.output}（{len(exported['features'])} 個 n-gram，{size_kib:.0f} KiB，"
+          f"與 sklearn 機率最大差 {worst:.4f}）")
+
+
+if __name__ == "__main__":
+    main()
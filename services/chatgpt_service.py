@@ -6,14 +6,38 @@ ChatGPT 服務：讀取 data 當 context、呼叫 OpenAI、解析興趣度
 
 import os
 import re
-import csv
+import time
 from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
 
+from services.circuit_breaker import get_circuit_breaker
+from services.course_catalog import get_course_catalog, load_catalog
+from services.course_model import weekday_mask
+from services.data_store import data_store, parse_csv_rows, parse_text
+from services.openai_client import chat_completion, stream_chat_completion
+from services.prompt_budget import (
+    PRIORITY_ATTACHMENT, PRIORITY_CONTEXT, PRIORITY_DETAIL, PRIORITY_SUMMARY,
+    Section, fit_sections, record_sections, total_tokens,
+)
+from services.prompt_context import load_context_index, render_chunks
+from services.query_parser import parse_dates, parse_query
+from services.reply_cache import get_reply_cache, make_cache_key
+from services.single_flight import get_single_flight
+from utils.metrics import registry
+from utils.tokens import approx_tokens
+
 # 專案根目錄（依此找 data/）
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 TW_TZ = timezone(timedelta(hours=8))
 WEEKDAY_ZH = ["週一", "週二", "週三", "週四", "週五", "週六", "週日"]
+# LINE 文字訊息上限 5000 字，保留截斷說明的空間
+REPLY_MAX_CHARS = 4500
+# 延遲預算剩不到這麼多秒就不呼叫 OpenAI，直接本地回覆
+_MIN_CALL_SECONDS = 1.0
+
+GPT_FALLBACKS = registry.counter(
+    "zoo_gpt_fallback_total", "以本地回覆取代 GPT 的次數（circuit_open / budget / timeout / error）", ("reason",),
+)
 
 
 def _path(name):
@@ -23,232 +47,131 @@ def _path(name):
 
 def detect_query_weekday(message, now=None):
     """
-    從使用者訊息偵測詢問的目標星期。
+    從使用者訊息偵測詢問的目標星期（相對日期 → 週X / 星期X → 由 2/26 等日期推算）。
     回傳中文星期字串（如「週四」）或 None（未指定特定日期）。
+    同一則訊息需要多項解析結果時改用 query_parser.parse_query。
     """
     if now is None:
         now = datetime.now(TW_TZ)
-    wd = now.weekday()  # 0=週一 … 6=週日
-
-    # 相對日期
-    relative = {
-        "今天": wd, "今日": wd,
-        "昨天": (wd - 1) % 7, "昨日": (wd - 1) % 7,
-        "明天": (wd + 1) % 7, "明日": (wd + 1) % 7,
-        "後天": (wd + 2) % 7,
-        "前天": (wd - 2) % 7,
-    }
-    for kw, idx in relative.items():
-        if kw in message:
-            return WEEKDAY_ZH[idx]
-
-    # 明確星期（週X / 星期X）
-    for i, zh in enumerate(WEEKDAY_ZH):
-        alt = zh.replace("週", "星期")
-        if zh in message or alt in message:
-            return zh
-
-    # 具體日期（如 2/26、2月26日、26號）→ 計算星期
-    m = re.search(r'(\d{1,2})[月/](\d{1,2})[日號]?', message)
-    if m:
-        try:
-            month, day = int(m.group(1)), int(m.group(2))
-            year = now.year
-            target = datetime(year, month, day, tzinfo=TW_TZ)
-            return WEEKDAY_ZH[target.weekday()]
-        except ValueError:
-            pass
+    return parse_dates(message, now)[1]
 
-    return None
+
+def detect_query_date(message, now=None):
+    """
+    從使用者訊息偵測詢問的特定日期（相對日期或 2/18、2月18日）。
+    回傳 date 或 None（純星期查詢、未指定日期）。
+    """
+    if now is None:
+        now = datetime.now(TW_TZ)
+    return parse_dates(message, now)[0]
 
 
+def date_label(d):
+    """date → 「2月18日（週三）」"""
+    return f"{d.month}月{d.day}日（{WEEKDAY_ZH[d.weekday()]}）"
+
+
+# ── 星期比對 ─────────────────────────────────────────────────────
+
 def matches_weekday(weekday_field, target):
     """
     判斷課程 CSV 的 weekday 欄位是否涵蓋 target（如「週四」）。
-    支援格式：每週X、第N個週X、每週X至週Y、每週X、週Y（逗號/頓號列舉）
+    支援格式同 weekday_mask。
     """
     if not weekday_field or not target:
         return False
-    if target in weekday_field:
-        return True
-    # 範圍：每週二至週六
-    m = re.search(r'週([一二三四五六日])至週([一二三四五六日])', weekday_field)
-    if m:
-        try:
-            start = WEEKDAY_ZH.index("週" + m.group(1))
-            end = WEEKDAY_ZH.index("週" + m.group(2))
-            target_idx = WEEKDAY_ZH.index(target) if target in WEEKDAY_ZH else -1
-            if 0 <= start <= target_idx <= end:
-                return True
-        except ValueError:
-            pass
-    return False
+    if target not in WEEKDAY_ZH:
+        return target in weekday_field
+    return bool(weekday_mask(weekday_field) & (1 << WEEKDAY_ZH.index(target)))
+
+
+# ── 課程查詢（課程目錄，見 course_catalog） ──────────────────────
+
+def current_course_catalog(config):
+    """目前的課程目錄快照；讀取失敗回傳 None（各 loader 會回覆讀取失敗訊息）。"""
+    import logging
+    try:
+        return get_course_catalog(config)
+    except Exception as e:
+        logging.error(f"課程目錄載入失敗: {e}")
+        return None
 
 
-def load_courses_for_weekday(csv_path, target_weekday):
+def load_courses_for_weekday(source, target_weekday, month=None):
     """
-    從整份 CSV 篩選包含 target_weekday 的課程，
-    回傳 (summary_text, detail_text)：
+    查詢包含 target_weekday 的課程（預先建好的星期索引），回傳 (summary_text, detail_text)：
       summary_text：一行一類別的簡短總覽
       detail_text：已格式化的詳細課程區塊，可直接給 GPT 輸出
+    source：CourseCatalog 或課程 CSV 路徑；month=(年, 月) 時只列該月實際有開的課程。
     """
     import logging
-    # 分類收集：{cat: [(topic, weekday, time, location, cert, hours), ...]}
-    buckets = OrderedDict()
-    row_count = 0
-    match_count = 0
     try:
-        with open(csv_path, "r", encoding="utf-8") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                row_count += 1
-                cat = row.get("category", "").strip()
-                topic = row.get("topic", "").strip()
-                if not cat or not topic or cat.startswith("D_"):
-                    continue
-                weekday_val = row.get("weekday", "").strip()
-                matched = matches_weekday(weekday_val, target_weekday)
-                if matched:
-                    match_count += 1
-                if not matched:
-                    continue
-                entry = (
-                    topic,
-                    weekday_val,
-                    row.get("time", "").strip(),
-                    row.get("location", "").strip(),
-                    row.get("cert", "").strip(),
-                    row.get("env_hours", "").strip(),
-                )
-                if cat not in buckets:
-                    buckets[cat] = []
-                buckets[cat].append(entry)
+        catalog = load_catalog(source)
     except Exception as e:
         logging.error(f"load_courses_for_weekday 讀檔失敗: {e}")
         return f"(讀取失敗: {e})", ""
 
-    logging.info(f"[filter] target={target_weekday} rows={row_count} matches={match_count} buckets={list(buckets.keys())}")
-
-    if not buckets:
+    day = catalog.weekday(target_weekday, month)
+    if not day or not day["buckets"]:
         return f"（{target_weekday} 無課程資料）", ""
 
-    # 摘要
-    summary_lines = []
-    for cat, entries in buckets.items():
-        seen_topics = list(dict.fromkeys(t for t, *_ in entries))
-        if cat == "定時定點課程":
-            no_cert = [t for t, *r in entries if r[3] != "是"]
-            with_cert = [t for t, *r in entries if r[3] == "是"]
-            no_cert_unique = list(dict.fromkeys(no_cert))
-            with_cert_unique = list(dict.fromkeys(with_cert))
-            if no_cert_unique:
-                summary_lines.append(f"定時定點課程：{'、'.join(no_cert_unique)}")
-            if with_cert_unique:
-                summary_lines.append(f"有環境教育時數之定時定點課程：{'、'.join(with_cert_unique)}")
-        else:
-            summary_lines.append(f"{cat}：{'、'.join(seen_topics)}")
+    logging.info(f"[filter] target={target_weekday} matches={day['count']} buckets={list(day['buckets'].keys())}")
+    return day["summary"], day["detail"]
 
-    # 詳細
-    detail_lines = []
-    for cat, entries in buckets.items():
-        for topic, weekday, time_, location, cert, hours in entries:
-            header = "【有環境教育時數之定時定點課程】" if (cat == "定時定點課程" and cert == "是") else f"【{cat}】"
-            block = [header, f"主題：{topic}", f"星期：{weekday}", f"時間：{time_}", f"地點：{location}"]
-            if cert == "是" and hours:
-                block.append(f"時數：{hours}")
-            detail_lines.append("\n".join(block))
 
-    has_cert = any(cert == "是" for entries in buckets.values() for _, _, _, _, cert, _ in entries)
-    if has_cert:
-        detail_lines.append("如有需要環境教育時數，可考慮以上有標註時數的課程，歡迎進一步詢問。")
+def load_courses_for_date(source, target_date):
+    """
+    查詢 target_date 當天實際開課的課程（日期索引 O(1) 查表；已套用起訖日期、
+    第 N 個週X 與 closed_dates），回傳 (summary_text, detail_text)。
+    當天沒有課程或不在課表月份內時，summary 為「（…）」開頭的說明、detail 為空字串。
+    """
+    import logging
+    try:
+        catalog = load_catalog(source)
+    except Exception as e:
+        logging.error(f"load_courses_for_date 讀檔失敗: {e}")
+        return f"(讀取失敗: {e})", ""
 
-    return "\n".join(summary_lines), "\n\n".join(detail_lines)
+    label = date_label(target_date)
+    if not catalog.covers(target_date):
+        return f"（{label}不在課表日期範圍內）", ""
+    day = catalog.day(target_date)
+    if not day:
+        return f"（{label}沒有安排課程）", ""
 
+    logging.info(f"[filter] date={target_date.isoformat()} matches={day['count']} buckets={list(day['buckets'].keys())}")
+    return day["summary"], day["detail"]
 
-def load_courses_overview(csv_path):
+
+def load_courses_overview(source):
     """
-    從整份 CSV 抽取所有唯一 (類別, 主題, 認證) 組合，
-    產生已格式化的課程總覽文字，定時定點課程按有無認證分組。
+    所有唯一 (類別, 主題, 認證) 組合的課程總覽文字，定時定點課程按有無認證分組。
+    source：CourseCatalog 或課程 CSV 路徑（總覽隨目錄一起預先組好）。
     """
-    cat_topics = OrderedDict()
-    seen = set()
     try:
-        with open(csv_path, "r", encoding="utf-8") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                cat = row.get("category", "").strip()
-                topic = row.get("topic", "").strip()
-                cert = row.get("cert", "").strip()
-                if not cat or not topic or cat.startswith("D_"):
-                    continue
-                key = (cat, topic)
-                if key not in seen:
-                    seen.add(key)
-                    if cat not in cat_topics:
-                        cat_topics[cat] = []
-                    cat_topics[cat].append((topic, cert))
-
-        lines = ["【課程總覽（所有類別與主題）】"]
-        for cat, items in cat_topics.items():
-            if cat == "定時定點課程":
-                no_cert = [t for t, c in items if c != "是"]
-                with_cert = [t for t, c in items if c == "是"]
-                if no_cert:
-                    lines.append("")
-                    lines.append("定時定點課程：")
-                    for i, t in enumerate(no_cert, 1):
-                        lines.append(f"{i}.{t}")
-                if with_cert:
-                    lines.append("")
-                    lines.append("有環境教育時數之定時定點課程：")
-                    for i, t in enumerate(with_cert, 1):
-                        lines.append(f"{i}.{t}")
-            else:
-                topics = [t for t, c in items]
-                lines.append("")
-                if len(topics) == 1:
-                    lines.append(f"{cat}：{topics[0]}")
-                else:
-                    lines.append(f"{cat}：")
-                    for i, t in enumerate(topics, 1):
-                        lines.append(f"{i}.{t}")
-
-        lines.append("")
-        lines.append("請告訴我您對以上課程有興趣的部分，我可以提供更詳細的資訊。")
-        return "\n".join(lines)
+        return load_catalog(source).overview
     except Exception as e:
         return f"(讀取課程總覽失敗: {e})"
 
 
-def load_courses_context(csv_path):
+def load_courses_context(source):
     """
-    從整份 CSV，以唯一 (類別, 主題) 為單位，
+    以唯一 (類別, 主題) 為單位，
     整合該主題的所有時間表，產生緊湊的詳細資料供 GPT 查詢用。
     """
     groups = OrderedDict()
     try:
-        with open(csv_path, "r", encoding="utf-8") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                cat = row.get("category", "").strip()
-                topic = row.get("topic", "").strip()
-                if not cat or not topic or cat.startswith("D_"):
-                    continue
-                key = (cat, topic)
-                cert = row.get("cert", "").strip()
-                env_hours = row.get("env_hours", "").strip()
-                weekday = row.get("weekday", "").strip()
-                time_ = row.get("time", "").strip()
-                location = row.get("location", "").strip()
-                schedule = f"{weekday} {time_} 地點:{location}"
-                if key not in groups:
-                    groups[key] = {
-                        "cat": cat, "topic": topic,
-                        "cert": cert, "env_hours": env_hours,
-                        "schedules": []
-                    }
-                if schedule not in groups[key]["schedules"]:
-                    groups[key]["schedules"].append(schedule)
+        for c in load_catalog(source).courses:
+            key = (c.category, c.topic)
+            schedule = f"{c.weekday} {c.time} 地點:{c.location}"
+            if key not in groups:
+                groups[key] = {
+                    "cat": c.category, "topic": c.topic,
+                    "cert": c.cert, "env_hours": c.env_hours,
+                    "schedules": []
+                }
+            if schedule not in groups[key]["schedules"]:
+                groups[key]["schedules"].append(schedule)
 
         out = []
         for key, d in groups.items():
@@ -261,20 +184,23 @@ def load_courses_context(csv_path):
         return f"(讀取課程失敗: {e})"
 
 
+def _build_zoo_areas_context(csv_path):
+    """load_zoo_areas_context 的實際組裝（data_store parser）。"""
+    out = []
+    for row in data_store.load(csv_path, parse_csv_rows):
+        name = row.get("name", "").strip()
+        if not name or name.startswith("E_"):
+            continue
+        cat = row.get("category", "")
+        url = row.get("url", "")
+        out.append(f"{name}（{cat}）" + (f" {url}" if url else ""))
+    return "\n".join(out) if out else "(無館區資料)"
+
+
 def load_zoo_areas_context(csv_path):
     """讀取館區 CSV，組成簡短 context。"""
-    out = []
     try:
-        with open(csv_path, "r", encoding="utf-8") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                name = row.get("name", "").strip()
-                if not name or name.startswith("E_"):
-                    continue
-                cat = row.get("category", "")
-                url = row.get("url", "")
-                out.append(f"{name}（{cat}）" + (f" {url}" if url else ""))
-        return "\n".join(out) if out else "(無館區資料)"
+        return data_store.load(csv_path, _build_zoo_areas_context)
     except Exception as e:
         return f"(讀取館區失敗: {e})"
 
@@ -282,8 +208,7 @@ def load_zoo_areas_context(csv_path):
 def load_env_edu_notes(txt_path):
     """讀取環教時數說明。"""
     try:
-        with open(txt_path, "r", encoding="utf-8") as f:
-            return f.read().strip()
+        return data_store.load(txt_path, parse_text)
     except Exception as e:
         return f"(讀取環教說明失敗: {e})"
 
@@ -291,51 +216,32 @@ def load_env_edu_notes(txt_path):
 def load_visitor_info(txt_path):
     """讀取參觀資訊（票價、開放時間、交通、遊園須知、建議行程等）。"""
     try:
-        with open(txt_path, "r", encoding="utf-8") as f:
-            return f.read().strip()
+        return data_store.load(txt_path, parse_text)
     except Exception as e:
         return f"(讀取參觀資訊失敗: {e})"
 
 
-def build_system_prompt(courses_overview, courses_text, areas_text, env_notes_text,
-                        now_str="", day_summary="", day_detail="", target_weekday="",
-                        visitor_info_text=""):
-    """組裝給 ChatGPT 的 system prompt。"""
-    time_section = f"\n[現在時間]\n{now_str}\n" if now_str else ""
-
-    # 當天課程已由 Python 預先篩選，直接放進 prompt
-    if day_detail:
-        day_section = f"""
-[已篩選課程：{target_weekday}]
-以下是 {target_weekday} 的課程，已完整篩選，直接照格式輸出即可：
-
-摘要：
-{day_summary}
-
-詳細：
-{day_detail}
-"""
-    elif target_weekday:
-        # 預篩選失敗或無課程，仍把目標星期告知 GPT，讓 GPT 從課程詳細資料自行篩選
-        day_section = f"\n[查詢目標] 使用者詢問 {target_weekday} 的課程。\n"
-    else:
-        day_section = ""
-
+def build_static_prompt(courses_overview, areas_text, env_notes_text, visitor_info_text="",
+                        retrieved=False):
+    """
+    system prompt 的固定部分：角色、參考資料、回覆規則。
+    內容只隨資料檔變動，放在最前面讓 OpenAI 的 prompt 前綴快取可以命中。
+    retrieved：其餘參考資料改由檢索放在規則之後（此時只傳課程總覽）。
+    """
+    reference = f"[課程總覽]\n{courses_overview}\n"
+    if areas_text:
+        reference += f"\n[館區資料]\n{areas_text}\n"
+    if env_notes_text:
+        reference += f"\n[環境教育說明]\n{env_notes_text}\n"
+    if retrieved:
+        reference += "\n其餘館區、參觀資訊、環教說明與課程詳細資料，依問題檢索後附在回覆規則之後的 [相關參考資料]。\n"
     visitor_section = f"\n[參觀資訊]\n{visitor_info_text}\n" if visitor_info_text else ""
 
     return f"""你是台北市立動物園的課程小幫手，用友善的繁體中文回覆。
-{time_section}{day_section}
-以下是補充參考資料（僅供查詢，不得原文輸出到回覆中）：
-
-[課程總覽]
-{courses_overview}
 
-[館區資料]
-{areas_text}
+以下是補充參考資料（僅供查詢，不得原文輸出到回覆中）：
 
-[環境教育說明]
-{env_notes_text}
-{visitor_section}
+{reference}{visitor_section}
 
 ---
 回覆規則（務必嚴格遵守）：
@@ -391,6 +297,237 @@ def build_system_prompt(courses_overview, courses_text, areas_text, env_notes_te
    最後若有認證課程，結尾加一行：「如有需要環境教育時數，可考慮以上有標註時數的課程，歡迎進一步詢問。」"""
 
 
+def build_dynamic_prompt(now_str="", day_summary="", day_detail="", target_weekday=""):
+    """system prompt 的每次請求部分：現在時間與已篩選課程，接在固定前綴之後。"""
+    time_section = f"\n[現在時間]\n{now_str}\n" if now_str else ""
+
+    # 當天課程已由 Python 預先篩選，直接放進 prompt
+    if day_detail:
+        day_section = f"""
+[已篩選課程：{target_weekday}]
+以下是 {target_weekday} 的課程，已完整篩選，直接照格式輸出即可：
+
+摘要：
+{day_summary}
+
+詳細：
+{day_detail}
+"""
+    elif target_weekday and day_summary.startswith("（"):
+        # 已確認當天沒有課程（例如 closed_dates），直接告知 GPT
+        day_section = f"\n[查詢目標] 使用者詢問 {target_weekday} 的課程：{day_summary}\n"
+    elif target_weekday:
+        # 預篩選失敗或無課程，仍把目標星期告知 GPT，讓 GPT 從課程詳細資料自行篩選
+        day_section = f"\n[查詢目標] 使用者詢問 {target_weekday} 的課程。\n"
+    else:
+        day_section = ""
+
+    if not time_section and not day_section:
+        return ""
+    return f"\n\n---{time_section}{day_section}"
+
+
+def build_system_prompt(courses_overview, courses_text, areas_text, env_notes_text,
+                        now_str="", day_summary="", day_detail="", target_weekday="",
+                        visitor_info_text=""):
+    """
+    組裝給 ChatGPT 的 system prompt（固定前綴 + 每次請求部分）。
+    courses_text 已不使用（prompt 一向只放課程總覽），保留參數維持既有的位置參數呼叫。
+    """
+    return (build_static_prompt(courses_overview, areas_text, env_notes_text, visitor_info_text)
+            + build_dynamic_prompt(now_str, day_summary, day_detail, target_weekday))
+
+
+# ── Prompt 組裝器 ───────────────────────────────────────────────
+
+def _static_prompt_paths(config):
+    """固定前綴所依賴的資料檔（課程目錄之外，依序：館區、環教說明、參觀資訊）。"""
+    return (
+        _path(getattr(config, "ZOO_AREAS_CSV_PATH", "data/zoo_areas.csv")),
+        _path(getattr(config, "ENV_EDU_NOTES_PATH", "data/環教時數說明.txt")),
+        _path("data/visitor_info.txt"),
+    )
+
+
+def _prompt_data_version(catalog, paths):
+    """固定前綴的資料版本：課程目錄版本 + 其餘資料檔版本。"""
+    course_version = catalog.version if catalog is not None else "none"
+    return f"{course_version}-{data_store.version(paths)}"
+
+
+def _build_static_prompt_for(catalog, paths):
+    areas_path, notes_path, visitor_path = paths
+    return build_static_prompt(
+        load_courses_overview(catalog),
+        load_zoo_areas_context(areas_path),
+        load_env_edu_notes(notes_path),
+        load_visitor_info(visitor_path),
+    )
+
+
+def _retrieval_static_prompt_for(catalog):
+    return build_static_prompt(load_courses_overview(catalog), "", "", "", retrieved=True)
+
+
+def _context_index(catalog, paths):
+    """館區、環教說明、參觀資訊、課程細節的檢索索引（依資料版本重建）。"""
+    areas_path, notes_path, visitor_path = paths
+    return load_context_index(
+        "prompt_context", paths, catalog.version if catalog is not None else "none",
+        lambda: (
+            load_zoo_areas_context(areas_path),
+            load_env_edu_notes(notes_path),
+            load_visitor_info(visitor_path),
+            load_courses_context(catalog) if catalog is not None else "",
+        ),
+    )
+
+
+def build_context_section(config, query, catalog=None, token_budget=None):
+    """
+    檢索模式：與 query 相關的參考資料段落，回傳 (文字, 段數, 估計 token 數)。
+    token_budget 未指定時用 PROMPT_CONTEXT_TOKEN_BUDGET；沒有相關段落時回傳 ("", 0, 0)。
+    """
+    if catalog is None:
+        catalog = current_course_catalog(config)
+    index = _context_index(catalog, _static_prompt_paths(config))
+    if token_budget is None:
+        token_budget = getattr(config, "PROMPT_CONTEXT_TOKEN_BUDGET", 900)
+    chunks = index.select(query, getattr(config, "PROMPT_CONTEXT_TOP_K", 6), token_budget)
+    if not chunks:
+        return "", 0, 0
+    text = f"\n\n---\n[相關參考資料]（僅供查詢，不得原文輸出到回覆中）\n{render_chunks(chunks)}"
+    return text, len(chunks), sum(c.tokens for c in chunks)
+
+
+def _context_mode(config, catalog):
+    """
+    實際使用的參考資料模式（retrieval / full）。
+    full 的固定前綴本身就超過 GPT_INPUT_TOKEN_BUDGET 時改用 retrieval：
+    固定前綴不截短，否則預算只能從當日課程扣，回答問題所需的段落反而被截掉。
+    """
+    mode = getattr(config, "PROMPT_CONTEXT_MODE", "full")
+    budget = int(getattr(config, "GPT_INPUT_TOKEN_BUDGET", 0) or 0)
+    if mode == "retrieval" or not budget:
+        return mode
+    version = (catalog.version if catalog is not None else "none", budget)
+    return data_store.derive(
+        "prompt_context_mode", _static_prompt_paths(config),
+        lambda: _fit_context_mode(config, catalog, budget), version,
+    )
+
+
+def _fit_context_mode(config, catalog, budget):
+    import logging
+    tokens = approx_tokens(_static_prefix(config, catalog, "full"))
+    if tokens <= budget:
+        return "full"
+    logging.warning(
+        f"[prompt_budget] full 模式的固定前綴（≈{tokens} tokens）超過 GPT_INPUT_TOKEN_BUDGET={budget}，"
+        f"改用 retrieval 模式"
+    )
+    return "retrieval"
+
+
+def _static_prefix(config, catalog, mode=None):
+    """目前資料版本的固定前綴（每個版本只組一次）；mode 未指定時依 _context_mode。"""
+    course_version = catalog.version if catalog is not None else "none"
+    if mode is None:
+        mode = _context_mode(config, catalog)
+    if mode == "retrieval":
+        # 前綴只依課程目錄（總覽）；檢索段落接在後面，不影響前綴快取
+        return data_store.derive(
+            "static_prompt_rag", (), lambda: _retrieval_static_prompt_for(catalog), course_version,
+        )
+    # 目錄換版 → 重建並取代舊前綴；其餘檔案由 data_store 依簽章判斷
+    paths = _static_prompt_paths(config)
+    return data_store.derive(
+        "static_prompt", paths, lambda: _build_static_prompt_for(catalog, paths), course_version,
+    )
+
+
+def warm_up(config):
+    """預熱：課程目錄、固定前綴、檢索索引、回覆快取 / single-flight / 斷路器。"""
+    catalog = current_course_catalog(config)
+    mode = _context_mode(config, catalog)
+    _static_prefix(config, catalog, mode)
+    if mode == "retrieval":
+        _context_index(catalog, _static_prompt_paths(config))
+    get_reply_cache(config)
+    get_single_flight(config)
+    get_circuit_breaker(config)
+
+
+def assemble_system_prompt(config, now_str="", day_summary="", day_detail="", target_weekday="",
+                           catalog=None, query="", user_sections=()):
+    """
+    回傳 (system_prompt, stats)。
+    固定前綴每個資料版本只組一次（逐位元組相同），每次請求只附加時間與課程段落。
+    PROMPT_CONTEXT_MODE=retrieval 時前綴只含課程總覽與回覆規則，
+    其餘參考資料依 query 檢索後放在前綴之後；full 則整份放進前綴
+    （full 前綴本身超出輸入預算時改用 retrieval，見 _context_mode）。
+    catalog 未指定時取目前的課程目錄快照。
+
+    輸入預算（GPT_INPUT_TOKEN_BUDGET，0 = 不限）：各段連同 user_sections（使用者訊息與附加資料，
+    prompt_budget.Section）一起估算；檢索段落只取剩餘額度，其餘超出時依優先度截短
+    （user_sections 就地截短，呼叫端依截短後的 text 組 user 訊息）。
+    當日已篩選課程（摘要 + 詳細）至少保留 GPT_DAY_COURSES_MIN_TOKENS。
+
+    stats：prefix_chars / dynamic_chars / total_chars / build_ms / prefix_version /
+           context_chunks / context_tokens / input_tokens / sections（段名 → token）/ trimmed
+    """
+    start = time.perf_counter()
+    if catalog is None:
+        catalog = current_course_catalog(config)
+    version = _prompt_data_version(catalog, _static_prompt_paths(config))
+    mode = _context_mode(config, catalog)
+    retrieval = mode == "retrieval"
+    prefix = _static_prefix(config, catalog, mode)
+
+    # ── 輸入預算 ──
+    budget = int(getattr(config, "GPT_INPUT_TOKEN_BUDGET", 0) or 0)
+    day_floor = int(getattr(config, "GPT_DAY_COURSES_MIN_TOKENS", 0) or 0)
+    summary = Section("day_summary", day_summary, PRIORITY_SUMMARY, floor=day_floor)
+    detail = Section("day_detail", day_detail, PRIORITY_DETAIL, floor=day_floor - summary.tokens)
+    # frame：時間與課程段落的標題文字（只量測）
+    frame = approx_tokens(build_dynamic_prompt(now_str, day_summary, day_detail, target_weekday))
+    sections = [
+        Section("prefix", prefix),
+        Section("frame", "", tokens=max(0, frame - summary.tokens - detail.tokens)),
+        summary, detail, *user_sections,
+    ]
+    context, context_chunks, context_tokens = "", 0, 0
+    if retrieval and query:
+        # 檢索段落優先度最低：只用其餘各段之後剩下的額度
+        context_budget = getattr(config, "PROMPT_CONTEXT_TOKEN_BUDGET", 900)
+        if budget:
+            context_budget = min(context_budget, budget - total_tokens(sections))
+        if context_budget > 0:
+            context, context_chunks, context_tokens = build_context_section(
+                config, query, catalog, context_budget,
+            )
+    context_section = Section("context", context, PRIORITY_CONTEXT)
+    sections.append(context_section)
+    input_tokens = fit_sections(sections, budget)
+    sizes = record_sections(sections, budget)
+
+    dynamic = context_section.text + build_dynamic_prompt(now_str, summary.text, detail.text, target_weekday)
+    prompt = prefix + dynamic
+    stats = {
+        "prefix_chars": len(prefix),
+        "dynamic_chars": len(dynamic),
+        "total_chars": len(prompt),
+        "build_ms": round((time.perf_counter() - start) * 1000, 3),
+        "prefix_version": version,
+        "context_chunks": context_chunks,
+        "context_tokens": context_tokens,
+        "input_tokens": input_tokens,
+        "sections": sizes,
+        "trimmed": [s.name for s in sections if s.trimmed],
+    }
+    return prompt, stats
+
+
 def parse_interest_from_reply(reply):
     """從回覆文字中解析興趣度標籤。"""
     if not reply:
@@ -412,66 +549,224 @@ def strip_interest_line_from_reply(reply):
     return "\n".join(out).strip() or "（無法產生回覆，請再試一次。）"
 
 
-def get_reply_and_interest(user_message, config, now_str=""):
+class _ReplyStreamWatcher:
+    """
+    串流回覆的 should_stop（每次收到新片段）：第一行（興趣度標註）一到齊就解析，
+    扣掉該行後的內容超過 REPLY_MAX_CHARS 即中止生成（超出部分本來就會被截掉）。
+    只累計字數，不重組全文。
+    """
+
+    def __init__(self, limit=REPLY_MAX_CHARS):
+        self.limit = limit
+        self.interest = None
+        self.interest_ms = None
+        self._chars = 0             # 目前收到的總字數
+        self._head = []             # 第一行到齊前收到的片段
+        self._header_chars = None
+        self._started = time.perf_counter()
+
+    def __call__(self, delta):
+        offset = self._chars
+        self._chars += len(delta)
+        if self._header_chars is None:
+            self._head.append(delta)
+            newline = delta.find("\n")
+            if newline < 0:
+                return self._chars > self.limit
+            first_line = "".join(self._head)[:offset + newline]
+            self._head = None
+            self.interest = parse_interest_from_reply(first_line)
+            self.interest_ms = round((time.perf_counter() - self._started) * 1000, 1)
+            self._header_chars = offset + newline + 1 if self.interest else 0
+        return self._chars - self._header_chars > self.limit
+
+
+def build_fallback_reply(catalog, day_summary="", day_detail="", target_label="", attachments=()):
+    """
+    GPT 無法及時回覆時的本地回覆（不呼叫 OpenAI，只依輸入決定），回傳 (回覆文字, 興趣度標籤)：
+    附加資料（附近館區、建議行程）→ 原文；有已篩選的當日課程 → 課程列表；否則 → 課程總覽與查詢提示。
+    """
+    head = "目前智慧回覆較忙碌，先提供以下資訊：\n\n"
+    body = "\n\n".join(text for _, text in attachments if text)
+    if body:
+        reply, interest = head + body, "low_interest"
+    elif day_detail and not day_detail.startswith("（"):
+        reply, interest = f"{head}以下是{target_label}的課程：\n\n{day_summary}\n\n{day_detail}", "maybe_interest"
+    elif target_label and day_summary.startswith("（"):
+        reply, interest = head + day_summary, "low_interest"
+    elif catalog is not None:
+        reply = (
+            f"{head}想查詢哪一天的課程呢？可以輸入「週三」、「明天」或「2/18」。\n\n"
+            f"{load_courses_overview(catalog)}"
+        )
+        interest = "maybe_interest"
+    else:
+        return "目前智慧回覆暫時無法使用，請稍後再試，或至官網查詢：https://www.zoo.gov.taipei", None
+    if len(reply) > REPLY_MAX_CHARS:
+        reply = reply[:REPLY_MAX_CHARS] + "\n\n（回覆過長已截斷，請縮小問題範圍再問。）"
+    return reply, interest
+
+
+def render_user_content(user_message, attachments=()):
+    """使用者訊息 + 附加資料（[(標題, 文字)]，例如建議行程、附近館區）→ user 訊息內容。"""
+    parts = [user_message]
+    parts += [f"[{title}]\n{text}" for title, text in attachments if text]
+    return "\n\n".join(parts)
+
+
+def get_reply_and_interest(user_message, config, now_str="", attachments=(), deadline=None, parsed=None):
     """
     讀取 data、呼叫 ChatGPT、回傳 (回覆文字, 興趣度標籤)。
     now_str：台灣當前時間字串，例如「2026年2月27日（週四）14:30」
+    attachments：附加在使用者訊息後的系統資料 [(標題, 文字)]；計入輸入預算，超出時先於課程段落截短。
+    日期偵測與參考資料檢索只看 user_message 本身。
+    parsed：路由已解析好的 ParsedQuery（沿用其日期與時間，不再重新解析）；未提供時以現在時間解析。
+    deadline：time.monotonic() 時間點，未指定時從現在起算 GPT_LATENCY_BUDGET_SECONDS（0 = 不限）。
+    OpenAI 逾時、失敗、斷路器開啟或預算用完時，改回 build_fallback_reply 的本地回覆。
     """
     api_key = getattr(config, "OPENAI_API_KEY", "") or os.getenv("OPENAI_API_KEY", "")
     if not api_key:
         return "尚未設定 OPENAI_API_KEY，無法使用智慧回覆。", None
-
-    courses_path = _path(getattr(config, "COURSES_CSV_PATH", "data/courses-February.csv"))
-    areas_path = _path(getattr(config, "ZOO_AREAS_CSV_PATH", "data/zoo_areas.csv"))
-    notes_path = _path(getattr(config, "ENV_EDU_NOTES_PATH", "data/環教時數說明.txt"))
-    visitor_path = _path("data/visitor_info.txt")
-
-    courses_overview = load_courses_overview(courses_path)
-    areas_text = load_zoo_areas_context(areas_path)
-    env_notes_text = load_env_edu_notes(notes_path)
-    visitor_info_text = load_visitor_info(visitor_path)
+    if deadline is None:
+        budget = float(getattr(config, "GPT_LATENCY_BUDGET_SECONDS", 0) or 0)
+        deadline = time.monotonic() + budget if budget > 0 else None
 
     # Python 預先偵測目標星期並篩選課程，避免讓 GPT 自行過濾
     import logging
-    now_dt = datetime.now(TW_TZ)
-    target_weekday = detect_query_weekday(user_message, now_dt)
-    day_summary, day_detail = ("", "")
-    if target_weekday:
-        try:
-            day_summary, day_detail = load_courses_for_weekday(courses_path, target_weekday)
-        except Exception as e:
-            logging.warning(f"load_courses_for_weekday 失敗: {e}")
-            day_summary, day_detail = ("", "")
-    logging.info(f"[weekday] target={target_weekday} | summary_len={len(day_summary)} | detail_len={len(day_detail)}")
+    if parsed is None:
+        parsed = parse_query(user_message, datetime.now(TW_TZ))
+    now_dt, target_date, target_weekday = parsed.now, parsed.date, parsed.weekday
+    model = getattr(config, "OPENAI_MODEL", "gpt-3.5-turbo")
+    max_tokens = getattr(config, "GPT_MAX_TOKENS", 1200)
+    catalog = current_course_catalog(config)
+    temperature = getattr(config, "GPT_TEMPERATURE", 0.7)
 
-    courses_text = load_courses_context(courses_path)
-    system_prompt = build_system_prompt(
-        courses_overview, courses_text, areas_text, env_notes_text,
-        now_str, day_summary, day_detail, target_weekday,
-        visitor_info_text,
+    # 請求鍵（快取與 single-flight 共用）：正規化訊息 + 日期/星期 + 模型設定 + 資料版本
+    data_version = _prompt_data_version(catalog, _static_prompt_paths(config))
+    request_key = make_cache_key(
+        render_user_content(user_message, attachments),
+        f"{now_dt.date().isoformat()}|{target_date or ''}|{target_weekday or ''}",
+        (model, max_tokens, temperature),
+        data_version,
     )
+    cache = get_reply_cache(config)
+    if cache is not None:
+        cached = cache.get(request_key, data_version)
+        if cached is not None:
+            logging.info(f"[reply_cache] hit key={request_key[:12]}")
+            return cached
+
+    def generate():
+        reply, interest, cacheable = _generate_reply(config, parsed, attachments, now_str, catalog, deadline)
+        if cache is not None and cacheable:
+            cache.put(request_key, data_version, reply, interest)
+        return reply, interest
+
+    # 相同問題同時進來（例如整班學生問「今天有什麼課」）→ 只呼叫一次 OpenAI，其餘等待共用結果；
+    # 跨 worker 模式下，等到別的 worker 完成後從 SQLite 快取取結果
+    flight = get_single_flight(config)
+    if flight is None:
+        return generate()
+    recheck = (lambda: cache.get(request_key, data_version)) if cache is not None else None
+    timeout = deadline - time.monotonic() if deadline is not None else None
+    return flight.do(request_key, generate, recheck=recheck, timeout=timeout)
+
+
+def _generate_reply(config, parsed, attachments, now_str, catalog, deadline=None):
+    """組 prompt、呼叫 OpenAI，回傳 (回覆文字, 興趣度標籤, 可否快取)；本地回覆不快取。"""
+    import logging
+    user_message, now_dt = parsed.message, parsed.now
+    target_date, target_weekday = parsed.date, parsed.weekday
     model = getattr(config, "OPENAI_MODEL", "gpt-3.5-turbo")
     max_tokens = getattr(config, "GPT_MAX_TOKENS", 1200)
     temperature = getattr(config, "GPT_TEMPERATURE", 0.7)
 
+    # 特定日期 → 已套用起訖日期 / closed_dates 的當日課程；否則依星期篩選
+    day_summary, day_detail = ("", "")
+    target_label = date_label(target_date) if target_date else target_weekday
+    if target_weekday:
+        try:
+            if target_date:
+                day_summary, day_detail = load_courses_for_date(catalog, target_date)
+            else:
+                day_summary, day_detail = load_courses_for_weekday(
+                    catalog, target_weekday, (now_dt.year, now_dt.month),
+                )
+        except Exception as e:
+            logging.warning(f"載入當日課程失敗: {e}")
+            day_summary, day_detail = ("", "")
+    logging.info(f"[weekday] target={target_label} | summary_len={len(day_summary)} | detail_len={len(day_detail)}")
+
+    def fallback(reason):
+        GPT_FALLBACKS.inc(reason=reason)
+        logging.warning(f"[fallback] reason={reason} target={target_label}")
+        reply, interest = build_fallback_reply(catalog, day_summary, day_detail, target_label, attachments)
+        return reply, interest, False
+
+    if deadline is not None and deadline - time.monotonic() < _MIN_CALL_SECONDS:
+        return fallback("budget")
+
+    message_section = Section("message", user_message)
+    attachment_sections = [
+        (title, Section("attachment", text, PRIORITY_ATTACHMENT)) for title, text in attachments
+    ]
+    system_prompt, prompt_stats = assemble_system_prompt(
+        config, now_str, day_summary, day_detail, target_label, catalog=catalog, query=user_message,
+        user_sections=[message_section] + [section for _, section in attachment_sections],
+    )
+    user_content = render_user_content(
+        user_message, [(title, section.text) for title, section in attachment_sections],
+    )
+    logging.info(
+        f"[prompt] prefix={prompt_stats['prefix_chars']} dynamic={prompt_stats['dynamic_chars']} "
+        f"context_chunks={prompt_stats['context_chunks']} context_tokens={prompt_stats['context_tokens']} "
+        f"input_tokens={prompt_stats['input_tokens']} "
+        f"build_ms={prompt_stats['build_ms']} version={prompt_stats['prefix_version']}"
+    )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+    ]
+    stream = getattr(config, "GPT_STREAM", False)
+    watcher = _ReplyStreamWatcher() if stream else None
+    breaker = get_circuit_breaker(config)
+    if breaker is not None and not breaker.allow():
+        return fallback("circuit_open")
+    call_started = time.monotonic()
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=api_key)
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message},
-            ],
-            max_tokens=max_tokens,
-            temperature=temperature,
-        )
-        reply = (resp.choices[0].message.content or "").strip() if resp.choices else ""
+        if stream:
+            # 串流：邊收邊看長度，超過 LINE 上限就中止，不等也不付後面的 token
+            reply, timing = stream_chat_completion(
+                config, messages, should_stop=watcher, deadline=deadline,
+                prompt_tokens=prompt_stats["input_tokens"],
+                model=model, max_tokens=max_tokens, temperature=temperature,
+            )
+            reply = reply.strip()
+        else:
+            resp, timing = chat_completion(
+                config, messages, deadline=deadline,
+                model=model, max_tokens=max_tokens, temperature=temperature,
+            )
+            reply = (resp.choices[0].message.content or "").strip() if resp.choices else ""
     except Exception as e:
-        return f"回覆時發生錯誤，請稍後再試。（{str(e)[:80]}）", None
+        if breaker is not None:
+            breaker.record(False)
+        logging.warning(f"[openai] 呼叫失敗，改用本地回覆：{str(e)[:120]}")
+        timed_out = isinstance(e, TimeoutError) or type(e).__name__ == "APITimeoutError"
+        return fallback("timeout" if timed_out else "error")
+    if breaker is not None:
+        breaker.record(True, time.monotonic() - call_started)
+    stream_log = (
+        f" first_token_ms={timing['first_token_ms']} interest_ms={watcher.interest_ms} "
+        f"stopped_early={timing['stopped_early']}"
+    ) if stream else ""
+    logging.info(
+        f"[openai] connect_ms={timing['connect_ms']} generation_ms={timing['generation_ms']} "
+        f"total_ms={timing['total_ms']} attempts={timing['attempts']}{stream_log}"
+    )
 
-    interest = parse_interest_from_reply(reply)
+    interest = (watcher.interest if watcher else None) or parse_interest_from_reply(reply)
     reply_clean = strip_interest_line_from_reply(reply)
-    if len(reply_clean) > 4500:
-        reply_clean = reply_clean[:4500] + "\n\n（回覆過長已截斷，請縮小問題範圍再問。）"
-    return reply_clean, interest
+    if len(reply_clean) > REPLY_MAX_CHARS:
+        reply_clean = reply_clean[:REPLY_MAX_CHARS] + "\n\n（回覆過長已截斷，請縮小問題範圍再問。）"
+    return reply_clean, interest, bool(reply)
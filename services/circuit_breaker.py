@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+OpenAI 斷路器：連續失敗或過慢的呼叫達到門檻時暫停呼叫，改由本地回覆，過一段時間再試探。
+
+- closed：正常呼叫；連續 failure_threshold 次失敗（例外、逾時或超過 slow_seconds）→ open
+- open：open_seconds 內不呼叫上游（allow() 回傳 False）
+- half_open：open 期滿後只放行一個試探呼叫；成功 → closed，失敗 → 再 open
+- 狀態屬於 worker 行程；/metrics：zoo_openai_circuit_state（0 closed / 1 half_open / 2 open）
+"""
+
+import time
+import logging
+import threading
+
+from utils.metrics import registry
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_TRANSITIONS = registry.counter(
+    "zoo_openai_circuit_transitions_total", "OpenAI 斷路器狀態轉換次數", ("state",),
+)
+
+
+class CircuitBreaker:
+    """執行緒安全的三態斷路器。"""
+
+    def __init__(self, failure_threshold=5, slow_seconds=12.0, open_seconds=30.0, clock=time.monotonic):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.slow_seconds = float(slow_seconds)
+        self.open_seconds = float(open_seconds)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        """是否可以呼叫上游；half_open 時只有第一個呼叫者取得試探機會。"""
+        with self._lock:
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, ok, elapsed=0.0):
+        """回報一次呼叫結果；ok=True 但超過 slow_seconds 也算失敗。"""
+        failed = not ok or (self.slow_seconds > 0 and elapsed > self.slow_seconds)
+        with self._lock:
+            self._probing = False
+            if not failed:
+                self._failures = 0
+                if self._state != CLOSED:
+                    self._transition(CLOSED)
+                return
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                if self._state != OPEN:
+                    self._transition(OPEN)
+
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    # ── 內部（呼叫前須持有 _lock） ───────────────────────────────
+
+    def _transition(self, state):
+        logging.warning(f"[circuit] OpenAI 斷路器 {self._state} → {state}（連續失敗 {self._failures} 次）")
+        self._state = state
+        CIRCUIT_TRANSITIONS.inc(state=state)
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker(config):
+    """依設定建立（一次）共用的斷路器；GPT_BREAKER_FAILURES=0 時停用並回傳 None。"""
+    global _breaker
+    failures = int(getattr(config, "GPT_BREAKER_FAILURES", 5))
+    if failures <= 0:
+        return None
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_threshold=failures,
+                    slow_seconds=getattr(config, "GPT_BREAKER_SLOW_SECONDS", 12.0),
+                    open_seconds=getattr(config, "GPT_BREAKER_OPEN_SECONDS", 30.0),
+                )
+    return _breaker
+
+
+registry.callback(
+    "zoo_openai_circuit_state", "OpenAI 斷路器狀態（0 closed / 1 half_open / 2 open）",
+    lambda: _STATE_VALUES[_breaker.state()] if _breaker is not None else None,
+)
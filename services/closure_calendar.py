@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+館區公休日曆：把 venue_closures.csv 的規則與連假順延休館日
+（venue_holiday_closures.csv）展開成「每館 × 每天」的位元圖。
+
+- is_closed(venue, date)：單日查詢
+- closed_days(venue, start, end)：日期區間內的公休日
+- closed_venues(date)：某天公休的館區
+每年的位元圖第一次用到時建立（載入時先建今年與明年），之後查詢都是位元運算。
+"""
+
+import csv
+import threading
+from datetime import date, timedelta
+
+_DAY_MAP = {"週一": 0, "週二": 1, "週三": 2, "週四": 3,
+            "週五": 4, "週六": 5, "週日": 6}
+
+
+def _rule_closed(rule, d):
+    """單一規則在 d 是否公休（weekly / monthly 第 N 個週X）。"""
+    closure_day = _DAY_MAP.get(rule.get("day_of_week", ""), -1)
+    wd = d.weekday()
+    if rule["closure_type"] == "weekly":
+        return wd == closure_day
+    if rule["closure_type"] == "monthly" and wd == closure_day:
+        try:
+            return (d.day - 1) // 7 + 1 == int(rule["week_number"])
+        except (ValueError, TypeError):
+            pass
+    return False
+
+
+class ClosureCalendar:
+    """rules：venue_closures.csv 各列；holidays：{(月, 日): [館名, ...]}。"""
+
+    def __init__(self, rules, holidays, preload_years=()):
+        self.rules = tuple(rules)
+        self.venues = tuple(dict.fromkeys(r["venue_name"] for r in self.rules))
+        self._rules_of = {}
+        for r in self.rules:
+            self._rules_of.setdefault(r["venue_name"], []).append(r)
+        self.holidays = {k: tuple(v) for k, v in holidays.items()}
+        self._years = {}         # year -> {venue: int 位元圖（bit i = 當年第 i 天）}
+        self._lock = threading.Lock()
+        for y in preload_years:
+            self._year(y)
+
+    def rule(self, venue):
+        """館區的第一筆公休規則列，無則 None。"""
+        rules = self._rules_of.get(venue)
+        return rules[0] if rules else None
+
+    def is_closed(self, venue, d):
+        bits = self._year(d.year).get(venue, 0)
+        return bool((bits >> (d.timetuple().tm_yday - 1)) & 1)
+
+    def closed_days(self, venue, start, end):
+        """[start, end] 區間內 venue 的公休日（含頭尾）。"""
+        days = []
+        d = start
+        while d <= end:
+            bits = self._year(d.year).get(venue, 0) >> (d.timetuple().tm_yday - 1)
+            year_end = min(end, date(d.year, 12, 31))
+            while d <= year_end:
+                if bits & 1:
+                    days.append(d)
+                bits >>= 1
+                d += timedelta(days=1)
+        return days
+
+    def closed_venues(self, d):
+        """d 當天公休的館區（依 CSV 順序）。"""
+        year = self._year(d.year)
+        shift = d.timetuple().tm_yday - 1
+        return [v for v in self.venues if (year.get(v, 0) >> shift) & 1]
+
+    def _year(self, y):
+        year = self._years.get(y)
+        if year is None:
+            with self._lock:
+                year = self._years.get(y)
+                if year is None:
+                    year = self._build_year(y)
+                    self._years[y] = year
+        return year
+
+    def _build_year(self, y):
+        bitmaps = {}
+        d = date(y, 1, 1)
+        i = 0
+        while d.year == y:
+            holiday = self.holidays.get((d.month, d.day), ())
+            for venue in self.venues:
+                if venue in holiday or any(_rule_closed(r, d) for r in self._rules_of[venue]):
+                    bitmaps[venue] = bitmaps.get(venue, 0) | (1 << i)
+            d += timedelta(days=1)
+            i += 1
+        return bitmaps
+
+
+def load_holiday_closures(csv_path):
+    """venue_holiday_closures.csv → {(月, 日): [館名, ...]}；檔案不存在回傳空 dict。"""
+    holidays = {}
+    try:
+        with open(csv_path, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    key = (int(row["month"]), int(row["day"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                holidays.setdefault(key, []).append((row.get("venue_name") or "").strip())
+    except FileNotFoundError:
+        pass
+    return holidays
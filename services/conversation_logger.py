@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+對話紀錄 write-behind：回覆路徑只把紀錄放進記憶體佇列，由背景執行緒批次寫入資料庫。
+
+- 批次寫入 conversations，並 upsert users.last_active_at（每位使用者取批次內最新時間）
+- 累積 batch_size 筆、距上次寫入超過 flush_interval 秒、或 shutdown() 時寫入
+- 佇列有上限，滿時依 drop_policy 處理：
+    drop_newest：丟掉新紀錄（預設，回覆路徑完全不等待）
+    drop_oldest：丟掉佇列中最舊的一筆
+    block：最多等待 block_timeout 秒（背壓），仍滿則丟掉新紀錄
+- 寫入失敗只記錄 log 並計數，不影響回覆；同一使用者被其他 worker 同時新增時重試一次
+- SQLite 被其他 worker 鎖住（database is locked，busy_timeout 已等完）時以指數退避重試 lock_retries 次
+"""
+
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import select, update, bindparam, insert, inspect
+from sqlalchemy.exc import IntegrityError, DatabaseError, OperationalError
+
+from database.models import User, Conversation
+from utils.metrics import registry
+
+DROP_POLICIES = ("drop_newest", "drop_oldest", "block")
+
+LOG_RECORDS = registry.counter(
+    "zoo_conversation_log_records_total", "對話紀錄筆數（written / dropped / failed）", ("result",),
+)
+LOG_FLUSH = registry.histogram(
+    "zoo_conversation_log_flush_seconds", "對話紀錄批次寫入耗時",
+)
+LOG_LOCK_RETRIES = registry.counter(
+    "zoo_conversation_log_lock_retries_total", "對話紀錄因資料庫鎖定而重試寫入的次數",
+)
+
+
+class ConversationLogger:
+    """有上限佇列 + 背景批次寫入的對話紀錄器。"""
+
+    def __init__(self, session_factory, max_queue=1000, batch_size=50,
+                 flush_interval=2.0, drop_policy="drop_newest", block_timeout=0.05,
+                 lock_retries=5, lock_backoff=0.1):
+        """
+        session_factory：SQLAlchemy Session 工廠（database.db.SessionLocal）
+        max_queue：佇列上限（筆）
+        batch_size：累積幾筆就寫入
+        flush_interval：最久幾秒寫入一次
+        drop_policy：佇列滿時的處理方式（DROP_POLICIES）
+        block_timeout：block 策略的最長等待秒數
+        lock_retries / lock_backoff：資料庫鎖定時的重試次數與第一次退避秒數（之後每次加倍）
+        """
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy 需為 {DROP_POLICIES} 之一，收到 {drop_policy!r}")
+        self._session_factory = session_factory
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._batch_size = max(1, int(batch_size))
+        self._flush_interval = flush_interval
+        self._drop_policy = drop_policy
+        self._block_timeout = block_timeout
+        self._lock_retries = max(0, int(lock_retries))
+        self._lock_backoff = lock_backoff
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._schema_ready = False
+
+    # ── 對外介面 ────────────────────────────────────────────────
+
+    def log(self, user_id, message, is_user=True, intent_label=None, intent_score=None,
+            created_at=None):
+        """放入一筆紀錄（不等待資料庫）；被丟棄時回傳 False。"""
+        if not user_id or not message:
+            return False
+        self._ensure_started()
+        record = {
+            "user_id": user_id,
+            "message": message,
+            "is_user": is_user,
+            "intent_label": intent_label,
+            "intent_score": intent_score,
+            "created_at": created_at or datetime.now(),
+        }
+        return self._put(record)
+
+    def log_exchange(self, user_id, message, reply, intent_label=None, intent_score=None):
+        """使用者訊息 + 機器人回覆兩筆（興趣度標在使用者訊息上）。"""
+        now = datetime.now()
+        self.log(user_id, message, True, intent_label, intent_score, created_at=now)
+        self.log(user_id, reply, False, created_at=now)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def shutdown(self, timeout=5.0):
+        """寫入佇列中剩餘的紀錄後停止背景執行緒。"""
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logging.warning("[conversation_log] 佇列已滿，無法送出停止訊號")
+            return
+        thread.join(timeout)
+        self._thread = None
+
+    # ── 佇列 ────────────────────────────────────────────────────
+
+    def _put(self, record):
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            pass
+        if self._drop_policy == "drop_oldest":
+            try:
+                self._queue.get_nowait()
+                LOG_RECORDS.inc(result="dropped")
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(record)
+                return True
+            except queue.Full:
+                pass
+        elif self._drop_policy == "block":
+            try:
+                self._queue.put(record, timeout=self._block_timeout)
+                return True
+            except queue.Full:
+                pass
+        LOG_RECORDS.inc(result="dropped")
+        return False
+
+    def _ensure_started(self):
+        # 延後到第一次使用才啟動，避免 gunicorn fork 前建立執行緒
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self._flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                record = False
+            if record is None:
+                self._flush(batch)
+                return
+            if record:
+                batch.append(record)
+            if len(batch) >= self._batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self._flush_interval
+
+    # ── 寫入 ────────────────────────────────────────────────────
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        t0 = time.perf_counter()
+        duplicate_retried = False
+        locked_retries = 0
+        while True:
+            try:
+                self._write(batch)
+                LOG_RECORDS.inc(len(batch), result="written")
+                break
+            except IntegrityError:
+                # 其他 worker 同時新增了同一位使用者：重試時改走更新
+                if duplicate_retried:
+                    logging.exception("[conversation_log] 寫入失敗（使用者重複）")
+                    LOG_RECORDS.inc(len(batch), result="failed")
+                    break
+                duplicate_retried = True
+            except OperationalError as e:
+                if not _is_locked(e) or locked_retries >= self._lock_retries:
+                    logging.exception(f"[conversation_log] 寫入失敗，丟棄 {len(batch)} 筆: {e}")
+                    LOG_RECORDS.inc(len(batch), result="failed")
+                    break
+                delay = self._lock_backoff * (2 ** locked_retries)
+                locked_retries += 1
+                LOG_LOCK_RETRIES.inc()
+                logging.warning(f"[conversation_log] 資料庫鎖定中，{delay:.2f}s 後重試（第 {locked_retries} 次）")
+                time.sleep(delay)
+            except Exception as e:
+                logging.exception(f"[conversation_log] 寫入失敗，丟棄 {len(batch)} 筆: {e}")
+                LOG_RECORDS.inc(len(batch), result="failed")
+                break
+        LOG_FLUSH.observe(time.perf_counter() - t0)
+
+    def _write(self, batch):
+        last_active = {}
+        for r in batch:
+            if r["created_at"] > last_active.get(r["user_id"], datetime.min):
+                last_active[r["user_id"]] = r["created_at"]
+
+        session = self._session_factory()
+        try:
+            self._ensure_schema(session)
+            session.execute(insert(Conversation), batch)
+            existing = set(session.scalars(
+                select(User.user_id).where(User.user_id.in_(list(last_active)))
+            ))
+            if existing:
+                users = User.__table__
+                session.connection().execute(
+                    update(users)
+                    .where(users.c.user_id == bindparam("uid"))
+                    .values(last_active_at=bindparam("ts")),
+                    [{"uid": u, "ts": last_active[u]} for u in existing],
+                )
+            new_users = [
+                {"user_id": u, "created_at": ts, "last_active_at": ts}
+                for u, ts in last_active.items() if u not in existing
+            ]
+            if new_users:
+                session.execute(insert(User), new_users)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _ensure_schema(self, session):
+        # 預設 SQLite 可能尚未執行 init_db：第一次寫入前建立這兩張表（已存在則略過）
+        if self._schema_ready:
+            return
+        bind = session.get_bind()
+        for table in (User.__table__, Conversation.__table__):
+            try:
+                table.create(bind, checkfirst=True)
+            except DatabaseError:
+                # 其他 worker 同時建立了同一張表
+                if not inspect(bind).has_table(table.name):
+                    raise
+        self._schema_ready = True
+
+
+def _is_locked(exc):
+    """SQLite 的 database is locked / busy（其他連線持有寫入鎖）。"""
+    message = str(getattr(exc, "orig", exc)).lower()
+    return "database is locked" in message or "database is busy" in message
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+課程目錄：把資料夾內每個月份的課程 CSV（courses-*.csv）合併成一份、
+預先建好星期 / 日期索引與課程總覽。
+
+- CourseCatalog：不可變的快照（課程、索引、涵蓋月份、版本），建好後只讀
+- CatalogManager：定期檢查檔案清單與 mtime/size，變動時在背景執行緒重建，
+  建好後一次換上新快照；重建期間請求繼續使用舊快照，不需重啟
+- 各檔案的解析結果經 data_store 快取，只有變動的月份會重新解析
+"""
+
+import os
+import glob
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from services.course_model import load_courses
+from services.data_store import PROJECT_ROOT, data_store, file_signature
+from utils.metrics import registry
+
+WEEKDAY_ZH = ["週一", "週二", "週三", "週四", "週五", "週六", "週日"]
+
+CATALOG_SWAPS = registry.counter(
+    "zoo_course_catalog_swaps_total", "課程目錄重建並換上新快照的次數", ("result",),
+)
+
+
+# ── 文字組裝 ────────────────────────────────────────────────────
+
+def render_day_courses(buckets):
+    """
+    把分類好的課程 {cat: [Course, ...]} 組成 (summary_text, detail_text)。
+    """
+    # 摘要
+    summary_lines = []
+    for cat, entries in buckets.items():
+        if cat == "定時定點課程":
+            no_cert_unique = list(dict.fromkeys(c.topic for c in entries if not c.has_cert))
+            with_cert_unique = list(dict.fromkeys(c.topic for c in entries if c.has_cert))
+            if no_cert_unique:
+                summary_lines.append(f"定時定點課程：{'、'.join(no_cert_unique)}")
+            if with_cert_unique:
+                summary_lines.append(f"有環境教育時數之定時定點課程：{'、'.join(with_cert_unique)}")
+        else:
+            seen_topics = list(dict.fromkeys(c.topic for c in entries))
+            summary_lines.append(f"{cat}：{'、'.join(seen_topics)}")
+
+    # 詳細
+    detail_lines = []
+    for cat, entries in buckets.items():
+        for c in entries:
+            header = "【有環境教育時數之定時定點課程】" if (cat == "定時定點課程" and c.has_cert) else f"【{cat}】"
+            block = [header, f"主題：{c.topic}", f"星期：{c.weekday}", f"時間：{c.time}", f"地點：{c.location}"]
+            if c.has_cert and c.env_hours:
+                block.append(f"時數：{c.env_hours}")
+            detail_lines.append("\n".join(block))
+
+    if any(c.has_cert for entries in buckets.values() for c in entries):
+        detail_lines.append("如有需要環境教育時數，可考慮以上有標註時數的課程，歡迎進一步詢問。")
+
+    return "\n".join(summary_lines), "\n\n".join(detail_lines)
+
+
+def render_overview(courses):
+    """
+    所有唯一 (類別, 主題) 的課程總覽文字，定時定點課程按有無認證分組。
+    """
+    cat_topics = OrderedDict()
+    seen = set()
+    for course in courses:
+        key = (course.category, course.topic)
+        if key not in seen:
+            seen.add(key)
+            cat_topics.setdefault(course.category, []).append((course.topic, course.cert))
+
+    lines = ["【課程總覽（所有類別與主題）】"]
+    for cat, items in cat_topics.items():
+        if cat == "定時定點課程":
+            no_cert = [t for t, c in items if c != "是"]
+            with_cert = [t for t, c in items if c == "是"]
+            if no_cert:
+                lines.append("")
+                lines.append("定時定點課程：")
+                for i, t in enumerate(no_cert, 1):
+                    lines.append(f"{i}.{t}")
+            if with_cert:
+                lines.append("")
+                lines.append("有環境教育時數之定時定點課程：")
+                for i, t in enumerate(with_cert, 1):
+                    lines.append(f"{i}.{t}")
+        else:
+            topics = [t for t, c in items]
+            lines.append("")
+            if len(topics) == 1:
+                lines.append(f"{cat}：{topics[0]}")
+            else:
+                lines.append(f"{cat}：")
+                for i, t in enumerate(topics, 1):
+                    lines.append(f"{i}.{t}")
+
+    lines.append("")
+    lines.append("請告訴我您對以上課程有興趣的部分，我可以提供更詳細的資訊。")
+    return "\n".join(lines)
+
+
+def _day_entry(buckets):
+    summary, detail = render_day_courses(buckets) if buckets else ("", "")
+    count = sum(len(entries) for entries in buckets.values())
+    return {"buckets": buckets, "count": count, "summary": summary, "detail": detail}
+
+
+def _month_key(d):
+    return (d.year, d.month)
+
+
+# ── 目錄快照 ────────────────────────────────────────────────────
+
+class CourseCatalog:
+    """
+    不可變的課程目錄。files：[(path, signature), ...]，signature 為建立前取得的 (mtime_ns, size)。
+      weekday(週X, month=None)：星期索引；month=(年, 月) 時只列該月至少開課一次的課程
+      day(date)：當天實際開課的課程（起訖日期、第 N 個週X、closed_dates 皆已套用）
+      covers(date)：該日期所在月份是否有課表
+    """
+
+    def __init__(self, files):
+        self.files = tuple(files)
+        self.paths = tuple(p for p, _ in self.files)
+        h = hashlib.sha1()
+        for path, sig in self.files:
+            h.update(path.encode("utf-8"))
+            h.update(repr(sig).encode("ascii"))
+        self.version = h.hexdigest()[:16]
+
+        per_file = [load_courses(p) for p in self.paths]
+        # 依各檔案最早開課日排序，合併成一份（同檔案內維持 CSV 順序）
+        order = sorted(
+            range(len(per_file)),
+            key=lambda i: (min((c.start_ord for c in per_file[i] if c.start_ord is not None), default=0),
+                           self.paths[i]),
+        )
+        self.courses = tuple(c for i in order for c in per_file[i])
+        self.overview = render_overview(self.courses)
+        self._build_indexes()
+
+    def _build_indexes(self):
+        days = {}
+        months = set()
+        by_month = {}            # ((年, 月), 星期 idx) → OrderedDict
+        any_month = [OrderedDict() for _ in WEEKDAY_ZH]
+        undated = []
+        first = last = None
+        for course in self.courses:
+            mask = course.weekday_mask
+            for i in range(len(WEEKDAY_ZH)):
+                if mask & (1 << i):
+                    any_month[i].setdefault(course.category, []).append(course)
+            if course.start_ord is None or course.end_ord is None:
+                if mask:
+                    undated.append(course)
+                continue
+            first = course.start_ord if first is None else min(first, course.start_ord)
+            last = course.end_ord if last is None else max(last, course.end_ord)
+            held_keys = []
+            for ordinal in range(course.start_ord, course.end_ord + 1):
+                d = date.fromordinal(ordinal)
+                months.add(_month_key(d))
+                if course.held_on(d):
+                    buckets = days.setdefault(ordinal, OrderedDict())
+                    buckets.setdefault(course.category, []).append(course)
+                    key = (_month_key(d), d.weekday())
+                    if key not in held_keys:
+                        held_keys.append(key)
+            for key in held_keys:
+                by_month.setdefault(key, OrderedDict()).setdefault(course.category, []).append(course)
+        # 沒有起訖日期的課程：每個有課表的月份都依星期列出
+        for course in undated:
+            for month in months:
+                for i in range(len(WEEKDAY_ZH)):
+                    if course.weekday_mask & (1 << i):
+                        by_month.setdefault((month, i), OrderedDict()) \
+                            .setdefault(course.category, []).append(course)
+
+        self._days = {ordinal: _day_entry(b) for ordinal, b in days.items()}
+        self._weekdays = {(None, i): _day_entry(b) for i, b in enumerate(any_month)}
+        self._weekdays.update({key: _day_entry(b) for key, b in by_month.items()})
+        self.months = frozenset(months)
+        self.first = date.fromordinal(first) if first is not None else None
+        self.last = date.fromordinal(last) if last is not None else None
+
+    def __len__(self):
+        return len(self.courses)
+
+    def covers(self, d):
+        return _month_key(d) in self.months
+
+    def covers_month(self, year, month):
+        return (year, month) in self.months
+
+    def weekday(self, target_weekday, month=None):
+        """星期索引項目 {"buckets", "count", "summary", "detail"}；無此星期回傳 None。"""
+        if target_weekday not in WEEKDAY_ZH:
+            return None
+        return self._weekdays.get((month, WEEKDAY_ZH.index(target_weekday)))
+
+    def day(self, d):
+        """日期索引項目；當天沒有課程回傳 None。"""
+        return self._days.get(d.toordinal())
+
+    def coverage_text(self):
+        """「2026年2月、3月」之類的涵蓋月份說明。"""
+        if not self.months:
+            return ""
+        out, last_year = [], None
+        for y, m in sorted(self.months):
+            out.append(f"{y}年{m}月" if y != last_year else f"{m}月")
+            last_year = y
+        return "、".join(out)
+
+
+def catalog_from_file(path):
+    """單一課程 CSV → CourseCatalog（data_store parser，供直接傳入檔案路徑的舊呼叫方式）。"""
+    return CourseCatalog([(path, file_signature(path))])
+
+
+# ── 自動重建與換版 ──────────────────────────────────────────────
+
+class CatalogManager:
+    """
+    持有目前的 CourseCatalog；current() 每 check_interval 秒最多檢查一次檔案清單，
+    有變動就交給背景執行緒重建，完成後以單一參照指派換上（舊快照仍可被進行中的請求使用）。
+    """
+
+    def __init__(self, directory, pattern="courses-*.csv", fallback="", check_interval=10.0):
+        self.directory = directory
+        self.pattern = pattern
+        self.fallback = fallback
+        self.check_interval = float(check_interval)
+        self._current = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def scan(self):
+        """目前資料夾中的課程檔與簽章（依檔名排序）；一個都沒有時改用 fallback 檔案。"""
+        paths = sorted(glob.glob(os.path.join(self.directory, self.pattern))) if self.directory else []
+        if not paths and self.fallback:
+            paths = [self.fallback]
+        return tuple((p, file_signature(p)) for p in paths)
+
+    def current(self):
+        catalog = self._current
+        if catalog is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = CourseCatalog(self.scan())
+                    self._checked_at = time.monotonic()
+                    logging.info(f"[catalog] 載入 {len(self._current)} 門課程，涵蓋 {self._current.coverage_text()}")
+                return self._current
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            files = self.scan()
+            if files != catalog.files:
+                self._start_rebuild(files)
+        return catalog
+
+    def rebuild(self, files=None):
+        """同步重建並換上新快照（背景執行緒與手動重新載入共用）。"""
+        files = self.scan() if files is None else files
+        started = time.perf_counter()
+        try:
+            catalog = CourseCatalog(files)
+        except Exception as e:
+            CATALOG_SWAPS.inc(result="error")
+            logging.error(f"[catalog] 重建失敗，繼續使用舊版課表: {e}")
+            return self._current
+        self._current = catalog
+        CATALOG_SWAPS.inc(result="ok")
+        logging.info(
+            f"[catalog] 換上新課表 version={catalog.version} courses={len(catalog)} "
+            f"涵蓋 {catalog.coverage_text()}（{(time.perf_counter() - started) * 1000:.1f} ms）"
+        )
+        return catalog
+
+    def _start_rebuild(self, files):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            try:
+                self.rebuild(files)
+            finally:
+                with self._lock:
+                    self._rebuilding = False
+
+        threading.Thread(target=run, name="course-catalog-rebuild", daemon=True).start()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def _abspath(path):
+    return path if not path or os.path.isabs(path) else os.path.join(PROJECT_ROOT, path)
+
+
+def get_course_catalog(config):
+    """依設定（COURSES_DIR / COURSES_GLOB / COURSES_CSV_PATH）取得目前的課程目錄快照。"""
+    key = (
+        _abspath(getattr(config, "COURSES_DIR", "data")),
+        getattr(config, "COURSES_GLOB", "courses-*.csv"),
+        _abspath(getattr(config, "COURSES_CSV_PATH", "data/courses-February.csv")),
+    )
+    manager = _managers.get(key)
+    if manager is None:
+        with _managers_lock:
+            manager = _managers.get(key)
+            if manager is None:
+                manager = _managers[key] = CatalogManager(
+                    key[0], key[1], key[2],
+                    check_interval=getattr(config, "COURSES_RELOAD_SECONDS", 10),
+                )
+    return manager.current()
+
+
+def load_catalog(source):
+    """source 可以是 CourseCatalog 或單一課程 CSV 路徑（後者依檔案版本快取）。"""
+    if isinstance(source, CourseCatalog):
+        return source
+    return data_store.load(source, catalog_from_file)
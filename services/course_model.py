@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+課程資料模型：課程 CSV 只解析一次，轉成精簡的 Course 紀錄（__slots__）。
+
+- 重複出現的字串（類別、地點、星期、時間…）以 sys.intern 共用
+- 時間 → 起訖分鐘數；星期 → 位元遮罩（「第N個週X」另記 week_number）；起訖日期 → date ordinal
+- 座標 MULTIPOINT((lon,lat)) → (lat, lon)
+- closed_dates「2/14、2/15…」→ date ordinal 的 frozenset（相同字串共用同一個 set）
+空白列與 D_ 開頭的欄位說明列不建立紀錄。
+"""
+
+import re
+import sys
+import csv
+from datetime import date
+
+from services.data_store import data_store
+
+# ── 星期位元遮罩 ─────────────────────────────────────────────────
+
+_WEEKDAY_CHAR_RE = re.compile(r'週([一二三四五六日])')
+_WEEKDAY_RANGE_RE = re.compile(r'週([一二三四五六日])至週([一二三四五六日])')
+_WEEKDAY_CHARS = "一二三四五六日"
+_NTH_WEEKDAY_RE = re.compile(r'第\s*(\d)\s*個\s*週')
+
+
+def weekday_mask(weekday_field):
+    """
+    把課程 CSV 的 weekday 欄位展開成位元遮罩（bit 0=週一 … bit 6=週日）。
+    支援格式：每週X、第N個週X、每週X至週Y、每週X、週Y（逗號/頓號列舉）
+    """
+    if not weekday_field:
+        return 0
+    mask = 0
+    for ch in _WEEKDAY_CHAR_RE.findall(weekday_field):
+        mask |= 1 << _WEEKDAY_CHARS.index(ch)
+    # 範圍：每週二至週六
+    m = _WEEKDAY_RANGE_RE.search(weekday_field)
+    if m:
+        start = _WEEKDAY_CHARS.index(m.group(1))
+        end = _WEEKDAY_CHARS.index(m.group(2))
+        for i in range(start, end + 1):
+            mask |= 1 << i
+    return mask
+
+
+def parse_week_number(weekday_field):
+    """「第3個週三」→ 3（當月第幾個該星期）；其他格式回傳 None。"""
+    m = _NTH_WEEKDAY_RE.search(weekday_field or "")
+    return int(m.group(1)) if m else None
+
+
+# ── 欄位解析 ────────────────────────────────────────────────────
+
+_TIME_RANGE_RE = re.compile(r'(\d{1,2}):(\d{2})\s*(?:[-~～]\s*(\d{1,2}):(\d{2}))?')
+_DURATION_RE = re.compile(r'約\s*(\d+)\s*分鐘')
+_FULL_DATE_RE = re.compile(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})')
+_MONTH_DAY_RE = re.compile(r'(\d{1,2})/(\d{1,2})')
+_COORD_RE = re.compile(r'\(\(\s*([-\d.]+)[,\s]+([-\d.]+)')
+
+
+def parse_time_range(text):
+    """「09:30-11:30」「13:30~15:30」「11:00(每場約30分鐘)」→ (起, 訖) 分鐘數；訖未知為 None。"""
+    m = _TIME_RANGE_RE.search(text or "")
+    if not m:
+        return None, None
+    start = int(m.group(1)) * 60 + int(m.group(2))
+    if m.group(3):
+        return start, int(m.group(3)) * 60 + int(m.group(4))
+    d = _DURATION_RE.search(text)
+    return start, (start + int(d.group(1))) if d else None
+
+
+def parse_date_ordinal(text):
+    """「2026/2/1」→ date ordinal；無法解析回傳 None。"""
+    m = _FULL_DATE_RE.search(text or "")
+    if not m:
+        return None
+    try:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3))).toordinal()
+    except ValueError:
+        return None
+
+
+def parse_coordinates(text):
+    """「MULTIPOINT((121.58,24.99))」→ (lat, lon)；無法解析回傳 (None, None)。"""
+    m = _COORD_RE.search(text or "")
+    if not m:
+        return None, None
+    return float(m.group(2)), float(m.group(1))
+
+
+def parse_closed_dates(text, year):
+    """「2/14、2/15…」（年份取自 start_date）→ frozenset[date ordinal]。"""
+    if not text or year is None:
+        return frozenset()
+    out = set()
+    for mo, d in _MONTH_DAY_RE.findall(text):
+        try:
+            out.add(date(year, int(mo), int(d)).toordinal())
+        except ValueError:
+            continue
+    return frozenset(out)
+
+
+# ── 紀錄 ────────────────────────────────────────────────────────
+
+class Course:
+    """單一課程場次（CSV 一列）。文字欄位保留原樣供顯示，其餘為解析後的數值。"""
+
+    __slots__ = (
+        "category", "topic", "weekday", "time", "location",
+        "cert", "env_hours", "cert_type",
+        "weekday_mask", "week_number", "start_min", "end_min", "start_ord", "end_ord",
+        "lat", "lon", "closed",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @property
+    def has_cert(self):
+        return self.cert == "是"
+
+    def held_on(self, d):
+        """d（date）當天是否開課：起訖日期、星期、第 N 個週X 與 closed_dates 皆需符合。"""
+        ordinal = d.toordinal()
+        if self.start_ord is not None and ordinal < self.start_ord:
+            return False
+        if self.end_ord is not None and ordinal > self.end_ord:
+            return False
+        if not self.weekday_mask & (1 << d.weekday()):
+            return False
+        if self.week_number is not None and (d.day - 1) // 7 + 1 != self.week_number:
+            return False
+        return ordinal not in self.closed
+
+    def __repr__(self):
+        return f"Course({self.category!r}, {self.topic!r}, {self.weekday!r}, {self.time!r})"
+
+
+def _intern(value):
+    return sys.intern((value or "").strip())
+
+
+def parse_courses(path):
+    """課程 CSV → tuple[Course]（data_store parser）。"""
+    closed_sets = {}             # (closed_dates 字串, 年份) → frozenset，重複列共用
+    courses = []
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            category = _intern(row.get("category"))
+            topic = _intern(row.get("topic"))
+            if not category or not topic or category.startswith("D_"):
+                continue
+            weekday = _intern(row.get("weekday"))
+            time_text = _intern(row.get("time"))
+            start_min, end_min = parse_time_range(time_text)
+            start_ord = parse_date_ordinal(row.get("start_date"))
+            end_ord = parse_date_ordinal(row.get("end_date"))
+            year_ord = start_ord if start_ord is not None else end_ord
+            year = date.fromordinal(year_ord).year if year_ord is not None else None
+            closed_text = (row.get("closed_dates") or "").strip()
+            closed_key = (closed_text, year)
+            if closed_key not in closed_sets:
+                closed_sets[closed_key] = parse_closed_dates(closed_text, year)
+            lat, lon = parse_coordinates(row.get("coordinates"))
+            courses.append(Course(
+                category=category,
+                topic=topic,
+                weekday=weekday,
+                time=time_text,
+                location=_intern(row.get("location")),
+                cert=_intern(row.get("cert")),
+                env_hours=_intern(row.get("env_hours")),
+                cert_type=_intern(row.get("cert_type")),
+                weekday_mask=weekday_mask(weekday),
+                week_number=parse_week_number(weekday),
+                start_min=start_min,
+                end_min=end_min,
+                start_ord=start_ord,
+                end_ord=end_ord,
+                lat=lat,
+                lon=lon,
+                closed=closed_sets[closed_key],
+            ))
+    return tuple(courses)
+
+
+def load_courses(csv_path):
+    """課程紀錄（依檔案版本快取，唯讀）。"""
+    return data_store.load(csv_path, parse_courses)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+資料快取層：data/ 底下的檔案每個 worker 只讀一次。
+
+- load(path, parser)：回傳 parser(path) 的結果，檔案 mtime/size 未變就直接回快取
+- derive(name, paths, builder, version)：多個檔案組成的衍生資料（索引、prompt 前綴等），
+  任一檔案變動或 version 改變才重建（同一個 name 只保留最新一份）
+- stats()：命中 / 載入 / 重新載入次數與累計載入時間，觀察對延遲的影響
+
+parser / builder 丟出例外時不會寫入快取，由呼叫端自行處理（維持原本的錯誤回覆）。
+檔案不存在時簽章為 None，之後檔案出現會自動重建。
+"""
+
+import os
+import csv
+import time
+import hashlib
+import logging
+import threading
+
+from utils.metrics import registry
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _abspath(path):
+    return path if os.path.isabs(path) else os.path.join(PROJECT_ROOT, path)
+
+
+def file_signature(path):
+    """檔案版本簽章 (mtime_ns, size)；檔案不存在時回傳 None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# ── 常用 parser ─────────────────────────────────────────────────
+
+def parse_text(path):
+    """整份文字檔（去除前後空白）。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def parse_raw_text(path):
+    """整份文字檔（原樣）。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def parse_csv_rows(path):
+    """CSV → tuple[dict]，缺失欄位填空字串（缺失值處理）。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return tuple(
+            {k: (v if v is not None else "") for k, v in row.items()}
+            for row in csv.DictReader(f)
+        )
+
+
+# ── 快取本體 ────────────────────────────────────────────────────
+
+class DataStore:
+    """以檔案簽章為版本的行程內快取，執行緒安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}       # key -> (signature, value)
+        self._building = {}      # key -> threading.Lock（同一份資料只建一次）
+        self._hits = 0
+        self._loads = 0
+        self._reloads = 0
+        self._load_seconds = 0.0
+
+    def load(self, path, parser=parse_text):
+        """讀取單一檔案並快取 parser 結果。"""
+        path = _abspath(path)
+        key = ("file", path, parser)
+        return self._get(key, (path,), lambda: parser(path))
+
+    def derive(self, name, paths, builder, version=None):
+        """
+        由多個檔案衍生的資料（索引、預先組好的文字等）。
+        name 區分不同用途（固定字串）；paths 任一檔案簽章或 version（檔案之外的資料版本，
+        例如課程目錄版本）改變才重建，新版本取代舊版本，不會累積。
+        """
+        paths = tuple(_abspath(p) for p in paths)
+        key = ("derive", name, paths)
+        return self._get(key, paths, builder, version)
+
+    def version(self, paths):
+        """多個檔案的版本雜湊（16 碼 hex），供快取鍵使用。"""
+        h = hashlib.sha1()
+        for p in paths:
+            p = _abspath(p)
+            h.update(p.encode("utf-8"))
+            h.update(repr(file_signature(p)).encode("ascii"))
+        return h.hexdigest()[:16]
+
+    def _get(self, key, paths, build, version=None):
+        sig = (tuple(file_signature(p) for p in paths), version)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == sig:
+            with self._lock:
+                self._hits += 1
+            return entry[1]
+
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            # 等鎖期間可能已由其他執行緒建好
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                with self._lock:
+                    self._hits += 1
+                return entry[1]
+            start = time.perf_counter()
+            value = build()
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._entries[key] = (sig, value)
+                self._load_seconds += elapsed
+                if entry is None:
+                    self._loads += 1
+                else:
+                    self._reloads += 1
+            if entry is not None:
+                logging.info(f"[data_store] 重新載入 {key[1]}（{elapsed * 1000:.1f} ms）")
+            return value
+
+    def clear(self):
+        """清空所有快取（下次存取重新載入）。"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """回傳快取統計。"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "loads": self._loads,
+                "reloads": self._reloads,
+                "load_ms": round(self._load_seconds * 1000, 2),
+            }
+
+
+# 全行程共用的實例
+data_store = DataStore()
+
+registry.callback(
+    "zoo_data_store_events_total", "data_store 快取命中 / 首次載入 / 檔案變動重新載入次數",
+    lambda: {(k,): v for k, v in data_store.stats().items() if k in ("hits", "loads", "reloads")},
+    labelnames=("event",), type_name="counter",
+)
+registry.callback(
+    "zoo_data_store_load_seconds_total", "data_store 累計載入（解析 / 建索引）時間",
+    lambda: round(data_store.stats()["load_ms"] / 1000, 6), type_name="counter",
+)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+館區 / 設施的空間索引：座標載入 NumPy 陣列後，一次算好兩兩距離矩陣
+與每個地點由近到遠的鄰近清單。
+
+- neighbours(idx, top_n)：「X 附近有什麼」→ 直接查表
+- nearest(lat, lon, top_n)：任意座標（如 LINE 位置訊息）→ 向量化計算
+"""
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    """向量化 haversine（輸入為弧度，可廣播），回傳公尺。"""
+    dphi = lat2 - lat1
+    dlambda = lon2 - lon1
+    a = np.sin(dphi / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+class GeoIndex:
+    """
+    points：[{"name", "lat", "lon", ...}, ...]，保留原順序（距離相同時依此排序）。
+    建立時預先計算距離矩陣與每點前 top_k 名鄰居（同名地點不列入）。
+    """
+
+    def __init__(self, points, top_k=10):
+        self.points = tuple(points)
+        self.names = [p["name"] for p in self.points]
+        self._pos = {}
+        for i, name in enumerate(self.names):
+            self._pos.setdefault(name, i)
+
+        n = len(self.points)
+        coords = np.radians(np.array([[p["lat"], p["lon"]] for p in self.points], dtype=np.float64)
+                            .reshape(n, 2))
+        self._lat = coords[:, 0]
+        self._lon = coords[:, 1]
+        self.distances = haversine_matrix(
+            self._lat[:, None], self._lon[:, None], self._lat[None, :], self._lon[None, :],
+        )
+
+        # 同名（含自己）設為無限遠，再依距離做穩定排序
+        self._name_ids = np.array([self._pos[name] for name in self.names], dtype=np.int64)
+        masked = np.where(self._name_ids[:, None] == self._name_ids[None, :], np.inf, self.distances)
+        order = np.argsort(masked, axis=1, kind="stable")
+        valid = np.isfinite(np.take_along_axis(masked, order, axis=1))
+        k = min(top_k, n)
+        self._neighbours = [order[i][valid[i]][:k] for i in range(n)]
+        self._top_k = k
+
+    def __len__(self):
+        return len(self.points)
+
+    def position(self, name):
+        """地點名稱 → 索引（同名取第一筆），找不到回傳 None。"""
+        return self._pos.get(name)
+
+    def neighbours(self, idx, top_n=6):
+        """預先算好的鄰近清單 [(距離公尺, point), ...]，由近到遠。"""
+        if top_n > self._top_k:
+            # 超過預先計算的名次才即時排序
+            row = np.where(self._name_ids == self._name_ids[idx], np.inf, self.distances[idx])
+            order = [j for j in np.argsort(row, kind="stable") if np.isfinite(row[j])][:top_n]
+        else:
+            order = self._neighbours[idx][:top_n]
+        return [(float(self.distances[idx, j]), self.points[j]) for j in order]
+
+    def nearest(self, lat, lon, top_n=6, kinds=None):
+        """任意座標（度）的最近地點 [(距離公尺, point), ...]；kinds 可限定 point["kind"]。"""
+        d = haversine_matrix(np.radians(lat), np.radians(lon), self._lat, self._lon)
+        if kinds is not None:
+            allowed = np.array([p.get("kind") in kinds for p in self.points], dtype=bool)
+            d = np.where(allowed, d, np.inf)
+        order = np.argsort(d, kind="stable")[:top_n]
+        return [(float(d[j]), self.points[j]) for j in order if np.isfinite(d[j])]
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地意圖分類器（CPU）：為每則訊息產生興趣度標籤，不必等 GPT 回覆中的 [興趣度: ...]。
+
+- 選用功能（INTENT_CLASSIFIER_ENABLED），模型在背景執行緒第一次需要時才載入；
+  載入中或載入失敗時 wait() 回傳 None，由呼叫端沿用原本的標籤
+- 模型目錄（BERT_MODEL_PATH）：
+    model.quant.onnx / model.onnx 存在 → onnxruntime（scripts/export_intent_model.py 匯出並量化）
+    否則 → transformers + torch，INTENT_QUANTIZE 時對 Linear 做動態 int8 量化
+  tokenizer 優先用 tokenizer.json（tokenizers，免載入 transformers）
+- 微批次：同時到達的請求由同一個執行緒合併成一批推論（最多 INTENT_BATCH_SIZE 筆、
+  最多等 INTENT_BATCH_WAIT_MS），批次內 padding 到最長的一句
+- 判定：P(high_interest) ≥ HIGH_INTEREST_THRESHOLD 才標 high，否則取其餘標籤中機率最高者
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+
+import numpy as np
+
+from utils.metrics import registry
+
+INTENT_LATENCY = registry.histogram(
+    "zoo_intent_classifier_seconds", "意圖分類耗時（queue：等待成批、inference：批次推論、total：submit 到取得結果）",
+    ("stage",),
+)
+INTENT_BATCH = registry.histogram(
+    "zoo_intent_classifier_batch_size", "意圖分類每批筆數", buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+INTENT_RESULTS = registry.counter(
+    "zoo_intent_classifier_results_total", "意圖分類結果（ok / timeout / error / unavailable）", ("outcome",),
+)
+
+_ONNX_FILES = ("model.quant.onnx", "model.onnx")
+
+
+# ── 推論後端 ─────────────────────────────────────────────────────
+
+def _load_tokenizer(model_path, max_length):
+    """回傳 encode(texts) -> {input_ids, attention_mask, token_type_ids}（int64 ndarray）。"""
+    tokenizer_json = os.path.join(model_path, "tokenizer.json")
+    if os.path.exists(tokenizer_json):
+        from tokenizers import Tokenizer
+        tok = Tokenizer.from_file(tokenizer_json)
+        tok.enable_truncation(max_length)
+        tok.enable_padding()
+
+        def encode(texts):
+            batch = tok.encode_batch(list(texts))
+            return {
+                "input_ids": np.array([e.ids for e in batch], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in batch], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in batch], dtype=np.int64),
+            }
+        return encode
+
+    from transformers import AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(model_path)
+
+    def encode(texts):
+        out = tok(list(texts), padding=True, truncation=True, max_length=max_length, return_tensors="np")
+        return {k: v.astype(np.int64) for k, v in out.items()}
+    return encode
+
+
+class _OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_file, encode, threads):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self._inputs = [i.name for i in self._session.get_inputs()]
+        self._encode = encode
+
+    def logits(self, texts):
+        features = self._encode(texts)
+        feed = {name: features[name] for name in self._inputs if name in features}
+        return self._session.run(None, feed)[0]
+
+
+class _TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_path, encode, threads, quantize):
+        import torch
+        from transformers import AutoModelForSequenceClassification
+        torch.set_num_threads(threads)
+        model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.name = "torch-int8"
+        self._torch = torch
+        self._model = model
+        self._encode = encode
+
+    def logits(self, texts):
+        features = self._encode(texts)
+        inputs = {k: self._torch.from_numpy(v) for k, v in features.items()}
+        with self._torch.inference_mode():
+            return self._model(**inputs).logits.numpy()
+
+
+def load_backend(model_path, max_length=128, threads=1, quantize=True):
+    """依模型目錄內容選擇 onnxruntime 或 torch 後端。"""
+    if not os.path.isdir(model_path):
+        raise FileNotFoundError(f"找不到模型目錄：{model_path}")
+    encode = _load_tokenizer(model_path, max_length)
+    for name in _ONNX_FILES:
+        model_file = os.path.join(model_path, name)
+        if os.path.exists(model_file):
+            return _OnnxBackend(model_file, encode, threads)
+    return _TorchBackend(model_path, encode, threads, quantize)
+
+
+def _softmax(logits):
+    z = logits - logits.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+# ── 分類器 ──────────────────────────────────────────────────────
+
+class _Request:
+    __slots__ = ("text", "submitted", "done", "result")
+
+    def __init__(self, text):
+        self.text = text
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None           # (label, high_interest 機率)
+
+
+class IntentClassifier:
+    """延遲載入、微批次的興趣度分類器。"""
+
+    def __init__(self, model_path, id2label, high_threshold=0.7, max_length=128,
+                 batch_size=16, batch_wait_ms=5.0, timeout_ms=300.0, threads=1,
+                 quantize=True, backend_loader=None):
+        """
+        id2label：{模型輸出索引: 標籤}（config.ID2LABEL）
+        timeout_ms：wait() 自 submit 起最多等待的毫秒數
+        backend_loader：() -> 後端物件（需有 logits(texts)），預設依 model_path 載入
+        """
+        self.model_path = model_path
+        self._labels = [id2label[i] for i in sorted(id2label)]
+        self._high = self._labels.index("high_interest") if "high_interest" in self._labels else None
+        self._threshold = high_threshold
+        self._batch_size = max(1, int(batch_size))
+        self._batch_wait = batch_wait_ms / 1000
+        self._timeout = timeout_ms / 1000
+        self._loader = backend_loader or (
+            lambda: load_backend(model_path, max_length, threads, quantize)
+        )
+        self._backend = None
+        self._failed = None          # 載入失敗原因；失敗後不再嘗試
+        self._loaded = threading.Event()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # ── 對外介面 ────────────────────────────────────────────────
+
+    @property
+    def available(self):
+        return self._backend is not None
+
+    def submit(self, text):
+        """送出分類請求（不等待）；模型確定無法載入時回傳 None。"""
+        if self._failed or not text:
+            return None
+        self._ensure_started()
+        request = _Request(text)
+        self._queue.put(request)
+        return request
+
+    def wait(self, request):
+        """等待 submit() 的結果，回傳 (label, score)；逾時 / 無結果回傳 None。"""
+        if request is None or not self._loaded.is_set():
+            # 模型載入中不等待，避免冷啟動期間每則訊息都多等 timeout_ms
+            INTENT_RESULTS.inc(outcome="unavailable")
+            return None
+        remaining = self._timeout - (time.perf_counter() - request.submitted)
+        if not request.done.wait(max(0.0, remaining)):
+            INTENT_RESULTS.inc(outcome="timeout" if self._backend else "unavailable")
+            return None
+        if request.result is None:
+            INTENT_RESULTS.inc(outcome="unavailable" if self._failed else "error")
+            return None
+        INTENT_RESULTS.inc(outcome="ok")
+        INTENT_LATENCY.observe(time.perf_counter() - request.submitted, stage="total")
+        return request.result
+
+    def classify(self, text):
+        """submit + wait。"""
+        return self.wait(self.submit(text))
+
+    def warm(self, timeout=None):
+        """啟動背景執行緒並等待模型載入完成；回傳是否可用。"""
+        if self._failed:
+            return False
+        self._ensure_started()
+        self._loaded.wait(timeout)
+        return self.available
+
+    def predict(self, texts):
+        """同步批次推論：[(label, score), ...]（需已載入）。"""
+        probs = _softmax(np.asarray(self._backend.logits(texts), dtype=np.float32))
+        return [self._decide(row) for row in probs]
+
+    # ── 內部 ────────────────────────────────────────────────────
+
+    def _decide(self, probs):
+        best = int(probs.argmax())
+        if self._high is None:
+            return self._labels[best], float(probs[best])
+        p_high = float(probs[self._high])
+        if best == self._high and p_high < self._threshold:
+            rest = probs.copy()
+            rest[self._high] = -1.0
+            best = int(rest.argmax())
+        return self._labels[best], p_high
+
+    def _ensure_started(self):
+        # 延後到第一次使用才啟動，避免 gunicorn fork 前建立執行緒
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="intent-classifier", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            self._backend = self._loader()
+            logging.info(
+                f"[intent] 模型已載入（{getattr(self._backend, 'name', 'custom')}，"
+                f"{(time.perf_counter() - t0) * 1000:.0f} ms）：{self.model_path}"
+            )
+        except Exception as e:
+            self._failed = str(e) or type(e).__name__
+            logging.warning(f"[intent] 無法載入意圖分類模型，沿用原本的興趣度標籤：{e}")
+        finally:
+            self._loaded.set()
+
+    def _run(self):
+        self._load()
+        while True:
+            batch = [self._queue.get()]
+            if self._failed:
+                # 載入失敗：讓等待中的請求立即返回
+                for request in batch:
+                    request.done.set()
+                continue
+            deadline = time.perf_counter() + self._batch_wait
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                                 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._infer(batch)
+
+    def _infer(self, batch):
+        started = time.perf_counter()
+        for request in batch:
+            INTENT_LATENCY.observe(started - request.submitted, stage="queue")
+        INTENT_BATCH.observe(len(batch))
+        try:
+            results = self.predict([r.text for r in batch])
+        except Exception as e:
+            logging.exception(f"[intent] 推論失敗（{len(batch)} 筆）: {e}")
+            results = [None] * len(batch)
+        INTENT_LATENCY.observe(time.perf_counter() - started, stage="inference")
+        for request, result in zip(batch, results):
+            request.result = result
+            request.done.set()
+
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def get_intent_classifier(config):
+    """依設定取得共用的分類器；未啟用時回傳 None。"""
+    if not getattr(config, "INTENT_CLASSIFIER_ENABLED", False):
+        return None
+    key = (config.BERT_MODEL_PATH, config.INTENT_BATCH_SIZE, config.INTENT_BATCH_WAIT_MS,
+           config.INTENT_TIMEOUT_MS, config.INTENT_THREADS, config.INTENT_QUANTIZE)
+    classifier = _classifiers.get(key)
+    if classifier is not None:
+        return classifier
+    with _classifiers_lock:
+        classifier = _classifiers.get(key)
+        if classifier is None:
+            classifier = _classifiers[key] = IntentClassifier(
+                config.BERT_MODEL_PATH,
+                config.ID2LABEL,
+                high_threshold=config.HIGH_INTEREST_THRESHOLD,
+                max_length=config.BERT_MAX_LENGTH,
+                batch_size=config.INTENT_BATCH_SIZE,
+                batch_wait_ms=config.INTENT_BATCH_WAIT_MS,
+                timeout_ms=config.INTENT_TIMEOUT_MS,
+                threads=config.INTENT_THREADS,
+                quantize=config.INTENT_QUANTIZE,
+            )
+        return classifier
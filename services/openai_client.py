@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+OpenAI 連線池：每個 worker 行程共用一個長壽命的 OpenAI client。
+
+- httpx 連線池（keep-alive），省去每則訊息的 DNS / TCP / TLS 建立
+- 明確的 connect / read 逾時
+- 有上限的重試（指數退避 + jitter），只重試連線錯誤、逾時、429 與 5xx
+- 每次呼叫拆分延遲：connect_ms（建立連線）與 generation_ms（送出請求到收完回應）
+- 串流模式（stream_chat_completion）：記錄首個 token 時間，呼叫端可在夠用時提前中止生成；
+  串流回應沒有 usage，token 數改以本地估算（utils.tokens）計入同一個指標
+- deadline（time.monotonic() 時間點）：每次嘗試的逾時縮到剩餘時間內，來不及就不再重試
+
+設定 OPENAI_BASE_URL 可指向本機的 OpenAI 相容 stub（見 scripts/openai_stub_server.py）。
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+
+from utils.metrics import registry
+from utils.tokens import approx_tokens
+
+_lock = threading.Lock()
+_client = None
+_client_key = None
+_installed = None      # install_client() 指定的替身
+_trace = threading.local()
+
+OPENAI_LATENCY = registry.histogram(
+    "zoo_openai_request_seconds", "chat.completions 呼叫時間（含重試）", ("model", "outcome"),
+)
+OPENAI_TOKENS = registry.counter(
+    "zoo_openai_tokens_total", "OpenAI 回應 usage 的 token 數（串流呼叫為本地估算）", ("model", "kind"),
+)
+OPENAI_RETRIES = registry.counter(
+    "zoo_openai_retries_total", "OpenAI 呼叫重試次數", ("model",),
+)
+OPENAI_FIRST_TOKEN = registry.histogram(
+    "zoo_openai_first_token_seconds", "串流呼叫從送出請求到收到第一段內容的時間", ("model",),
+)
+OPENAI_EARLY_STOPS = registry.counter(
+    "zoo_openai_stream_early_stops_total", "串流呼叫因內容已足夠而提前中止的次數", ("model",),
+)
+
+
+def _settings(config):
+    return {
+        "api_key": getattr(config, "OPENAI_API_KEY", "") or os.getenv("OPENAI_API_KEY", ""),
+        "base_url": getattr(config, "OPENAI_BASE_URL", "") or None,
+        "connect_timeout": float(getattr(config, "OPENAI_CONNECT_TIMEOUT", 5.0)),
+        "read_timeout": float(getattr(config, "OPENAI_READ_TIMEOUT", 30.0)),
+        "pool_size": int(getattr(config, "OPENAI_POOL_SIZE", 10)),
+        "max_retries": int(getattr(config, "OPENAI_MAX_RETRIES", 2)),
+        "retry_backoff": float(getattr(config, "OPENAI_RETRY_BACKOFF", 0.5)),
+    }
+
+
+# ── 連線計時（httpcore trace） ──────────────────────────────────
+
+def _trace_hook(event_name, info):
+    """httpcore trace callback：記錄建立連線（TCP + TLS）花費的時間。"""
+    if event_name == "connection.connect_tcp.started":
+        _trace.connect_started = time.perf_counter()
+    elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+        started = getattr(_trace, "connect_started", None)
+        if started is not None:
+            _trace.connect_seconds = time.perf_counter() - started
+
+
+def _attach_trace(request):
+    """httpx request event hook：每個請求掛上 trace。"""
+    request.extensions["trace"] = _trace_hook
+
+
+# ── client ──────────────────────────────────────────────────────
+
+def get_client(config):
+    """取得（必要時建立）共用的 OpenAI client；設定改變時重建。"""
+    global _client, _client_key
+    if _installed is not None:
+        return _installed
+    s = _settings(config)
+    key = (s["api_key"], s["base_url"], s["connect_timeout"], s["read_timeout"], s["pool_size"])
+    if _client is not None and _client_key == key:
+        return _client
+    with _lock:
+        if _client is not None and _client_key == key:
+            return _client
+        import httpx
+        from openai import OpenAI
+        timeout = httpx.Timeout(s["read_timeout"], connect=s["connect_timeout"])
+        http_client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=s["pool_size"],
+                max_keepalive_connections=s["pool_size"],
+                keepalive_expiry=60.0,
+            ),
+            event_hooks={"request": [_attach_trace]},
+        )
+        # 重試由 chat_completion 自行處理（含 jitter 與延遲拆分），SDK 內建重試關閉
+        _client = OpenAI(
+            api_key=s["api_key"],
+            base_url=s["base_url"],
+            timeout=timeout,
+            max_retries=0,
+            http_client=http_client,
+        )
+        _client_key = key
+        logging.info(f"[openai] 建立連線池 base_url={s['base_url'] or '(default)'} pool={s['pool_size']}")
+        return _client
+
+
+def warm_up(config, connect=True):
+    """
+    預熱：import openai / httpx 並建立連線池，避免第一則訊息負擔。
+    connect=True 時以 GET /models（不耗 token）先建立一條 keep-alive 連線；失敗只記 log。
+    未設定 API key 時不建立。回傳是否已建立連線。
+    """
+    s = _settings(config)
+    if not s["api_key"] or _installed is not None:
+        return False
+    client = get_client(config)
+    if not connect:
+        return False
+    started = time.perf_counter()
+    try:
+        client.with_options(timeout=s["connect_timeout"]).models.list()
+    except Exception as e:
+        logging.warning(f"[openai] 預熱連線失敗（第一則訊息時再連線）：{str(e)[:120]}")
+        return False
+    logging.info(f"[openai] 預熱連線完成 {(time.perf_counter() - started) * 1000:.0f} ms")
+    return True
+
+
+def install_client(client):
+    """直接指定 client（測試、benchmark 用的替身）；傳 None 還原。"""
+    global _installed
+    _installed = client
+
+
+def _is_retryable(exc):
+    import openai
+    if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError)):
+        return True  # APITimeoutError 是 APIConnectionError 的子類別
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code >= 500
+    return False
+
+
+def chat_completion(config, messages, deadline=None, **kwargs):
+    """
+    呼叫 chat.completions.create，回傳 (response, timing)。
+    timing：connect_ms / generation_ms / total_ms / attempts
+    失敗（含重試用盡）時拋出最後一次的例外；超過 deadline 拋出 TimeoutError。
+    """
+    s = _settings(config)
+    client = get_client(config)
+    model = kwargs.get("model", "")
+    attempts = 0
+    started = time.perf_counter()
+    while True:
+        attempts += 1
+        _trace.connect_started = None
+        _trace.connect_seconds = 0.0
+        call_started = time.perf_counter()
+        try:
+            resp = client.chat.completions.create(
+                messages=messages, **_attempt_kwargs(kwargs, deadline, s["read_timeout"]),
+            )
+        except Exception as e:
+            # 指數退避 + full jitter
+            delay = random.uniform(0, s["retry_backoff"] * (2 ** (attempts - 1)))
+            if (attempts > s["max_retries"] or not _is_retryable(e)
+                    or not _time_left(deadline, delay)):
+                OPENAI_LATENCY.observe(time.perf_counter() - started, model=model, outcome="error")
+                raise
+            OPENAI_RETRIES.inc(model=model)
+            logging.warning(f"[openai] 第 {attempts} 次呼叫失敗，{delay:.2f}s 後重試：{e}")
+            time.sleep(delay)
+            continue
+        now = time.perf_counter()
+        connect = getattr(_trace, "connect_seconds", 0.0)
+        timing = {
+            "connect_ms": round(connect * 1000, 1),
+            "generation_ms": round((now - call_started - connect) * 1000, 1),
+            "total_ms": round((now - started) * 1000, 1),
+            "attempts": attempts,
+        }
+        OPENAI_LATENCY.observe(now - started, model=model, outcome="ok")
+        _record_usage(model, getattr(resp, "usage", None))
+        return resp, timing
+
+
+def stream_chat_completion(config, messages, should_stop=None, deadline=None, prompt_tokens=None, **kwargs):
+    """
+    以 stream=True 呼叫 chat.completions.create，邊收邊累積內容，回傳 (text, timing)。
+    should_stop(delta)：每收到一段新內容後以該段呼叫（累積狀態由呼叫端自行保存），
+    回傳 True 即關閉串流（不再為後續 token 付費與等待）。
+    prompt_tokens：呼叫端已估算的訊息內容 token 數（組 prompt 時的預算計算）；
+    串流沒有回傳 usage 時直接沿用，未提供才逐則估算。
+    只在尚未收到任何內容前重試；之後的錯誤直接拋出。生成超過 deadline 時關閉串流並拋出 TimeoutError。
+    timing：connect_ms / first_token_ms / generation_ms / total_ms / attempts / stopped_early
+    """
+    s = _settings(config)
+    client = get_client(config)
+    model = kwargs.get("model", "")
+    attempts = 0
+    started = time.perf_counter()
+    while True:
+        attempts += 1
+        _trace.connect_started = None
+        _trace.connect_seconds = 0.0
+        call_started = time.perf_counter()
+        parts = []
+        first_token = None
+        stopped = False
+        stream = None
+        usage = None
+        try:
+            stream = client.chat.completions.create(
+                messages=messages, stream=True, **_attempt_kwargs(kwargs, deadline, s["read_timeout"]),
+            )
+            for chunk in stream:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("超過延遲預算，中止串流")
+                usage = getattr(chunk, "usage", None) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    OPENAI_FIRST_TOKEN.observe(first_token - call_started, model=model)
+                parts.append(delta)
+                if should_stop is not None and should_stop(delta):
+                    stopped = True
+                    break
+        except Exception as e:
+            delay = random.uniform(0, s["retry_backoff"] * (2 ** (attempts - 1)))
+            if (parts or attempts > s["max_retries"] or not _is_retryable(e)
+                    or not _time_left(deadline, delay)):
+                OPENAI_LATENCY.observe(time.perf_counter() - started, model=model, outcome="error")
+                raise
+            OPENAI_RETRIES.inc(model=model)
+            logging.warning(f"[openai] 第 {attempts} 次串流呼叫失敗，{delay:.2f}s 後重試：{e}")
+            time.sleep(delay)
+            continue
+        finally:
+            if stream is not None:
+                _close_stream(stream)
+        now = time.perf_counter()
+        connect = getattr(_trace, "connect_seconds", 0.0)
+        timing = {
+            "connect_ms": round(connect * 1000, 1),
+            "first_token_ms": round((first_token - call_started) * 1000, 1) if first_token else None,
+            "generation_ms": round((now - call_started - connect) * 1000, 1),
+            "total_ms": round((now - started) * 1000, 1),
+            "attempts": attempts,
+            "stopped_early": stopped,
+        }
+        OPENAI_LATENCY.observe(now - started, model=model, outcome="ok")
+        if stopped:
+            OPENAI_EARLY_STOPS.inc(model=model)
+        text = "".join(parts)
+        if usage is not None:
+            _record_usage(model, usage)
+        else:
+            _record_tokens(model, _estimate_prompt_tokens(messages, prompt_tokens), approx_tokens(text))
+        return text, timing
+
+
+def _attempt_kwargs(kwargs, deadline, read_timeout):
+    """有 deadline 時，這次嘗試的逾時 = min(read timeout, 剩餘時間)；已無剩餘時間則拋出 TimeoutError。"""
+    if deadline is None:
+        return kwargs
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("超過延遲預算，不再呼叫 OpenAI")
+    return {**kwargs, "timeout": min(read_timeout, remaining)}
+
+
+def _time_left(deadline, delay):
+    """退避 delay 秒後是否仍在 deadline 內（沒有 deadline 時一律為 True）。"""
+    return deadline is None or time.monotonic() + delay < deadline
+
+
+def _close_stream(stream):
+    """關閉串流的 HTTP 回應（提前中止時伺服器端隨即停止生成）；替身沒有 response 時略過。"""
+    response = getattr(stream, "response", None)
+    close = getattr(response, "close", None) or getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception as e:
+        logging.debug(f"[openai] 關閉串流失敗：{e}")
+
+
+def _record_usage(model, usage):
+    """把回應的 usage（prompt / completion tokens）累加進指標。"""
+    if usage is None:
+        return
+    _record_tokens(model, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+
+
+def _record_tokens(model, prompt, completion):
+    if prompt:
+        OPENAI_TOKENS.inc(prompt, model=model, kind="prompt")
+    if completion:
+        OPENAI_TOKENS.inc(completion, model=model, kind="completion")
+
+
+def _estimate_prompt_tokens(messages, content_tokens=None):
+    """串流回應沒有 usage：訊息內容的本地估算（未提供時逐則計算）+ 每則 4 個格式 token。"""
+    if content_tokens is None:
+        content_tokens = sum(approx_tokens(m.get("content") or "") for m in messages)
+    return content_tokens + 4 * len(messages)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+GPT 輸入 token 預算：量測 prompt 各段（system 前綴、檢索段落、當日課程、使用者訊息與附加資料），
+總量超過 GPT_INPUT_TOKEN_BUDGET 時從優先度最低的段落開始截短。
+
+- 優先度 0 的段落（前綴、時間、使用者原始訊息）不截，預算只分配給其餘可截短的段落
+- 其餘數字越大越先截：檢索段落 → 附加資料（行程、附近館區）→ 課程詳細 → 課程摘要
+- 段落可設保留下限（floor）：當日已篩選課程是回答問題的依據，預算不足時也不會截到下限以下
+- 截短依行保留開頭，結尾附註說明；token 為 utils.tokens 的本地估算
+- 各段大小記錄在 /metrics（zoo_prompt_tokens{section}）與 log
+"""
+
+import logging
+
+from utils.metrics import registry
+from utils.tokens import approx_tokens, truncate_to_tokens
+
+# 截短順序（數字越大越先截）
+PRIORITY_FIXED = 0
+PRIORITY_SUMMARY = 1
+PRIORITY_DETAIL = 2
+PRIORITY_ATTACHMENT = 3
+PRIORITY_CONTEXT = 4
+
+TRIM_NOTE = "（以下因篇幅省略）"
+
+PROMPT_TOKENS = registry.histogram(
+    "zoo_prompt_tokens", "送往 GPT 的 prompt 各段估計 token 數（截短後）", ("section",),
+    buckets=(25, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000),
+)
+PROMPT_TRIMMED = registry.counter(
+    "zoo_prompt_trimmed_total", "超出輸入預算而截短的段落次數", ("section",),
+)
+
+
+class Section:
+    """prompt 的一段；text 可能被 fit_sections 就地截短。"""
+
+    __slots__ = ("name", "text", "priority", "tokens", "original_tokens", "floor")
+
+    def __init__(self, name, text, priority=PRIORITY_FIXED, tokens=None, floor=0):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority
+        # tokens 可直接指定（例如只量測、不輸出的模板文字）
+        self.tokens = approx_tokens(self.text) if tokens is None else tokens
+        self.original_tokens = self.tokens
+        # 截短後至少保留的 token 數（不超過原本大小）
+        self.floor = min(max(0, floor), self.tokens)
+
+    @property
+    def trimmed(self):
+        return self.tokens < self.original_tokens
+
+    def __repr__(self):
+        return f"Section({self.name!r}, {self.tokens}/{self.original_tokens} tokens, p={self.priority})"
+
+
+def total_tokens(sections):
+    return sum(s.tokens for s in sections)
+
+
+def fit_sections(sections, budget):
+    """
+    依優先度由低到高截短（同優先度時後面的段落先截），直到總量 ≤ budget；
+    固定段落不截，其餘段落最多截到各自的 floor。
+    回傳截短後的總 token 數（固定段落加上各段下限已超出預算時仍會大於 budget）。
+    """
+    total = total_tokens(sections)
+    if budget <= 0 or total <= budget:
+        return total
+    for section in sorted(reversed(sections), key=lambda s: -s.priority):
+        if total <= budget or section.priority == PRIORITY_FIXED:
+            break
+        allowed = section.tokens - (total - budget)
+        if allowed >= section.tokens or section.floor >= section.tokens:
+            continue
+        if section.floor and allowed <= section.floor:
+            # 依行截短時保留到達到下限的那一行
+            section.text = truncate_to_tokens(section.text, section.floor, TRIM_NOTE, at_least=True)
+        else:
+            section.text = truncate_to_tokens(section.text, max(0, allowed), TRIM_NOTE)
+        new_tokens = approx_tokens(section.text)
+        total -= section.tokens - new_tokens
+        section.tokens = new_tokens
+    return total
+
+
+def record_sections(sections, budget):
+    """把各段大小寫入 metrics 與 log，回傳 {段名: token 數}。"""
+    sizes = {}
+    for s in sections:
+        sizes[s.name] = sizes.get(s.name, 0) + s.tokens
+        if s.trimmed:
+            PROMPT_TRIMMED.inc(section=s.name)
+    for name, tokens in sizes.items():
+        PROMPT_TOKENS.observe(tokens, section=name)
+    total = sum(sizes.values())
+    trimmed = [s.name for s in sections if s.trimmed]
+    logging.info(
+        f"[prompt_budget] input≈{total}/{budget or '∞'} "
+        + " ".join(f"{name}={tokens}" for name, tokens in sizes.items())
+        + (f" trimmed={','.join(trimmed)}" if trimmed else "")
+    )
+    if budget and total > budget:
+        logging.warning(f"[prompt_budget] 固定段落與保留下限已超出輸入預算（≈{total} > {budget}）")
+    return sizes
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Prompt 參考資料檢索：把參觀資訊、館區、環教說明、課程細節切成段落，以字元 bigram BM25
+索引，每次只把與問題相關的前 k 段（在 token 預算內）放進 prompt。
+
+- 切段：參觀資訊依「=== 標題 ===」、環教說明依「## 標題」，過長的段落再依空行切開；
+  館區與課程細節一行一段
+- 索引隨資料版本重建（data_store.derive，名稱含課程目錄版本）
+- 課程總覽不在索引內：它固定放在 system prompt 前綴（回覆規則 A 需要原文）
+"""
+
+import re
+import math
+import unicodedata
+
+from services.data_store import data_store
+from utils.tokens import approx_tokens
+
+_SECTION_RE = re.compile(r'^===\s*(.+?)\s*===\s*$', re.MULTILINE)
+_HEADING_RE = re.compile(r'^##\s+(.+?)\s*$', re.MULTILINE)
+_BLANK_LINE_RE = re.compile(r'\n\s*\n')
+_WORD_RUN_RE = re.compile(r'\w+')
+
+_MAX_CHUNK_CHARS = 300      # 超過就依空行再切
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def char_bigrams(text):
+    """正規化後、不跨標點與空白的字元 bigram（單字元的片段保留本身）。"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    grams = []
+    for run in _WORD_RUN_RE.findall(text):
+        if len(run) == 1:
+            grams.append(run)
+        else:
+            grams.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+# ── 切段 ────────────────────────────────────────────────────────
+
+class Chunk:
+    """一段可檢索的參考資料；title 相同的段落在 prompt 中共用一個標題。"""
+
+    __slots__ = ("title", "text", "order", "tokens")
+
+    def __init__(self, title, text, order):
+        self.title = title
+        self.text = text
+        self.order = order           # 在原始資料中的順序，輸出時依此排列
+        self.tokens = approx_tokens(text)
+
+    def __repr__(self):
+        return f"Chunk({self.title!r}, {self.text[:20]!r}…)"
+
+
+def _split_long(body):
+    if len(body) <= _MAX_CHUNK_CHARS:
+        return [body]
+    return [p.strip() for p in _BLANK_LINE_RE.split(body) if p.strip()]
+
+
+def split_sections(text, heading_re, prefix):
+    """依標題切段，回傳 [(title, text)]；標題前的文字歸在 prefix。"""
+    matches = list(heading_re.finditer(text))
+    head = text[:matches[0].start()].strip() if matches else text.strip()
+    out = [(prefix, part) for part in _split_long(head)] if head else []
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = text[m.end():end].strip()
+        if body:
+            out += [(f"{prefix}：{m.group(1)}", part) for part in _split_long(body)]
+    return out
+
+
+def build_chunks(areas_text, notes_text, visitor_text, courses_text):
+    """各來源文字 → list[Chunk]（順序：參觀資訊、館區、環教說明、課程細節）。"""
+    pieces = split_sections(visitor_text, _SECTION_RE, "參觀資訊")
+    pieces += [("館區資料", line) for line in areas_text.splitlines() if line.strip()]
+    pieces += split_sections(notes_text, _HEADING_RE, "環境教育說明")
+    pieces += [("課程詳細資料", line) for line in courses_text.splitlines() if line.strip()]
+    return [Chunk(title, body, i) for i, (title, body) in enumerate(pieces)]
+
+
+# ── BM25 ────────────────────────────────────────────────────────
+
+class ContextIndex:
+    """字元 bigram BM25 倒排索引（唯讀，各請求共用）。"""
+
+    def __init__(self, chunks):
+        self.chunks = tuple(chunks)
+        self._postings = {}          # bigram → [(chunk idx, tf)]
+        lengths = []
+        for idx, chunk in enumerate(self.chunks):
+            counts = {}
+            for gram in char_bigrams(f"{chunk.title} {chunk.text}"):
+                counts[gram] = counts.get(gram, 0) + 1
+            for gram, tf in counts.items():
+                self._postings.setdefault(gram, []).append((idx, tf))
+            lengths.append(sum(counts.values()))
+        n = len(self.chunks)
+        avg = (sum(lengths) / n) if n else 1.0
+        # 每段的長度正規化項，查詢時不必重算
+        self._norms = [_BM25_K1 * (1 - _BM25_B + _BM25_B * length / avg) for length in lengths]
+        self._idf = {
+            gram: math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for gram, posting in self._postings.items()
+        }
+
+    def search(self, query):
+        """回傳 [(score, chunk idx)]，分數由高到低（只含至少命中一個 bigram 者）。"""
+        scores = {}
+        for gram in set(char_bigrams(query)):
+            posting = self._postings.get(gram)
+            if not posting:
+                continue
+            idf = self._idf[gram]
+            for idx, tf in posting:
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (_BM25_K1 + 1) / (tf + self._norms[idx])
+        return sorted(((s, i) for i, s in scores.items()), reverse=True)
+
+    def select(self, query, top_k, token_budget):
+        """依分數取前 top_k 段，總 token 不超過預算（放不下的跳過、改試下一段）。"""
+        picked, used = [], 0
+        for _, idx in self.search(query):
+            chunk = self.chunks[idx]
+            if used + chunk.tokens > token_budget:
+                continue
+            picked.append(chunk)
+            used += chunk.tokens
+            if len(picked) >= top_k:
+                break
+        return picked
+
+
+def render_chunks(chunks):
+    """依原始順序輸出，連續同標題的段落共用一個 [標題]。"""
+    lines, title = [], None
+    for chunk in sorted(chunks, key=lambda c: c.order):
+        if chunk.title != title:
+            if lines:
+                lines.append("")
+            lines.append(f"[{chunk.title}]")
+            title = chunk.title
+        lines.append(chunk.text)
+    return "\n".join(lines)
+
+
+def load_context_index(name, paths, version, texts):
+    """
+    依資料版本快取的索引。
+    paths 為其餘資料檔；version 為課程目錄版本；texts() 回傳 build_chunks 的四個參數。
+    """
+    return data_store.derive(name, paths, lambda: ContextIndex(build_chunks(*texts())), version)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+查詢解析：每則訊息只解析一次，產生唯讀的 ParsedQuery，路由、公休 / 開放時間查詢、課程篩選與
+GPT 請求都讀同一份結果，不再各自重跑相對日期與日期 regex。
+
+- 日期類（今天 / 2月18日 / 下週三 / 下個月）：預先編譯成單一 regex，finditer 一次取得所有命中，
+  再依原本各函式的優先規則挑選；單獨月份（十二月）只在公休查詢需要時才另外比對
+- 關鍵字類（觸發詞、查詢類型、票種、館名、館區）：沿用 query_router.scan_message 的 Aho-Corasick
+  掃描結果（由呼叫端傳入，本模組不依賴路由資料）
+"""
+
+import re
+from datetime import date, timedelta
+from typing import NamedTuple, Optional
+
+_WEEKDAY_ZH = ["週一", "週二", "週三", "週四", "週五", "週六", "週日"]
+
+# 相對日期；命中多個時依此順序優先（與原本逐一比對的結果相同）
+RELATIVE_OFFSETS = {
+    "今天": 0, "今日": 0,
+    "昨天": -1, "昨日": -1,
+    "明天": 1,  "明日": 1,
+    "後天": 2,  "前天": -2,
+}
+_RELATIVE_RANK = {kw: i for i, kw in enumerate(RELATIVE_OFFSETS)}
+_ZH_MONTHS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7,
+              "八": 8, "九": 9, "十": 10, "十一": 11, "十二": 12}
+_WEEK_CHARS = "一二三四五六日"
+
+# 各分支互不重疊（相對日期只含中文、日期以數字開頭、星期需「週/星期/禮拜」+ 星期字），
+# 一次 finditer 的結果與分別 search 相同
+_TEMPORAL_RE = re.compile(
+    r'(?P<relative>' + "|".join(RELATIVE_OFFSETS) + r')'
+    r'|(?P<month_day>(?P<md_month>\d{1,2})[月/](?P<md_day>\d{1,2})[日號]?)'
+    r'|(?P<week>(?P<week_prefix>下|這|本)?(?P<week_word>週|星期|禮拜)(?P<week_day>[一二三四五六日天]))'
+    r'|(?P<next_month>下個?月)'
+    r'|(?P<this_month>這個月|本月)'
+)
+# 單獨月份（十二月、3月）只在前面都沒有指定時才需要，且可能與日期樣式共用數字，另外比對
+_MONTH_RE = re.compile(r'(\d{1,2}|十[一二]?|[一二三四五六七八九])月(?!\s*\d)')
+
+# 開放時間查詢的場館（小寫比對，依序優先）
+_HOURS_VENUES = {
+    "遊客列車": "遊客列車",
+    "列車":     "遊客列車",
+    "酷cool":   "酷Cool節能屋",
+    "節能屋":   "酷Cool節能屋",
+    "動物展示": "動物展示",
+}
+
+
+class ClosureTarget(NamedTuple):
+    """公休查詢的目標：kind="day" 時看 date，kind="month" 時看 year / month。"""
+
+    kind: str
+    date: Optional[date] = None
+    year: Optional[int] = None
+    month: Optional[int] = None
+
+
+class ParsedQuery(NamedTuple):
+    """
+    一則訊息的解析結果（唯讀）。
+    date：特定日期（相對日期或 2/18），純星期查詢為 None
+    weekday：課程查詢的目標星期（相對日期 → 週X / 星期X → 由日期推算），無則 None
+    closure_target：公休查詢的目標日或月（另含 下週三、禮拜天、下個月、十二月），無則 None（= 今天）
+    route：關鍵字判定的分流（nearby / ticket / hours / … / course_date），都沒命中為 None
+    """
+
+    message: str
+    now: object
+    date: Optional[date] = None
+    weekday: Optional[str] = None
+    closure_target: Optional[ClosureTarget] = None
+    route: Optional[str] = None
+    triggers: frozenset = frozenset()     # 命中的觸發詞類別：nearby / plan
+    visitor_type: Optional[str] = None    # 參觀資訊查詢類型
+    area: Optional[int] = None            # 館區在 zoo_areas.csv 的順序
+    venue: Optional[str] = None           # 公休查詢的館名（別名已正規化）
+    hours_venue: Optional[str] = None     # 開放時間查詢的場館
+    ticket_venue: Optional[str] = None    # 票價查詢的專門館區（教育中心 / 遊客列車）
+    ticket_type: Optional[str] = None     # 特定票種
+    ticket_group: Optional[tuple] = None  # 票價篩選 (欄位, 值)，例如 ("eligible_group", "學生")
+    matches: object = None                # scan_message 的完整命中（MessageMatches）
+
+
+def _week_target(today, prefix, day_char):
+    wd = 6 if day_char == "天" else _WEEK_CHARS.index(day_char)
+    if prefix == "下":
+        return today - timedelta(days=today.weekday()) + timedelta(days=7 + wd)
+    if prefix in ("這", "本"):
+        return today - timedelta(days=today.weekday()) + timedelta(days=wd)
+    return today + timedelta(days=(wd - today.weekday()) % 7)
+
+
+def _month_target(today, token):
+    month = int(token) if token.isdigit() else _ZH_MONTHS[token]
+    if 1 <= month <= 12:
+        return ClosureTarget("month", year=today.year, month=month)
+    return None
+
+
+def parse_dates(message, now):
+    """訊息中的日期資訊 → (date, weekday, closure_target)。"""
+    today = now.date()
+    relative = month_day = explicit = week = None
+    next_month = this_month = False
+    for m in _TEMPORAL_RE.finditer(message):
+        kind = m.lastgroup
+        if kind == "relative":
+            kw = m.group("relative")
+            if relative is None or _RELATIVE_RANK[kw] < _RELATIVE_RANK[relative]:
+                relative = kw
+        elif kind == "month_day":
+            if month_day is None:
+                try:
+                    month_day = date(today.year, int(m.group("md_month")), int(m.group("md_day")))
+                except ValueError:
+                    month_day = False     # 只看第一個日期樣式；無效日期不再往後找
+        elif kind == "week":
+            if week is None:
+                week = (m.group("week_prefix"), m.group("week_day"))
+            # 課程查詢只認「週X / 星期X」，多個時取星期順序最前者
+            if m.group("week_word") != "禮拜" and m.group("week_day") != "天":
+                idx = _WEEK_CHARS.index(m.group("week_day"))
+                explicit = idx if explicit is None else min(explicit, idx)
+        elif kind == "next_month":
+            next_month = True
+        else:
+            this_month = True
+
+    if relative is not None:
+        target = today + timedelta(days=RELATIVE_OFFSETS[relative])
+        return target, _WEEKDAY_ZH[target.weekday()], ClosureTarget("day", target)
+    target = month_day or None
+    if explicit is not None:
+        weekday = _WEEKDAY_ZH[explicit]
+    else:
+        weekday = _WEEKDAY_ZH[target.weekday()] if target else None
+
+    if target:
+        closure = ClosureTarget("day", target)
+    elif week is not None:
+        closure = ClosureTarget("day", _week_target(today, *week))
+    elif next_month:
+        y, mo = (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1)
+        closure = ClosureTarget("month", year=y, month=mo)
+    elif this_month:
+        closure = ClosureTarget("month", year=today.year, month=today.month)
+    else:
+        m = _MONTH_RE.search(message) if "月" in message else None
+        closure = _month_target(today, m.group(1)) if m else None
+    return target, weekday, closure
+
+
+def _hours_venue(message):
+    lowered = message.lower()
+    for kw, venue in _HOURS_VENUES.items():
+        if kw in lowered:
+            return venue
+    return None
+
+
+def parse_query(message, now, matches=None):
+    """
+    解析訊息一次，回傳 ParsedQuery。
+    matches：query_router.scan_message 的結果；未提供時只解析日期（關鍵字欄位皆為 None）。
+    """
+    target_date, weekday, closure = parse_dates(message, now)
+    if matches is None:
+        return ParsedQuery(message, now, target_date, weekday, closure, hours_venue=_hours_venue(message))
+
+    triggers = frozenset(c for c in ("nearby", "plan") if matches.has(c))
+    area = matches.first("area")
+    visitor_type = matches.first("visitor")
+    if "nearby" in triggers and area is not None:
+        route = "nearby"
+    elif visitor_type:
+        route = visitor_type
+    elif weekday:
+        route = "course_date"
+    else:
+        route = None
+    return ParsedQuery(
+        message, now, target_date, weekday, closure,
+        route=route,
+        triggers=triggers,
+        visitor_type=visitor_type,
+        area=area,
+        venue=matches.first("closure_alias") or matches.first("closure_venue"),
+        hours_venue=_hours_venue(message),
+        ticket_venue=matches.first("ticket_venue"),
+        ticket_type=matches.first("ticket_specific"),
+        ticket_group=matches.first("ticket_filter"),
+        matches=matches,
+    )
@@ -10,79 +10,62 @@
   data/visitor_tickets.csv  — 票價與適用資格
   data/visitor_hours.csv    — 開放時間
   data/venue_closures.csv   — 館區公休排程
+  data/venue_holiday_closures.csv — 連假順延休館日
 """
 
 import os
 import re
 import csv
-import math
+import json
+import time
 import logging
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
+
+from services.data_store import data_store, parse_csv_rows, parse_raw_text
+from services.chatgpt_service import (
+    current_course_catalog,
+    date_label,
+    get_reply_and_interest,
+    load_courses_for_date,
+    load_courses_for_weekday,
+    load_courses_overview,
+)
+from services.closure_calendar import ClosureCalendar, load_holiday_closures
+from services.geo_index import GeoIndex
+from services.intent_classifier import get_intent_classifier
+from services.query_parser import parse_query
+from services.route_classifier import load_route_classifier
+from utils.aho_corasick import KeywordAutomaton
+from utils.metrics import registry
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 TW_TZ = timezone(timedelta(hours=8))
 
+ROUTE_LATENCY = registry.histogram(
+    "zoo_route_latency_seconds", "route_message / route_location 各分流處理時間", ("branch",),
+)
+INTEREST_LABELS = registry.counter(
+    "zoo_interest_labels_total", "回覆的興趣度標籤次數", ("label",),
+)
+ROUTE_CLASSIFIER_DECISIONS = registry.counter(
+    "zoo_route_classifier_decisions_total", "關鍵字漏接的訊息經分流分類器判定的結果（gpt = 仍交 GPT）", ("route",),
+)
+
 
 def _path(name):
     return os.path.join(PROJECT_ROOT, name)
 
 
-def _read_csv(path):
-    """讀取 CSV 回傳 list[dict]，缺失欄位填空字串（缺失值處理）。"""
-    rows = []
+def _read_csv(path, parser=parse_csv_rows):
+    """
+    讀取 CSV（經 data_store 快取），回傳唯讀的 tuple[dict]，缺失欄位填空字串。
+    回傳的 dict 為各請求共用，呼叫端不可修改。
+    """
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            for row in csv.DictReader(f):
-                # 缺失值：將 None 統一轉為空字串
-                rows.append({k: (v if v is not None else "") for k, v in row.items()})
+        return data_store.load(path, parser)
     except Exception as e:
         logging.error(f"_read_csv({path}) 失敗: {e}")
-    return rows
-
-
-# ── 課表資料有效範圍 ─────────────────────────────────────────────
-_COURSE_DATA_YEAR  = 2026
-_COURSE_DATA_MONTH = 2   # 目前只有二月課表
-
-_RELATIVE_OFFSETS = {
-    "今天": 0, "今日": 0,
-    "昨天": -1, "昨日": -1,
-    "明天": 1,  "明日": 1,
-    "後天": 2,  "前天": -2,
-}
-
-
-def _check_course_date_range(message, now_dt):
-    """
-    判斷訊息是否包含「超出課表範圍」的特定日期。
-    - 相對日期（今天/明天/昨天…）→ 計算實際日期後比對
-    - 明確日期（3/8、3月8日）→ 直接比對月份
-    - 純星期查詢（週六/週日）→ 不視為特定日期，不觸發
-    回傳 (True, '3月') 或 (False, None)
-    """
-    for kw, offset in _RELATIVE_OFFSETS.items():
-        if kw in message:
-            target = now_dt + timedelta(days=offset)
-            if target.year != _COURSE_DATA_YEAR or target.month != _COURSE_DATA_MONTH:
-                return True, f"{target.month}月"
-            return False, None
-
-    m = re.search(r'(\d{1,2})[月/](\d{1,2})[日號]?', message)
-    if m:
-        month = int(m.group(1))
-        if month != _COURSE_DATA_MONTH:
-            return True, f"{month}月"
-        return False, None
-
-    return False, None
-
-
-# ── 連假順延休館日 (月, 日): [館名, ...] ─────────────────────────
-_HOLIDAY_CLOSURES = {
-    (4,  7): ["教育中心", "大貓熊館"],
-    (9, 29): ["教育中心", "昆蟲館"],
-    (10,27): ["教育中心", "昆蟲館"],
-}
+    return ()
 
 
 # ── 關鍵字分類表 ────────────────────────────────────────────────
@@ -98,7 +81,7 @@ _VISITOR_KEYWORDS = {
     ],
     "closure": [
         "公休", "休館", "休息", "有開嗎", "今天開嗎",
-        "哪天休", "輪休", "閉館", "有沒有開",
+        "哪天休", "輪休", "閉館", "有沒有開", "館休", "哪些館休",
     ],
     "transport": [
         "交通", "怎麼去", "停車", "捷運", "公車", "怎麼搭",
@@ -120,20 +103,26 @@ _NEARBY_TRIGGERS = [
     "從這邊", "從這裡", "最近的館", "走去哪",
 ]
 
+_NEARBY_TOP_K = 10          # 每個館區預先計算的鄰近名次
+_OUTSIDE_PARK_M = 1500      # 最近地點超過此距離 → 視為不在園區內
+
+# 附近查詢中同時要求排行程 → 交 GPT 整合
+_PLAN_KEYWORDS = ["行程", "路線", "怎麼逛", "怎麼玩", "接下來"]
+
 
 # ── 工具函式 ────────────────────────────────────────────────────
 
-def _classify_visitor_query(message):
-    """偵測是否為參觀資訊查詢，回傳類型字串或 None。"""
-    for qtype, keywords in _VISITOR_KEYWORDS.items():
-        for kw in keywords:
-            if kw in message:
-                return qtype
-    return None
+def _classify_visitor_query(message, matches=None):
+    """偵測是否為參觀資訊查詢，回傳類型字串或 None（依 _VISITOR_KEYWORDS 順序優先）。"""
+    if matches is None:
+        matches = scan_message(message)
+    return matches.first("visitor")
 
 
-def _has_nearby_trigger(message):
-    return any(t in message for t in _NEARBY_TRIGGERS)
+def _has_nearby_trigger(message, matches=None):
+    if matches is None:
+        matches = scan_message(message)
+    return matches.has("nearby")
 
 
 def _parse_coords(coord_str):
@@ -144,75 +133,136 @@ def _parse_coords(coord_str):
     return None, None
 
 
-def _haversine_m(lat1, lon1, lat2, lon2):
-    """兩點間直線距離（公尺）。"""
-    R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    return 2 * R * math.asin(math.sqrt(a))
+def _parse_areas(csv_path):
+    """館區 CSV → 含座標與別名的館區 tuple（data_store parser）。"""
+    areas = []
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = row.get("name", "").strip()
+            if not name:
+                continue
+            lat, lon = _parse_coords(row.get("coordinates", ""))
+            if lat is None:
+                continue
+            aliases = [name]
+            if "穿山甲" in name:
+                aliases.append("穿山甲館")
+            if "大貓熊" in name:
+                aliases.append("大貓熊館")
+            if "鳥園" in name:
+                aliases.append("鳥園")
+            if "兩棲爬蟲" in name:
+                aliases += ["爬蟲館", "兩棲館", "兩棲爬蟲館"]
+            areas.append({
+                "name": name,
+                "aliases": aliases,
+                "lat": lat,
+                "lon": lon,
+                "category": row.get("category", "").strip(),
+            })
+    return tuple(areas)
 
 
 def _load_areas(csv_path):
-    """讀取館區 CSV，回傳含座標與別名的館區清單。"""
-    areas = []
+    """讀取館區 CSV（經 data_store 快取），回傳含座標與別名的館區清單。"""
     try:
-        with open(csv_path, "r", encoding="utf-8") as f:
-            for row in csv.DictReader(f):
-                name = row.get("name", "").strip()
-                if not name:
-                    continue
-                lat, lon = _parse_coords(row.get("coordinates", ""))
-                if lat is None:
-                    continue
-                aliases = [name]
-                if "穿山甲" in name:
-                    aliases.append("穿山甲館")
-                if "大貓熊" in name:
-                    aliases.append("大貓熊館")
-                if "鳥園" in name:
-                    aliases.append("鳥園")
-                if "兩棲爬蟲" in name:
-                    aliases += ["爬蟲館", "兩棲館", "兩棲爬蟲館"]
-                areas.append({
-                    "name": name,
-                    "aliases": aliases,
-                    "lat": lat,
-                    "lon": lon,
-                    "category": row.get("category", "").strip(),
-                })
+        return data_store.load(csv_path, _parse_areas)
     except Exception as e:
         logging.error(f"_load_areas 失敗: {e}")
-    return areas
+    return ()
 
 
-def _extract_area_from_message(message, areas):
-    """從訊息中偵測館區名稱，回傳 area dict 或 None。"""
-    for area in areas:
-        for alias in area["aliases"]:
-            if alias in message:
-                return area
+def _extract_area_from_message(parsed, areas):
+    """訊息中偵測到的館區（parsed.area），回傳 area dict 或 None（館區清單順序優先）。"""
+    idx = parsed.area
+    if idx is not None and idx < len(areas):
+        return areas[idx]
     return None
 
 
-def _nearby_text(current_area, all_areas, top_n=6):
-    """計算距離，回傳附近館區文字。"""
-    lat0, lon0 = current_area["lat"], current_area["lon"]
-    dists = []
-    for area in all_areas:
-        if area["name"] == current_area["name"]:
+# ── 空間索引（附近館區 / 位置訊息） ─────────────────────────────
+
+def _build_area_geo_index(csv_path):
+    """館區座標 → GeoIndex（data_store parser，預先算好距離矩陣與鄰近清單）。"""
+    return GeoIndex(_load_areas(csv_path), top_k=_NEARBY_TOP_K)
+
+
+def _load_facilities(json_path):
+    """設施 JSON（餐廳、廁所等，格式見 data/README.md）→ 地點清單；檔案不存在回傳空清單。"""
+    if not os.path.exists(json_path):
+        return []
+    with open(json_path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    points = []
+    for item in items:
+        try:
+            points.append({
+                "name": item["name"],
+                "lat": float(item["latitude"]),
+                "lon": float(item["longitude"]),
+                "kind": item.get("type", "設施"),
+            })
+        except (KeyError, TypeError, ValueError):
             continue
-        d = _haversine_m(lat0, lon0, area["lat"], area["lon"])
-        dists.append((d, area["name"]))
-    dists.sort(key=lambda x: x[0])
+    return points
+
+
+def _poi_geo_index(config):
+    """館區 + 設施的空間索引，供任意座標查詢（依兩個檔案版本快取）。"""
+    areas_path = _path("data/zoo_areas.csv")
+    facilities_path = _path(getattr(config, "FACILITIES_JSON_PATH", "data/facilities.json"))
+
+    def build():
+        points = [dict(a, kind="館區") for a in _load_areas(areas_path)]
+        points += _load_facilities(facilities_path)
+        return GeoIndex(points, top_k=_NEARBY_TOP_K)
+
+    return data_store.derive("poi_geo_index", (areas_path, facilities_path), build)
+
+
+def _format_distance(d):
+    return f"{int(d)}公尺" if d < 1000 else f"{d / 1000:.1f}公里"
+
+
+def _nearby_text(current_area, all_areas, top_n=6):
+    """查表取得鄰近館區，回傳附近館區文字。"""
+    areas_path = _path("data/zoo_areas.csv")
+    if all_areas is _load_areas(areas_path):
+        index = data_store.load(areas_path, _build_area_geo_index)
+    else:
+        index = GeoIndex(all_areas, top_k=top_n)
+    idx = index.position(current_area["name"])
     lines = [f"距離「{current_area['name']}」由近到遠的館區："]
-    for i, (d, name) in enumerate(dists[:top_n], 1):
-        dist_str = f"{int(d)}公尺" if d < 1000 else f"{d / 1000:.1f}公里"
-        lines.append(f"{i}. {name}（約{dist_str}）")
+    for i, (d, area) in enumerate(index.neighbours(idx, top_n), 1):
+        lines.append(f"{i}. {area['name']}（約{_format_distance(d)}）")
     return "\n".join(lines)
 
 
+def route_location(lat, lon, config, top_n=6):
+    """
+    位置訊息（LINE LocationMessage）→ 最近的館區與設施，回傳 (reply_text, interest_label)。
+    """
+    started = time.perf_counter()
+    try:
+        return _route_location(lat, lon, config, top_n)
+    finally:
+        ROUTE_LATENCY.observe(time.perf_counter() - started, branch="location")
+
+
+def _route_location(lat, lon, config, top_n):
+    index = _poi_geo_index(config)
+    nearest = index.nearest(lat, lon, top_n)
+    if not nearest:
+        return "目前沒有館區座標資料，無法計算距離。", "low_interest"
+    lines = ["距離您目前位置由近到遠："]
+    for i, (d, point) in enumerate(nearest, 1):
+        kind = f"［{point['kind']}］" if point.get("kind") not in (None, "館區") else ""
+        lines.append(f"{i}. {kind}{point['name']}（約{_format_distance(d)}）")
+    if nearest[0][0] > _OUTSIDE_PARK_M:
+        lines.insert(0, "您目前似乎不在動物園內，以下距離僅供參考。")
+    return "\n".join(lines), "low_interest"
+
+
 # ── CSV 票價查詢 ─────────────────────────────────────────────────
 
 # 關鍵字 → (搜尋欄位, 比對字串)，依序嘗試，命中即篩選
@@ -234,21 +284,34 @@ _TICKET_FILTER = [
 ]
 
 
+# 票價查詢中的專門館區（依序優先）
+_TICKET_VENUES = [
+    (["教育中心"],                   "教育中心"),
+    (["遊客列車", "列車", "車資"],   "遊客列車"),
+]
+
+# 特定票種查詢：關鍵字 → 票種，依序優先
+_SPECIFIC_KEYWORDS = [
+    (["臺北市民", "市民票", "市民門票"],   "臺北市民票"),
+    (["優待票", "學生票", "兒童票", "優待"], "優待票"),
+    (["普通票"],                            "普通票"),
+    (["團體票", "團體"],                    "團體票"),
+    (["免票", "免費入場", "哪些人免費"],    "免票"),
+]
+
+
 _TICKET_URL = "https://www.zoo.gov.taipei/cp.aspx?n=763493FD7ECCAA11&s=F3BC09EC36168CB6"
 
 # 主要票種顯示順序（入園門票摘要用）
 _MAIN_TICKET_TYPES = ["普通票", "臺北市民票", "優待票", "團體票"]
 
 
-def _query_tickets(message, tickets_path):
+def _parse_tickets(path):
     """
-    從 visitor_tickets.csv 查詢票價。
-    優先順序：教育中心 > 遊客列車 > 特定票種 > 一般摘要
-    一般摘要：每種票型只顯示一次（去重），附官網連結。
+    visitor_tickets.csv 前處理（data_store parser）：
+    price → 整數，缺失年齡欄位保留 None。
     """
-    rows = _read_csv(tickets_path)
-
-    # 資料前處理：price → 整數，缺失年齡欄位保留 None
+    rows = parse_csv_rows(path)
     for row in rows:
         try:
             row["_price"] = int(row["price"])
@@ -256,9 +319,20 @@ def _query_tickets(message, tickets_path):
             row["_price"] = -1    # 異常值標記
         row["_age_min"] = float(row["age_min"]) if row["age_min"] else None
         row["_age_max"] = float(row["age_max"]) if row["age_max"] else None
+    return rows
+
+
+def _query_tickets(parsed, tickets_path):
+    """
+    從 visitor_tickets.csv 查詢票價。
+    優先順序：教育中心 > 遊客列車 > 特定票種 > 一般摘要
+    一般摘要：每種票型只顯示一次（去重），附官網連結。
+    """
+    rows = _read_csv(tickets_path, _parse_tickets)
+    venue = parsed.ticket_venue
 
     # ── 教育中心專門查詢 ──────────────────────────────────────────
-    if "教育中心" in message:
+    if venue == "教育中心":
         filtered = [r for r in rows if r["venue"] == "教育中心"
                     and r["ticket_type"] in ("普通票", "優待票")]
         seen = set()
@@ -270,7 +344,7 @@ def _query_tickets(message, tickets_path):
         return "\n".join(lines)
 
     # ── 遊客列車專門查詢 ──────────────────────────────────────────
-    if any(kw in message for kw in ["遊客列車", "列車", "車資"]):
+    if venue == "遊客列車":
         filtered = [r for r in rows if r["venue"] == "遊客列車"
                     and r["ticket_type"] == "車資"]
         lines = ["遊客列車："]
@@ -279,37 +353,28 @@ def _query_tickets(message, tickets_path):
         return "\n".join(lines)
 
     # ── 特定票種查詢（偵測訊息中提及的票種） ──────────────────────
-    _SPECIFIC_KEYWORDS = [
-        (["臺北市民", "市民票", "市民門票"],   "臺北市民票"),
-        (["優待票", "學生票", "兒童票", "優待"], "優待票"),
-        (["普通票"],                            "普通票"),
-        (["團體票", "團體"],                    "團體票"),
-        (["免票", "免費入場", "哪些人免費"],    "免票"),
-    ]
-    for keywords, ticket_type in _SPECIFIC_KEYWORDS:
-        if any(kw in message for kw in keywords):
-            filtered = [r for r in rows
-                        if r["venue"] == "入園" and r["ticket_type"] == ticket_type]
-            if not filtered:
-                break
-            price = filtered[0]["_price"]
-            price_str = "免費" if price == 0 else f"{price}元"
-
-            if ticket_type == "免票":
-                lines = ["免票（入園門票）適用對象："]
-                for row in filtered:
-                    lines.append(f"- {row['eligible_group']}")
-            elif len(filtered) > 1:
-                # 同票種有多種適用對象（如優待票）
-                lines = [f"{ticket_type}：{price_str}", "適用對象："]
-                for row in filtered:
-                    lines.append(f"- {row['eligible_group']}")
-            else:
-                lines = [f"{ticket_type}：{price_str}",
-                         f"適用：{filtered[0]['eligible_group']}"]
-
-            lines += ["", "詳細資格請至官網查詢：", _TICKET_URL]
-            return "\n".join(lines)
+    ticket_type = parsed.ticket_type
+    filtered = [r for r in rows
+                if r["venue"] == "入園" and r["ticket_type"] == ticket_type] if ticket_type else []
+    if filtered:
+        price = filtered[0]["_price"]
+        price_str = "免費" if price == 0 else f"{price}元"
+
+        if ticket_type == "免票":
+            lines = ["免票（入園門票）適用對象："]
+            for row in filtered:
+                lines.append(f"- {row['eligible_group']}")
+        elif len(filtered) > 1:
+            # 同票種有多種適用對象（如優待票）
+            lines = [f"{ticket_type}：{price_str}", "適用對象："]
+            for row in filtered:
+                lines.append(f"- {row['eligible_group']}")
+        else:
+            lines = [f"{ticket_type}：{price_str}",
+                     f"適用：{filtered[0]['eligible_group']}"]
+
+        lines += ["", "詳細資格請至官網查詢：", _TICKET_URL]
+        return "\n".join(lines)
 
     # ── 一般票價查詢：每種票型去重，各顯示一次 ──────────────────
     main_rows = [r for r in rows
@@ -331,22 +396,10 @@ def _query_tickets(message, tickets_path):
 
 # ── CSV 開放時間查詢 ──────────────────────────────────────────────
 
-def _query_hours(message, hours_path):
-    """從 visitor_hours.csv 精確查詢開放時間。"""
+def _query_hours(parsed, hours_path):
+    """從 visitor_hours.csv 精確查詢開放時間（場館依 parsed.hours_venue）。"""
     rows = _read_csv(hours_path)
-
-    venue_keywords = {
-        "遊客列車": "遊客列車",
-        "列車":     "遊客列車",
-        "酷cool":   "酷Cool節能屋",
-        "節能屋":   "酷Cool節能屋",
-        "動物展示": "動物展示",
-    }
-    target = None
-    for kw, venue in venue_keywords.items():
-        if kw.lower() in message.lower():
-            target = venue
-            break
+    target = parsed.hours_venue
 
     filtered = [r for r in rows if target in r["venue"]] if target \
         else [r for r in rows if r["venue"] in ("動物園", "動物展示")]
@@ -373,83 +426,190 @@ _CLOSURE_ALIASES = {
     "新光特展館": "大貓熊館",
 }
 
+_WEEKDAY_NAMES = ["週一", "週二", "週三", "週四", "週五", "週六", "週日"]
+
+
+def _closure_calendar(now_dt):
+    """公休日曆（依公休規則 / 連假順延兩個檔案版本快取）。"""
+    closures_path = _path("data/venue_closures.csv")
+    holidays_path = _path("data/venue_holiday_closures.csv")
+    return data_store.derive(
+        "closure_calendar", (closures_path, holidays_path),
+        lambda: ClosureCalendar(
+            _read_csv(closures_path),
+            load_holiday_closures(holidays_path),
+            preload_years=(now_dt.year, now_dt.year + 1),
+        ),
+    )
+
+
+def _day_label(d):
+    return f"{d.month}月{d.day}日（{_WEEKDAY_NAMES[d.weekday()]}）"
 
-def _calc_closed(row, date):
-    """依 venue_closures.csv 一筆資料計算 date 是否公休。"""
-    if (date.month, date.day) in _HOLIDAY_CLOSURES:
-        if row["venue_name"] in _HOLIDAY_CLOSURES[(date.month, date.day)]:
-            return True
-    day_map = {"週一": 0, "週二": 1, "週三": 2, "週四": 3,
-               "週五": 4, "週六": 5, "週日": 6}
-    closure_day = day_map.get(row.get("day_of_week", ""), -1)
-    wd = date.weekday()
-    if row["closure_type"] == "weekly":
-        return wd == closure_day
-    if row["closure_type"] == "monthly" and wd == closure_day:
-        try:
-            return (date.day - 1) // 7 + 1 == int(row["week_number"])
-        except (ValueError, TypeError):
-            pass
-    return False
 
+def _closure_rule_text(row):
+    week = f"第{row['week_number']}個" if row.get("week_number") else "每"
+    return (f"每月{week}{row['day_of_week']}公休"
+            if row["closure_type"] == "monthly"
+            else f"每{row['day_of_week']}公休")
 
-def _query_closure(message, closures_path, now_dt):
+
+def _query_closure(parsed, closures_path):
     """
-    從 venue_closures.csv 查詢館區公休。
-    含特定館名 → 即時計算今天是否公休；否則 → 回傳完整公休表。
+    從公休日曆查詢館區公休（規則與連假順延已預先展開成每日位元圖）。
+    - 特定館名 + 日期（預設今天）→ 當天是否公休
+    - 特定館名 + 月份 → 該月所有公休日
+    - 無館名 + 日期 → 當天公休的館區；無館名 + 月份 → 各館該月公休日
+    - 皆未指定 → 完整公休表（含今日狀態）
     """
     rows = _read_csv(closures_path)
-    weekday_names = ["週一", "週二", "週三", "週四", "週五", "週六", "週日"]
-    today_str = f"{now_dt.month}月{now_dt.day}日（{weekday_names[now_dt.weekday()]}）"
-
-    # 偵測訊息中的館名（含別名正規化）
-    target_venue = None
-    for alias, canonical in _CLOSURE_ALIASES.items():
-        if alias in message:
-            target_venue = canonical
-            break
-    if not target_venue:
-        for row in rows:
-            if row["venue_name"] in message:
-                target_venue = row["venue_name"]
-                break
+    calendar = _closure_calendar(parsed.now)
+    today = parsed.now.date()
+    today_str = _day_label(today)
+    target = parsed.closure_target
+
+    # 訊息中的館名（含別名正規化；別名優先，其次依 CSV 順序）
+    target_venue = parsed.venue
+
+    if target and target.kind == "month":
+        first = date(target.year, target.month, 1)
+        last = (date(first.year + first.month // 12, first.month % 12 + 1, 1) - timedelta(days=1))
+        venues = [target_venue] if target_venue else list(calendar.venues)
+        if target_venue and not calendar.rule(target_venue):
+            return f"「{target_venue}」無固定公休日，全年正常開放。"
+        lines = [f"【{first.month}月館區公休日】"]
+        for venue in venues:
+            days = calendar.closed_days(venue, first, last)
+            days_str = "、".join(_day_label(d) for d in days) if days else "無"
+            lines.append(f"- {venue}：{days_str}")
+        if target_venue:
+            lines.append(f"公休規則：{_closure_rule_text(calendar.rule(target_venue))}")
+        return "\n".join(lines)
+
+    day = target.date if target else today
 
     if target_venue:
-        target_rows = [r for r in rows if r["venue_name"] == target_venue]
-        if not target_rows:
+        row = calendar.rule(target_venue)
+        if not row:
             return f"「{target_venue}」無固定公休日，全年正常開放。"
-        row = target_rows[0]
-        closed = _calc_closed(row, now_dt)
+        closed = calendar.is_closed(target_venue, day)
         special = f"（開放時間 {row['special_hours']}）" if row.get("special_hours") else ""
-        week = f"第{row['week_number']}個" if row.get("week_number") else "每"
-        status = "今日公休，建議改天再來。" if closed else "今日正常開放！"
-        return (f"「{target_venue}」{status}{special}\n"
-                f"公休規則：每月{week}{row['day_of_week']}公休"
-                if row["closure_type"] == "monthly"
-                else f"「{target_venue}」{status}{special}\n"
-                     f"公休規則：每{row['day_of_week']}公休")
-
-    # 無特定館名 → 完整公休表
+        if day == today:
+            status = "今日公休，建議改天再來。" if closed else "今日正常開放！"
+        else:
+            status = f"{_day_label(day)}公休，建議改天再來。" if closed else f"{_day_label(day)}正常開放！"
+        return f"「{target_venue}」{status}{special}\n公休規則：{_closure_rule_text(row)}"
+
+    if day != today:
+        closed_venues = calendar.closed_venues(day)
+        if not closed_venues:
+            return f"{_day_label(day)}各館區皆正常開放！"
+        lines = [f"{_day_label(day)}公休的館區："]
+        lines += [f"- {venue}" for venue in closed_venues]
+        return "\n".join(lines)
+
+    # 無特定館名與日期 → 完整公休表
     lines = [f"【館區公休時間表】（今天：{today_str}）"]
     for row in rows:
-        closed = _calc_closed(row, now_dt)
+        closed = calendar.is_closed(row["venue_name"], today)
         status = "今日公休" if closed else "今日開放"
         special = f"　開放時間 {row['special_hours']}" if row.get("special_hours") else ""
-        week = f"第{row['week_number']}個" if row.get("week_number") else "每"
-        rule = (f"每月{week}{row['day_of_week']}公休"
-                if row["closure_type"] == "monthly"
-                else f"每{row['day_of_week']}公休")
-        lines.append(f"- {row['venue_name']}：{rule}{special}（{status}）")
+        lines.append(f"- {row['venue_name']}：{_closure_rule_text(row)}{special}（{status}）")
     return "\n".join(lines)
 
 
+# ── 關鍵字自動機（一次掃描完成所有比對） ─────────────────────────
+
+class MessageMatches:
+    """
+    scan_message 的結果：{類別: [(rank, start, value, pattern), ...]}。
+    rank 為原本逐一比對時的優先順序，first() 取 rank 最小者以維持既有優先規則。
+    """
+
+    __slots__ = ("hits",)
+
+    def __init__(self, hits):
+        self.hits = hits
+
+    def has(self, category):
+        return category in self.hits
+
+    def first(self, category):
+        """該類別優先順序最高的命中值，無則 None。"""
+        items = self.hits.get(category)
+        if not items:
+            return None
+        return min(items, key=lambda h: (h[0], h[1]))[2]
+
+    def positions(self, category):
+        """該類別所有命中 [(start, pattern, value), ...]，依位置排序。"""
+        return sorted((h[1], h[3], h[2]) for h in self.hits.get(category, ()))
+
+
+def _add_static_keywords(ac):
+    """靜態關鍵字表：觸發詞、查詢類型、票價篩選、公休別名。"""
+    for rank, kw in enumerate(_NEARBY_TRIGGERS):
+        ac.add(kw, ("nearby", rank, kw))
+    for rank, kw in enumerate(_PLAN_KEYWORDS):
+        ac.add(kw, ("plan", rank, kw))
+    for rank, (qtype, keywords) in enumerate(_VISITOR_KEYWORDS.items()):
+        for kw in keywords:
+            ac.add(kw, ("visitor", rank, qtype))
+    for rank, (keywords, venue) in enumerate(_TICKET_VENUES):
+        for kw in keywords:
+            ac.add(kw, ("ticket_venue", rank, venue))
+    for rank, (keywords, ticket_type) in enumerate(_SPECIFIC_KEYWORDS):
+        for kw in keywords:
+            ac.add(kw, ("ticket_specific", rank, ticket_type))
+    for rank, (keywords, field, value) in enumerate(_TICKET_FILTER):
+        for kw in keywords:
+            ac.add(kw, ("ticket_filter", rank, (field, value)))
+    for rank, (alias, canonical) in enumerate(_CLOSURE_ALIASES.items()):
+        ac.add(alias, ("closure_alias", rank, canonical))
+
+
+def _build_automaton(areas_path, closures_path):
+    """靜態關鍵字 + 資料檔中的館區別名與公休館名，編成單一自動機。"""
+    ac = KeywordAutomaton()
+    _add_static_keywords(ac)
+    for rank, area in enumerate(_load_areas(areas_path)):
+        for alias in area["aliases"]:
+            ac.add(alias, ("area", rank, rank))
+    for rank, row in enumerate(_read_csv(closures_path)):
+        if row.get("venue_name"):
+            ac.add(row["venue_name"], ("closure_venue", rank, row["venue_name"]))
+    return ac.build()
+
+
+def _keyword_automaton():
+    """依館區 / 公休資料版本快取的自動機（資料檔更新時自動重建）。"""
+    areas_path = _path("data/zoo_areas.csv")
+    closures_path = _path("data/venue_closures.csv")
+    return data_store.derive(
+        "keyword_automaton", (areas_path, closures_path),
+        lambda: _build_automaton(areas_path, closures_path),
+    )
+
+
+def scan_message(message):
+    """掃描訊息一次，回傳所有類別的命中（含位置）。"""
+    hits = {}
+    for start, pattern, (category, rank, value) in _keyword_automaton().scan(message):
+        hits.setdefault(category, []).append((rank, start, value, pattern))
+    return MessageMatches(hits)
+
+
+def parse_message(message, now_dt):
+    """關鍵字掃描 + 日期解析，回傳唯讀的 ParsedQuery（每則訊息只呼叫一次）。"""
+    return parse_query(message, now_dt, scan_message(message))
+
+
 # ── visitor_info.txt 章節讀取（交通/遊園須知/建議行程） ──────────
 
 def _load_section(file_path, section_marker):
     """讀取 visitor_info.txt 特定章節（不含標題行）。"""
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
+        content = data_store.load(file_path, parse_raw_text)
         start = content.find(section_marker)
         if start == -1:
             return "(找不到相關資訊)"
@@ -462,18 +622,18 @@ def _load_section(file_path, section_marker):
 
 # ── 處理各類查詢（統一入口） ─────────────────────────────────────
 
-def _handle_visitor_query(query_type, visitor_info_path, message, now_dt):
+def _handle_visitor_query(query_type, visitor_info_path, parsed):
     """依查詢類型呼叫對應的 CSV 或 txt 查詢函式。"""
     tickets_path  = _path("data/visitor_tickets.csv")
     hours_path    = _path("data/visitor_hours.csv")
     closures_path = _path("data/venue_closures.csv")
 
     if query_type == "ticket":
-        return _query_tickets(message, tickets_path)
+        return _query_tickets(parsed, tickets_path)
     if query_type == "hours":
-        return _query_hours(message, hours_path)
+        return _query_hours(parsed, hours_path)
     if query_type == "closure":
-        return _query_closure(message, closures_path, now_dt)
+        return _query_closure(parsed, closures_path)
     if query_type == "transport":
         return _load_section(visitor_info_path, "=== 交通及停車 ===")
     if query_type == "rules":
@@ -483,95 +643,171 @@ def _handle_visitor_query(query_type, visitor_info_path, message, now_dt):
     return "(查詢類型不明)"
 
 
+def _classify_route(message, config):
+    """
+    關鍵字表漏接的訊息交給分流分類器；回傳分流名稱，
+    未啟用、無模型、判定 open_ended 或信心低於 ROUTE_CLASSIFIER_THRESHOLD 時回傳 None。
+    """
+    if not getattr(config, "ROUTE_CLASSIFIER_ENABLED", False):
+        return None
+    classifier = load_route_classifier(_path(config.ROUTE_CLASSIFIER_PATH))
+    if classifier is None:
+        return None
+    route, confidence = classifier.predict(message)
+    if route == "open_ended" or confidence < config.ROUTE_CLASSIFIER_THRESHOLD:
+        ROUTE_CLASSIFIER_DECISIONS.inc(route="gpt")
+        return None
+    ROUTE_CLASSIFIER_DECISIONS.inc(route=route)
+    return route
+
+
+# ── 預熱 ─────────────────────────────────────────────────────────
+
+def warm_up(config, now_dt=None):
+    """預熱：讀入路由用的 CSV / 文字檔，建好關鍵字自動機、空間索引、公休日曆與分流分類器。"""
+    if now_dt is None:
+        now_dt = datetime.now(TW_TZ)
+    areas_path = _path("data/zoo_areas.csv")
+    parse_message("", now_dt)
+    data_store.load(areas_path, _build_area_geo_index)
+    _poi_geo_index(config)
+    _closure_calendar(now_dt)
+    _read_csv(_path("data/visitor_tickets.csv"), _parse_tickets)
+    _read_csv(_path("data/visitor_hours.csv"))
+    data_store.load(_path("data/visitor_info.txt"), parse_raw_text)
+    if getattr(config, "ROUTE_CLASSIFIER_ENABLED", False):
+        load_route_classifier(_path(config.ROUTE_CLASSIFIER_PATH))
+
+
 # ── 主路由函式 ───────────────────────────────────────────────────
 
 def route_message(message, config, now_str="", now_dt=None):
     """
     主路由：依查詢類型分流處理，回傳 (reply_text, interest_label)。
+    啟用本地意圖分類時，分類與分流同時進行，取得結果後取代分流給的標籤。
+    GPT 分流的延遲預算（GPT_LATENCY_BUDGET_SECONDS）從這裡起算。
+    各分流的延遲與興趣度計數記錄在 /metrics。
+    """
+    started = time.perf_counter()
+    budget = float(getattr(config, "GPT_LATENCY_BUDGET_SECONDS", 0) or 0)
+    deadline = time.monotonic() + budget if budget > 0 else None
+    classifier = get_intent_classifier(config)
+    pending = classifier.submit(message) if classifier else None
+    branch = "error"
+    try:
+        reply, interest, branch = _route_message(message, config, now_str, now_dt, deadline)
+    finally:
+        ROUTE_LATENCY.observe(time.perf_counter() - started, branch=branch)
+    if classifier:
+        predicted = classifier.wait(pending)
+        if predicted:
+            interest = predicted[0]
+    INTEREST_LABELS.inc(label=interest or "none")
+    return reply, interest
+
+
+def _route_message(message, config, now_str="", now_dt=None, deadline=None):
+    """
+    回傳 (reply_text, interest_label, branch)。
 
     優先順序：
       1. 附近館區查詢（含行程排列）
       2. 參觀資訊查詢（票價/時間/公休/交通/遊園須知/建議行程）
       3. 課程日期查詢（Python 篩選，直接回應）
-      4. 其他語意查詢 → GPT
+      4. 關鍵字都沒命中 → 分流分類器判定，信心足夠時走 2 / 1 / 課程總覽
+      5. 其他語意查詢 → GPT
     """
-    from services.chatgpt_service import (
-        detect_query_weekday,
-        load_courses_for_weekday,
-        get_reply_and_interest,
-    )
-
     if now_dt is None:
         now_dt = datetime.now(TW_TZ)
 
     areas_path = _path("data/zoo_areas.csv")
     visitor_info_path = _path("data/visitor_info.txt")
-    courses_path = _path(getattr(config, "COURSES_CSV_PATH", "data/courses-February.csv"))
+
+    # 解析一次（關鍵字命中、日期、星期、館名、票種），以下各分流與 GPT 都讀這份結果
+    parsed = parse_message(message, now_dt)
 
     # ── 1. 附近館區查詢 ──────────────────────────────────────────
-    if _has_nearby_trigger(message):
+    if parsed.route == "nearby":
         areas = _load_areas(areas_path)
-        current_area = _extract_area_from_message(message, areas)
+        current_area = _extract_area_from_message(parsed, areas)
         if current_area:
             nearby = _nearby_text(current_area, areas)
             # 若同時要求排行程 → 附加建議行程資訊，讓 GPT 整合後回覆
-            if any(kw in message for kw in ["行程", "路線", "怎麼逛", "怎麼玩", "接下來"]):
+            if "plan" in parsed.triggers:
                 itinerary = _load_section(visitor_info_path, "=== 建議行程 ===")
-                # 把距離資訊注入 message，交 GPT 整合
-                augmented_msg = (
-                    f"{message}\n\n"
-                    f"[系統提供：{nearby}]\n\n"
-                    f"[建議行程參考]\n{itinerary}"
+                # 距離資訊與行程附加在 message 後，交 GPT 整合（計入輸入預算）
+                reply, interest = get_reply_and_interest(
+                    message, config, now_str, deadline=deadline, parsed=parsed,
+                    attachments=[("系統提供：附近館區", nearby), ("建議行程參考", itinerary)],
                 )
-                reply, interest = get_reply_and_interest(augmented_msg, config, now_str)
-                return reply, interest or "low_interest"
-            return nearby, "low_interest"
+                return reply, interest or "low_interest", "nearby_plan"
+            return nearby, "low_interest", "nearby"
 
     # ── 2. 參觀資訊查詢 ───────────────────────────────────────────
-    query_type = _classify_visitor_query(message)
-    if query_type:
+    def visitor_reply(query_type):
         # 行程查詢：交 GPT 篩選相關部分，避免整段文字傾倒
         if query_type == "itinerary":
             itinerary = _load_section(visitor_info_path, "=== 建議行程 ===")
-            augmented_msg = f"{message}\n\n[建議行程資料]\n{itinerary}"
-            reply, interest = get_reply_and_interest(augmented_msg, config, now_str)
-            return reply, "maybe_interest"
-        reply = _handle_visitor_query(query_type, visitor_info_path, message, now_dt)
-        return reply, "low_interest"
+            reply, interest = get_reply_and_interest(
+                message, config, now_str, deadline=deadline, parsed=parsed,
+                attachments=[("建議行程資料", itinerary)],
+            )
+            return reply, "maybe_interest", "itinerary"
+        reply = _handle_visitor_query(query_type, visitor_info_path, parsed)
+        return reply, "low_interest", "visitor"
+
+    if parsed.visitor_type:
+        return visitor_reply(parsed.visitor_type)
 
     # ── 3. 課程日期查詢（Python 直接篩選回應） ────────────────────
-    target_weekday = detect_query_weekday(message, now_dt)
-    if target_weekday:
-        # 檢查一：明確日期或相對日期（今天/明天…）超出課表範圍
-        out_of_range, out_month = _check_course_date_range(message, now_dt)
-        if out_of_range:
+    target_weekday = parsed.weekday
+    catalog = current_course_catalog(config) if target_weekday else None
+    if catalog is not None:
+        # 課表涵蓋範圍：特定日期（2/18、明天…）看該日期所在月份，純星期查詢看本月
+        target_date = parsed.date
+        check_date = target_date or now_dt.date()
+        if not catalog.covers(check_date):
             return (
                 f"很抱歉，由於系統尚未更新課表，"
-                f"{out_month}的課程資訊請至官網查詢喔！\n"
+                f"{check_date.month}月的課程資訊請至官網查詢喔！\n"
                 f"官網：https://www.zoo.gov.taipei"
-            ), "low_interest"
-
-        # 檢查二：純星期查詢（週X），但現在已不在課表月份
-        # 若訊息含明確的課表月份日期（如 2/28、2月27日），跳過此檢查
-        has_explicit_course_date = bool(
-            re.search(rf'{_COURSE_DATA_MONTH}[月/]\d{{1,2}}', message)
-        )
-        if not has_explicit_course_date and (
-            now_dt.year != _COURSE_DATA_YEAR or now_dt.month != _COURSE_DATA_MONTH
-        ):
-            return (
-                f"很抱歉，由於系統尚未更新課表，"
-                f"{now_dt.month}月的課程資訊請至官網查詢喔！\n"
-                f"官網：https://www.zoo.gov.taipei"
-            ), "low_interest"
-
-        day_summary, day_detail = load_courses_for_weekday(courses_path, target_weekday)
+            ), "low_interest", "course_out_of_range"
+
+        # 特定日期 → 日期索引（已套用起訖日期、第N個週X、closed_dates）；
+        # 純星期 → 本月至少開課一次的課程
+        if target_date:
+            target_label = date_label(target_date)
+            day_summary, day_detail = load_courses_for_date(catalog, target_date)
+        else:
+            target_label = target_weekday
+            day_summary, day_detail = load_courses_for_weekday(
+                catalog, target_weekday, (now_dt.year, now_dt.month),
+            )
         if day_detail and not day_detail.startswith("（"):
-            reply = f"以下是{target_weekday}的課程：\n\n{day_summary}\n\n{day_detail}"
-            return reply, "maybe_interest"
+            reply = f"以下是{target_label}的課程：\n\n{day_summary}\n\n{day_detail}"
+            return reply, "maybe_interest", "course"
         if day_summary.startswith("（"):
-            return day_summary, "low_interest"
+            return day_summary, "low_interest", "course"
         # 篩選失敗 → 交 GPT 處理
 
-    # ── 4. 語意查詢 → GPT ─────────────────────────────────────────
-    return get_reply_and_interest(message, config, now_str)
+    # ── 4. 關鍵字漏接 → 分流分類器（信心足夠才本地回應） ──────────
+    route = _classify_route(message, config)
+    if route in _VISITOR_KEYWORDS:
+        return visitor_reply(route)
+    if route == "nearby":
+        areas = _load_areas(areas_path)
+        current_area = _extract_area_from_message(parsed, areas)
+        if current_area:
+            return _nearby_text(current_area, areas), "low_interest", "nearby"
+    elif route == "course_date":
+        # 問課程但認不出日期（例如「禮拜三」）→ 課程總覽並提示查詢方式
+        catalog = current_course_catalog(config)
+        if catalog is not None:
+            return (
+                "想查詢哪一天的課程呢？可以輸入「週三」、「明天」或「2/18」。\n\n"
+                f"{load_courses_overview(catalog)}"
+            ), "maybe_interest", "course_overview"
+
+    # ── 5. 語意查詢 → GPT ─────────────────────────────────────────
+    reply, interest = get_reply_and_interest(message, config, now_str, deadline=deadline, parsed=parsed)
+    return reply, interest, "gpt"
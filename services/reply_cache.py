@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+GPT 回覆快取：放在 OpenAI 呼叫之前，相同問題不重複付費。
+
+快取鍵 = 正規化訊息 + 解析出的日期/星期 + 模型設定 + 資料檔版本雜湊。
+- 記憶體層：LRU + TTL，並限制總位元組數
+- 選用 SQLite 層（REPLY_CACHE_SQLITE_PATH）：重啟後仍保留
+- 資料版本改變（例如課程 CSV 更新）時，舊版本的項目全部失效
+"""
+
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from utils.metrics import registry
+
+_TRAILING_PUNCT_RE = re.compile(r'[\s?？!！。.~～,，、…]+$')
+_SPACE_RE = re.compile(r'\s+')
+_ENTRY_OVERHEAD = 200   # 每筆項目的估計額外記憶體（dict/tuple/鍵）
+
+
+def normalize_message(text):
+    """全形轉半形、小寫、壓縮空白、去掉結尾標點。"""
+    text = unicodedata.normalize("NFKC", text or "").lower().strip()
+    text = _SPACE_RE.sub(" ", text)
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def make_cache_key(message, resolved, model_settings, data_version):
+    """組合快取鍵（sha256 hex）。resolved 為解析出的日期/星期字串。"""
+    raw = "\x1f".join([
+        normalize_message(message),
+        resolved or "",
+        repr(tuple(model_settings)),
+        data_version or "",
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ReplyCache:
+    """LRU + TTL 的回覆快取，可選 SQLite 持久化。執行緒安全。"""
+
+    def __init__(self, max_entries=512, max_bytes=4 * 1024 * 1024, ttl=3600, sqlite_path=""):
+        self._max_entries = max(1, int(max_entries))
+        self._max_bytes = max(1, int(max_bytes))
+        self._ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, reply, interest, size)
+        self._bytes = 0
+        self._data_version = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS reply_cache ("
+                " key TEXT PRIMARY KEY, data_version TEXT NOT NULL,"
+                " reply TEXT NOT NULL, interest TEXT, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    # ── 對外介面 ────────────────────────────────────────────────
+
+    def get(self, key, data_version):
+        """回傳 (reply, interest) 或 None。"""
+        now = time.time()
+        with self._lock:
+            self._check_version(data_version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry[1], entry[2]
+                self._drop(key)
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT reply, interest, expires_at FROM reply_cache"
+                    " WHERE key = ? AND data_version = ? AND expires_at > ?",
+                    (key, data_version, now),
+                ).fetchone()
+                if row:
+                    self._store(key, row[0], row[1], row[2])
+                    self._hits += 1
+                    return row[0], row[1]
+            self._misses += 1
+            return None
+
+    def put(self, key, data_version, reply, interest):
+        """寫入快取（記憶體，若有設定則同步寫入 SQLite）。"""
+        expires_at = time.time() + self._ttl
+        with self._lock:
+            self._check_version(data_version)
+            self._store(key, reply, interest, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO reply_cache VALUES (?, ?, ?, ?, ?)",
+                        (key, data_version, reply, interest, expires_at),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logging.warning(f"[reply_cache] SQLite 寫入失敗: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM reply_cache")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / total, 4) if total else 0.0,
+                "evictions": self._evictions,
+                "data_version": self._data_version,
+            }
+
+    # ── 內部（呼叫前須持有 _lock） ───────────────────────────────
+
+    def _check_version(self, data_version):
+        """資料版本改變 → 清掉所有舊版本項目。"""
+        if data_version == self._data_version:
+            return
+        if self._data_version is not None:
+            logging.info(f"[reply_cache] 資料版本 {self._data_version} → {data_version}，清除快取")
+        self._entries.clear()
+        self._bytes = 0
+        self._data_version = data_version
+        if self._db is not None:
+            self._db.execute("DELETE FROM reply_cache WHERE data_version != ?", (data_version,))
+            self._db.commit()
+
+    def _store(self, key, reply, interest, expires_at):
+        if key in self._entries:
+            self._drop(key)
+        size = len(reply.encode("utf-8")) + len(key) + _ENTRY_OVERHEAD
+        if size > self._max_bytes:
+            return
+        self._entries[key] = (expires_at, reply, interest, size)
+        self._bytes += size
+        while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._evictions += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_reply_cache(config):
+    """依設定建立（一次）共用的回覆快取；REPLY_CACHE_ENABLED=False 時回傳 None。"""
+    global _cache
+    if not getattr(config, "REPLY_CACHE_ENABLED", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ReplyCache(
+                    max_entries=getattr(config, "REPLY_CACHE_MAX_ENTRIES", 512),
+                    max_bytes=getattr(config, "REPLY_CACHE_MAX_BYTES", 4 * 1024 * 1024),
+                    ttl=getattr(config, "REPLY_CACHE_TTL_SECONDS", 3600),
+                    sqlite_path=getattr(config, "REPLY_CACHE_SQLITE_PATH", ""),
+                )
+    return _cache
+
+
+# ── /metrics ────────────────────────────────────────────────────
+
+def _stat(name):
+    """回呼式指標取值；快取尚未建立（或停用）時不輸出。"""
+    return lambda: _cache.stats()[name] if _cache is not None else None
+
+
+def _request_counts():
+    if _cache is None:
+        return None
+    st = _cache.stats()
+    return {("hit",): st["hits"], ("miss",): st["misses"]}
+
+
+registry.callback(
+    "zoo_reply_cache_requests_total", "GPT 回覆快取查詢次數",
+    _request_counts, labelnames=("result",), type_name="counter",
+)
+registry.callback("zoo_reply_cache_hit_ratio", "GPT 回覆快取命中率", _stat("hit_ratio"))
+registry.callback("zoo_reply_cache_entries", "GPT 回覆快取目前項目數", _stat("entries"))
+registry.callback(
+    "zoo_reply_cache_evictions_total", "GPT 回覆快取因容量淘汰的項目數",
+    _stat("evictions"), type_name="counter",
+)
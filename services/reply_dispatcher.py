@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+背景回覆派送：事件交給固定數量的 worker 執行緒（同時處理上限 = workers）
+產生回覆並送出。
+
+- 非同步模式：Webhook 驗證簽章、把事件放進佇列後立即回 200
+- 同步模式：同一次 Webhook 的多個事件以 run_batch() 並行處理，全部完成後才回 200
+- 同一 user_id 的事件依收到順序逐一處理（同一使用者一條 lane），不同使用者並行
+- reply token 仍在有效期內 → reply_message
+- 已逾時或 reply 失敗 → 改用 push_message（計入 deadline_misses）
+- 待處理事件（含 lane 中排隊者）達上限時不丟訊息：該使用者已有事件處理中 → 仍排進其 lane
+  （overflowed）；否則佔用該使用者的 lane、在呼叫端執行緒就地處理（rejected），submit() 回傳 False
+- shutdown()：等待佇列與各 lane 處理完（gunicorn.conf.py 的 worker_exit 呼叫）
+"""
+
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+from utils.metrics import registry
+
+QUEUE_WAIT = registry.histogram(
+    "zoo_reply_queue_wait_seconds", "事件從收到 Webhook 到 worker 開始處理的等待時間",
+)
+
+
+class _Batch:
+    """run_batch 用：等待一組事件全部處理完。"""
+
+    def __init__(self, count):
+        self._left = count
+        self._cond = threading.Condition()
+
+    def done(self):
+        with self._cond:
+            self._left -= 1
+            if self._left <= 0:
+                self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._left <= 0, timeout)
+
+
+class ReplyDispatcher:
+    """有上限的回覆 worker pool，同一使用者的事件保持順序。"""
+
+    def __init__(self, compose, reply, push, workers=4, max_queue=100, token_ttl=50.0):
+        """
+        compose(event) -> str：產生回覆文字
+        reply(reply_token, text)：以 reply token 回覆
+        push(to, text)：以 push message 送出
+        workers：同時處理事件的上限
+        max_queue：待處理事件上限（含等待同一使用者前一則訊息的事件）
+        token_ttl：reply token 視為有效的秒數（自收到 Webhook 起算）
+        """
+        self._compose = compose
+        self._reply = reply
+        self._push = push
+        self._workers = max(1, int(workers))
+        self._max_queue = max(1, int(max_queue))
+        self._token_ttl = token_ttl
+        self._ready = queue.Queue()      # (lane key, item)：可立即處理的事件
+        self._lanes = {}                 # lane key → deque[item]：同一使用者處理中時排隊
+        self._pending = 0
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._rejected = 0
+        self._overflowed = 0
+        self._completed = 0
+        self._failed = 0
+        self._deadline_misses = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._lane_peak = 0
+
+    # ── 對外介面 ────────────────────────────────────────────────
+
+    def submit(self, event, received_at=None, batch=None):
+        """
+        放入佇列，回傳 True；received_at 為 time.monotonic() 時間。
+        待處理事件已達上限、且該使用者沒有事件處理中時，在呼叫端執行緒就地處理完才返回 False
+        （處理期間佔用該使用者的 lane，之後的同一使用者事件仍排在其後）。
+        """
+        self._ensure_started()
+        if received_at is None:
+            received_at = time.monotonic()
+        key = _order_key(event)
+        item = (event, received_at, batch)
+        with self._lock:
+            full = self._pending >= self._max_queue
+            lane = self._lanes.get(key) if key is not None else None
+            self._pending += 1
+            if lane is not None:
+                # 同一使用者已有事件處理中 → 排在其後（佇列已滿也一樣，避免超前）
+                lane.append(item)
+                self._lane_peak = max(self._lane_peak, len(lane))
+                if full:
+                    self._overflowed += 1
+                else:
+                    self._submitted += 1
+                return True
+            if key is not None:
+                self._lanes[key] = deque()
+            if full:
+                self._rejected += 1
+            else:
+                self._submitted += 1
+        if not full:
+            self._ready.put((key, item))
+            return True
+        logging.warning(f"[dispatch] 佇列已滿（{self._max_queue}），改為同步處理")
+        self._handle(key, item)
+        return False
+
+    def run_batch(self, events, received_at=None, timeout=None):
+        """
+        同步模式：並行處理同一次 Webhook 的多個事件，等全部完成（或 timeout 秒）後返回。
+        佇列已滿的事件就地處理（見 submit）。回傳是否在時限內全部完成。
+        """
+        if received_at is None:
+            received_at = time.monotonic()
+        batch = _Batch(len(events))
+        for event in events:
+            self.submit(event, received_at, batch)
+        return batch.wait(timeout)
+
+    def deliver(self, event, text, received_at):
+        """依 reply token 剩餘效期選擇 reply 或 push。"""
+        age = time.monotonic() - received_at
+        if age < self._token_ttl and getattr(event, "reply_token", None):
+            try:
+                self._reply(event.reply_token, text)
+                return "reply"
+            except Exception as e:
+                logging.warning(f"[dispatch] reply 失敗，改用 push：{e}")
+        with self._lock:
+            self._deadline_misses += 1
+        target = _push_target(event)
+        if not target:
+            logging.error("[dispatch] 無法取得 push 對象，回覆遺失")
+            return "lost"
+        self._push(target, text)
+        return "push"
+
+    def stats(self):
+        """佇列深度、lane、等待時間與逾時統計。"""
+        with self._lock:
+            done = self._completed + self._failed
+            return {
+                "workers": self._workers,
+                "queue_depth": self._pending,
+                "queue_capacity": self._max_queue,
+                "active_lanes": len(self._lanes),
+                "lane_depth_max": self._lane_peak,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "overflowed": self._overflowed,
+                "completed": self._completed,
+                "failed": self._failed,
+                "deadline_misses": self._deadline_misses,
+                "wait_ms_avg": round(self._wait_total / done * 1000, 2) if done else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 2),
+            }
+
+    def shutdown(self, timeout=5.0):
+        """等待佇列與各 lane 中的事件處理完（最多 timeout 秒），再停止 worker。"""
+        deadline = time.monotonic() + timeout
+        while self._threads and time.monotonic() < deadline:
+            with self._lock:
+                if not self._pending:
+                    break
+            time.sleep(0.05)
+        with self._lock:
+            left = self._pending
+        if left:
+            logging.warning(f"[dispatch] 停止時仍有 {left} 個事件未處理")
+        for _ in self._threads:
+            self._ready.put((None, None))
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    # ── worker ──────────────────────────────────────────────────
+
+    def _ensure_started(self):
+        # 延後到第一次使用才啟動，避免 gunicorn fork 前建立執行緒
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self._workers):
+                t = threading.Thread(target=self._run, name=f"reply-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _run(self):
+        while True:
+            key, item = self._ready.get()
+            if item is None:
+                return
+            self._handle(key, item)
+
+    def _handle(self, key, item):
+        """處理一個事件，完成後把同一使用者 lane 中的下一個事件交給 worker。"""
+        event, received_at, batch = item
+        try:
+            self._process(event, received_at)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                nxt = None
+                if key is not None:
+                    lane = self._lanes.get(key)
+                    if lane:
+                        nxt = lane.popleft()
+                    else:
+                        self._lanes.pop(key, None)
+            if nxt is not None:
+                self._ready.put((key, nxt))
+            if batch is not None:
+                batch.done()
+
+    def _process(self, event, received_at):
+        wait = time.monotonic() - received_at
+        QUEUE_WAIT.observe(wait)
+        with self._lock:
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        try:
+            text = self._compose(event)
+            how = self.deliver(event, text, received_at)
+            with self._lock:
+                self._completed += 1
+            logging.info(
+                f"[dispatch] {how} wait_ms={wait * 1000:.1f} "
+                f"total_ms={(time.monotonic() - received_at) * 1000:.1f} "
+                f"depth={self._pending}"
+            )
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            logging.exception(f"[dispatch] 處理事件失敗: {e}")
+
+
+def _order_key(event):
+    """同一使用者的事件共用一條 lane；沒有 user_id 時依群組 / 聊天室，皆無則不限順序。"""
+    source = getattr(event, "source", None)
+    if source is None:
+        return None
+    user_id = getattr(source, "user_id", None)
+    if user_id:
+        return ("user", user_id)
+    chat_id = getattr(source, "group_id", None) or getattr(source, "room_id", None)
+    return ("chat", chat_id) if chat_id else None
+
+
+def _push_target(event):
+    """push 對象：群組 / 聊天室優先，其次使用者。"""
+    source = getattr(event, "source", None)
+    if source is None:
+        return None
+    return (getattr(source, "group_id", None)
+            or getattr(source, "room_id", None)
+            or getattr(source, "user_id", None))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+查詢分流分類器：字元 n-gram TF-IDF + 線性模型，接住關鍵字表漏掉、原本會落到 GPT 的訊息。
+
+- 訓練：scripts/train_route_classifier.py（scikit-learn）→ data/route_classifier.json
+- 推論：純 Python，不 import scikit-learn；每個 n-gram 對應 [idf, 各類別權重...]，
+  一則訊息只需數十次 dict 查詢（單次 < 0.1 ms）
+- 特徵與 sklearn TfidfVectorizer(analyzer=char_ngrams, sublinear_tf=True) 相同，
+  分數 = 偏差 + L2 正規化 TF-IDF · 權重，機率為 softmax
+- 分流：ticket / hours / closure / transport / rules / itinerary / course_date / nearby / open_ended
+"""
+
+import json
+import math
+import unicodedata
+
+from services.data_store import data_store
+
+ROUTES = (
+    "ticket", "hours", "closure", "transport", "rules",
+    "itinerary", "course_date", "nearby", "open_ended",
+)
+
+
+def normalize(text):
+    """全形轉半形、小寫、去頭尾空白（訓練與推論共用）。"""
+    return unicodedata.normalize("NFKC", text or "").lower().strip()
+
+
+def char_ngrams(text, n_min=1, n_max=3):
+    """正規化後的字元 n-gram 清單（訓練時作為 TfidfVectorizer 的 analyzer）。"""
+    text = normalize(text)
+    grams = []
+    for n in range(n_min, n_max + 1):
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+class RouteClassifier:
+    """唯讀的線性分類器（由 JSON 模型建立，各請求共用）。"""
+
+    __slots__ = ("labels", "ngram_range", "bias", "features")
+
+    def __init__(self, labels, ngram_range, bias, features):
+        self.labels = tuple(labels)
+        self.ngram_range = tuple(ngram_range)
+        self.bias = tuple(bias)
+        self.features = features      # n-gram → (idf, idf × 各類別權重 tuple)
+
+    @classmethod
+    def from_dict(cls, model):
+        features = {}
+        for gram, row in model["features"].items():
+            idf = row[0]
+            features[gram] = (idf, tuple(idf * w for w in row[1:]))
+        return cls(model["labels"], model["ngram_range"], model["bias"], features)
+
+    def scores(self, message):
+        """各類別的線性分數（未經 softmax）。"""
+        counts = {}
+        features = self.features
+        for gram in char_ngrams(message, *self.ngram_range):
+            if gram in features:
+                counts[gram] = counts.get(gram, 0) + 1
+        if not counts:
+            return list(self.bias)
+        rows = []
+        norm = 0.0
+        for gram, count in counts.items():
+            idf, weights = features[gram]
+            if count == 1:
+                norm += idf * idf
+                rows.append(weights)
+            else:
+                tf = 1.0 + math.log(count)       # sublinear tf
+                norm += (tf * idf) ** 2
+                rows.append([tf * w for w in weights])
+        norm = math.sqrt(norm)
+        return [b + sum(col) / norm for b, col in zip(self.bias, zip(*rows))]
+
+    def predict(self, message):
+        """回傳 (分流, 機率)。"""
+        scores = self.scores(message)
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        best = exps.index(1.0)
+        return self.labels[best], 1.0 / sum(exps)
+
+
+def parse_route_model(path):
+    """JSON 模型 → RouteClassifier（data_store parser）。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return RouteClassifier.from_dict(json.load(f))
+
+
+def load_route_classifier(path):
+    """分類器（依模型檔版本快取）；檔案不存在回傳 None。"""
+    try:
+        return data_store.load(path, parse_route_model)
+    except FileNotFoundError:
+        return None
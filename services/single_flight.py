@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Single-flight：相同請求鍵同時只呼叫一次上游，其餘請求等待並共用結果。
+
+- 行程內：同一 worker 的執行緒以 dict + Event 合併（leader 執行，follower 等待）
+- 跨 worker（選用，SINGLE_FLIGHT_LOCK_DIR）：leader 另外持有檔案鎖（fcntl.flock）；
+  其他 worker 拿不到鎖時等鎖釋放；取得鎖後先以 recheck()（共用 SQLite 回覆快取）取結果，
+  取不到才自行呼叫。每個鍵各自一個鎖檔（不同問題互不等待），leader 釋放前刪除，不會累積
+- follower 等待超過 SINGLE_FLIGHT_WAIT_SECONDS 時改為自行呼叫，不會無限期卡住
+- /metrics：zoo_single_flight_requests_total{role}（leader / follower / remote / timeout）
+"""
+
+import os
+import time
+import logging
+import threading
+
+from utils.metrics import registry
+
+FLIGHTS = registry.counter(
+    "zoo_single_flight_requests_total",
+    "single-flight 請求數（leader：實際呼叫上游；follower / remote：共用同一 worker / 其他 worker 的結果；"
+    "timeout：等待逾時改為自行呼叫）",
+    ("role",),
+)
+
+_POLL_SECONDS = 0.02
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _FileLock:
+    """
+    以 flock 取得跨行程互斥鎖；逾時則不持鎖繼續（acquired=False）。
+    釋放時刪除鎖檔；取得鎖後確認鎖住的仍是目錄中的那個檔案（可能剛被前一個持有者刪除），不是就重開。
+    """
+
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self.acquired = False
+        self._fd = None
+
+    def __enter__(self):
+        import fcntl
+        deadline = time.monotonic() + self.timeout
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return self
+                time.sleep(_POLL_SECONDS)
+                continue
+            if self._is_current():
+                self.acquired = True
+                return self
+            # 鎖到的是已被刪除的舊檔：改開目前的鎖檔再試
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _is_current(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        fst = os.fstat(self._fd)
+        return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+    def __exit__(self, *exc):
+        import fcntl
+        if self.acquired:
+            # 先刪除再解鎖：等待中的行程解鎖後會發現檔案已換，改開新檔
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        return False
+
+
+class SingleFlight:
+    """依請求鍵合併同時進行的呼叫。執行緒安全。"""
+
+    def __init__(self, wait_timeout=30.0, lock_dir=""):
+        self._wait_timeout = float(wait_timeout)
+        self._lock = threading.Lock()
+        self._calls = {}             # key → _Call（進行中）
+        self._lock_dir = _usable_lock_dir(lock_dir)
+
+    def do(self, key, fn, recheck=None, timeout=None):
+        """
+        回傳 fn() 的結果；同一 key 已有呼叫進行中時等待並共用其結果（含例外）。
+        recheck()：跨 worker 模式下取得檔案鎖後先查其他 worker 的結果，回傳 None 表示沒有。
+        timeout：本次最多等待秒數（例如該則訊息剩餘的延遲預算），不超過 SINGLE_FLIGHT_WAIT_SECONDS。
+        """
+        wait = self._wait_timeout if timeout is None else max(0.0, min(self._wait_timeout, timeout))
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if not call.done.wait(wait):
+                FLIGHTS.inc(role="timeout")
+                logging.warning(f"[single_flight] 等待 {key[:12]} 逾時，改為自行呼叫")
+                return fn()
+            FLIGHTS.inc(role="follower")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._lead(key, fn, recheck, wait)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _lead(self, key, fn, recheck, wait):
+        if not self._lock_dir:
+            FLIGHTS.inc(role="leader")
+            return fn()
+        path = os.path.join(self._lock_dir, f"flight-{key}.lock")
+        with _FileLock(path, wait) as lock:
+            # 拿到鎖後再查一次：其他 worker 可能剛寫入結果（不論是否曾等待）
+            if recheck is not None:
+                result = recheck()
+                if result is not None:
+                    FLIGHTS.inc(role="remote")
+                    return result
+            FLIGHTS.inc(role="leader" if lock.acquired else "timeout")
+            return fn()
+
+    def inflight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def _usable_lock_dir(lock_dir):
+    """跨 worker 模式需要 fcntl（POSIX）與可寫入的目錄；不符合時退回行程內模式。"""
+    if not lock_dir:
+        return ""
+    try:
+        import fcntl  # noqa: F401
+    except ImportError:
+        logging.warning("[single_flight] 此平台沒有 fcntl，跨 worker 合併停用")
+        return ""
+    try:
+        os.makedirs(lock_dir, exist_ok=True)
+    except OSError as e:
+        logging.warning(f"[single_flight] 無法建立鎖目錄 {lock_dir}：{e}，跨 worker 合併停用")
+        return ""
+    return lock_dir
+
+
+_flight = None
+_flight_lock = threading.Lock()
+
+
+def get_single_flight(config):
+    """依設定建立（一次）共用的 SingleFlight；SINGLE_FLIGHT_ENABLED=False 時回傳 None。"""
+    global _flight
+    if not getattr(config, "SINGLE_FLIGHT_ENABLED", True):
+        return None
+    if _flight is None:
+        with _flight_lock:
+            if _flight is None:
+                lock_dir = getattr(config, "SINGLE_FLIGHT_LOCK_DIR", "")
+                if lock_dir and not getattr(config, "REPLY_CACHE_SQLITE_PATH", ""):
+                    logging.warning(
+                        "[single_flight] SINGLE_FLIGHT_LOCK_DIR 需搭配 REPLY_CACHE_SQLITE_PATH "
+                        "才能在 worker 間共用結果（目前只會排隊、不會省下呼叫）"
+                    )
+                _flight = SingleFlight(
+                    wait_timeout=getattr(config, "SINGLE_FLIGHT_WAIT_SECONDS", 30.0),
+                    lock_dir=lock_dir,
+                )
+    return _flight
+
+
+registry.callback(
+    "zoo_single_flight_inflight", "single-flight 目前進行中的上游呼叫數（本 worker）",
+    lambda: _flight.inflight() if _flight is not None else None,
+)
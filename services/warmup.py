@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+啟動預熱：worker 接收請求前先完成資料載入、索引建置與 OpenAI 連線，第一位使用者不必負擔冷啟動。
+
+- 步驟依序執行，各自計時（startup_profile 的 warmup.* 階段）；單一步驟失敗只記 log，
+  該部分改回第一次使用時才載入，不會讓 worker 永遠無法就緒
+- gunicorn：gunicorn.conf.py 的 post_worker_init 同步執行（worker 完成前不接請求）
+- 其他啟動方式（python app.py、flask run）：背景執行，GET /ready 在完成前回 503
+- /metrics：zoo_worker_ready（0 / 1）與 zoo_startup_seconds{phase}
+"""
+
+import time
+import logging
+import threading
+
+from utils.metrics import registry
+from utils.startup import startup_profile
+
+_lock = threading.Lock()
+_ready = threading.Event()
+_thread = None
+_errors = {}                # 步驟 → 錯誤訊息
+
+
+def _steps(config):
+    """[(名稱, fn(剩餘秒數))]；import 放在步驟裡，讓 import 時間計入該步驟。"""
+
+    def data(_):
+        from services import query_router
+        query_router.warm_up(config)
+
+    def prompt(_):
+        from services import chatgpt_service
+        chatgpt_service.warm_up(config)
+
+    def openai(_):
+        from services import openai_client
+        openai_client.warm_up(config, connect=getattr(config, "WARMUP_OPENAI_CONNECT", True))
+
+    def intent(remaining):
+        from services.intent_classifier import get_intent_classifier
+        classifier = get_intent_classifier(config)
+        if classifier is not None and not classifier.warm(timeout=max(0.0, remaining)):
+            raise RuntimeError("意圖分類模型未在預熱時間內載入完成")
+
+    return [("data", data), ("prompt", prompt), ("openai", openai), ("intent", intent)]
+
+
+def warm_up(config, notify=None):
+    """
+    同步預熱（每個行程只執行一次，重複呼叫時等待既有的預熱完成）。
+    notify：每個步驟完成後呼叫（gunicorn 的 worker.notify，避免預熱期間被判定逾時）。
+    回傳是否所有步驟都成功。
+    """
+    with _lock:
+        if _ready.is_set():
+            return not _errors
+        if not getattr(config, "WARMUP_ENABLED", True):
+            _finish()
+            return True
+        timeout = float(getattr(config, "WARMUP_TIMEOUT_SECONDS", 20))
+        deadline = time.monotonic() + timeout
+        with startup_profile.phase("warmup"):
+            for name, step in _steps(config):
+                with startup_profile.phase(f"warmup.{name}"):
+                    try:
+                        step(deadline - time.monotonic())
+                    except Exception as e:
+                        _errors[name] = str(e)[:200] or type(e).__name__
+                        logging.warning(f"[warmup] {name} 失敗，改為第一次使用時載入：{e}")
+                if notify is not None:
+                    notify()
+        _finish()
+        return not _errors
+
+
+def _finish():
+    startup_profile.stop_imports()
+    _ready.set()
+    logging.info(startup_profile.report())
+
+
+def start_warm_up(config):
+    """在背景執行緒預熱（已開始或已完成時不重複啟動）。"""
+    global _thread
+    if _ready.is_set() or _thread is not None:
+        return
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=warm_up, args=(config,), name="warmup", daemon=True)
+    _thread.start()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def status():
+    """/ready 的回應內容。"""
+    return {
+        "ready": _ready.is_set(),
+        "errors": dict(_errors),
+        "phases_ms": {
+            name: round(seconds * 1000, 1)
+            for name, seconds in startup_profile.phases.items()
+        },
+    }
+
+
+registry.callback(
+    "zoo_worker_ready", "worker 是否已完成啟動預熱（1 = 就緒）",
+    lambda: 1 if _ready.is_set() else 0,
+)
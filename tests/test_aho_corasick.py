@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Aho-Corasick 關鍵字自動機（aho_corasick.KeywordAutomaton）與逐一子字串比對的結果一致"""
+
+import random
+
+from services.query_router import _VISITOR_KEYWORDS
+from utils.aho_corasick import KeywordAutomaton
+
+
+def _substring_scan(patterns, text):
+    """原本的作法：每個關鍵字各自在訊息中找出所有出現位置。"""
+    hits = []
+    for pattern, payload in patterns:
+        start = text.find(pattern)
+        while start != -1:
+            hits.append((start, pattern, payload))
+            start = text.find(pattern, start + 1)
+    return sorted(hits)
+
+
+def _automaton(patterns):
+    ac = KeywordAutomaton()
+    for pattern, payload in patterns:
+        ac.add(pattern, payload)
+    return ac.build()
+
+
+def test_overlapping_and_suffix_keywords():
+    patterns = [("休館", "closure"), ("今天休館", "closure"), ("館", "venue"), ("天休", "x")]
+    text = "今天休館嗎"
+    hits = _automaton(patterns).scan(text)
+    assert sorted(hits) == _substring_scan(patterns, text)
+    assert (2, "休館", "closure") in hits and (0, "今天休館", "closure") in hits
+
+
+def test_hits_are_ordered_by_end_position():
+    hits = _automaton([("ab", 1), ("b", 2), ("abc", 3)]).scan("abcab")
+    ends = [start + len(pattern) for start, pattern, _ in hits]
+    assert ends == sorted(ends)
+
+
+def test_same_pattern_with_several_payloads():
+    hits = _automaton([("公休", "closure"), ("公休", "alias")]).scan("週一公休")
+    assert sorted(hits) == [(2, "公休", "alias"), (2, "公休", "closure")]
+
+
+def test_rebuild_after_add_does_not_duplicate_outputs():
+    first = [("休館", "closure"), ("館", "venue")]
+    more = [("今天休館", "closure"), ("天休", "x")]
+    ac = _automaton(first)
+    text = "今天休館嗎？大貓熊館休館"
+    assert sorted(ac.scan(text)) == _substring_scan(first, text)
+
+    for pattern, payload in more:
+        ac.add(pattern, payload)
+    ac.build()
+    ac.build()
+    assert sorted(ac.scan(text)) == _substring_scan(first + more, text)
+    assert len(ac) == 4
+
+
+def test_scan_builds_lazily_after_add():
+    ac = _automaton([("門票", "ticket")])
+    ac.add("票", "ticket_char")
+    assert sorted(ac.scan("門票")) == [(0, "門票", "ticket"), (1, "票", "ticket_char")]
+
+
+def test_visitor_keywords_match_substring_scan():
+    patterns = [(kw, category) for category, kws in _VISITOR_KEYWORDS.items() for kw in kws]
+    ac = _automaton(patterns)
+    for text in ("今天休館嗎", "今天哪些館休", "票價多少錢？幾點開門", "可以帶狗嗎，停車場在哪"):
+        assert sorted(ac.scan(text)) == _substring_scan(patterns, text), text
+
+
+def test_random_patterns_match_substring_scan():
+    rng = random.Random(7)
+    alphabet = "休館今天門票"
+    for _ in range(200):
+        patterns = [("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))), i) for i in range(8)]
+        split = rng.randint(0, len(patterns))
+        ac = _automaton(patterns[:split])
+        for pattern, payload in patterns[split:]:
+            ac.add(pattern, payload)
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+        assert sorted(ac.scan(text)) == _substring_scan(patterns, text)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""OpenAI 斷路器（circuit_breaker.CircuitBreaker）與斷路時的本地回覆"""
+
+import threading
+
+from services.chatgpt_service import build_fallback_reply
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, get_circuit_breaker
+
+
+def _breaker(clock, **kwargs):
+    kwargs.setdefault("failure_threshold", 3)
+    kwargs.setdefault("slow_seconds", 5.0)
+    kwargs.setdefault("open_seconds", 30.0)
+    return CircuitBreaker(clock=clock, **kwargs)
+
+
+def _fail(breaker, n, elapsed=0.0):
+    for _ in range(n):
+        assert breaker.allow()
+        breaker.record(False, elapsed)
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = _breaker(clock)
+    _fail(breaker, 2)
+    assert breaker.state() == CLOSED
+    _fail(breaker, 1)
+    assert breaker.state() == OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count(clock):
+    breaker = _breaker(clock)
+    _fail(breaker, 2)
+    breaker.record(True, 0.5)
+    _fail(breaker, 2)
+    assert breaker.state() == CLOSED
+
+
+def test_slow_success_counts_as_failure(clock):
+    breaker = _breaker(clock)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record(True, 6.0)
+    assert breaker.state() == OPEN
+
+
+def test_slow_check_disabled_with_zero(clock):
+    breaker = _breaker(clock, slow_seconds=0)
+    for _ in range(5):
+        breaker.record(True, 60.0)
+    assert breaker.state() == CLOSED
+
+
+def test_half_open_allows_single_probe_then_closes(clock):
+    breaker = _breaker(clock)
+    _fail(breaker, 3)
+    clock.now += 29.9
+    assert not breaker.allow()
+
+    clock.now += 0.2
+    assert breaker.state() == HALF_OPEN
+    assert breaker.allow()               # 試探呼叫
+    assert not breaker.allow()           # 試探進行中，其餘仍走本地回覆
+    breaker.record(True, 1.0)
+    assert breaker.state() == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_for_full_period(clock):
+    breaker = _breaker(clock)
+    _fail(breaker, 3)
+    clock.now += 31
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state() == OPEN
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 2
+    assert breaker.allow()
+
+
+def test_only_one_probe_under_concurrency(clock):
+    breaker = _breaker(clock)
+    _fail(breaker, 3)
+    clock.now += 31
+    results = []
+    barrier = threading.Barrier(8)
+
+    def probe():
+        barrier.wait()
+        results.append(breaker.allow())
+
+    threads = [threading.Thread(target=probe) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results.count(True) == 1
+
+
+def test_disabled_with_zero_failures():
+    class Config:
+        GPT_BREAKER_FAILURES = 0
+
+    assert get_circuit_breaker(Config) is None
+
+
+# ── 本地回覆 ──────────────────────────────────────────────────
+
+def test_fallback_prefers_attachments_then_day_courses():
+    reply, interest = build_fallback_reply(None, attachments=[("nearby", "附近館區：企鵝館")])
+    assert "企鵝館" in reply and interest == "low_interest"
+
+    reply, interest = build_fallback_reply(None, "保母講古：無尾熊", "【保母講古】\n主題：無尾熊", "週三")
+    assert "週三" in reply and "無尾熊" in reply and interest == "maybe_interest"
+
+    reply, interest = build_fallback_reply(None, "（週一 無課程資料）", "", "週一")
+    assert "週一 無課程資料" in reply and interest == "low_interest"
+
+
+def test_fallback_without_catalog_points_to_website():
+    reply, interest = build_fallback_reply(None)
+    assert "zoo.gov.taipei" in reply and interest is None
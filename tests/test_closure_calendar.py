@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""館區公休日曆（closure_calendar.ClosureCalendar）"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from config.settings import Config
+from services.closure_calendar import ClosureCalendar, _rule_closed, load_holiday_closures
+from services.query_router import route_message
+
+RULES = [
+    {"venue_name": "大貓熊館", "closure_type": "monthly", "week_number": "1", "day_of_week": "週一"},
+    {"venue_name": "企鵝館", "closure_type": "monthly", "week_number": "2", "day_of_week": "週一"},
+    {"venue_name": "教育中心", "closure_type": "weekly", "week_number": "", "day_of_week": "週一"},
+]
+HOLIDAYS = {(4, 7): ["大貓熊館"]}
+
+
+def _calendar():
+    return ClosureCalendar(RULES, HOLIDAYS)
+
+
+def test_monthly_rule_closes_nth_weekday():
+    cal = _calendar()
+    # 2026-02：第 1 個週一是 2/2，第 2 個是 2/9
+    assert cal.is_closed("大貓熊館", date(2026, 2, 2))
+    assert not cal.is_closed("大貓熊館", date(2026, 2, 9))
+    assert cal.is_closed("企鵝館", date(2026, 2, 9))
+    assert not cal.is_closed("企鵝館", date(2026, 2, 2))
+
+
+def test_weekly_rule_closes_every_weekday():
+    cal = _calendar()
+    mondays = [date(2026, 3, 2) + timedelta(weeks=i) for i in range(5)]
+    assert all(cal.is_closed("教育中心", d) for d in mondays)
+    assert not cal.is_closed("教育中心", date(2026, 3, 3))
+
+
+def test_holiday_closure_is_added():
+    cal = _calendar()
+    assert date(2026, 4, 7).weekday() != 0
+    assert cal.is_closed("大貓熊館", date(2026, 4, 7))
+    assert not cal.is_closed("企鵝館", date(2026, 4, 7))
+
+
+def test_unknown_venue_is_never_closed():
+    cal = _calendar()
+    assert not cal.is_closed("不存在的館", date(2026, 2, 2))
+    assert cal.closed_days("不存在的館", date(2026, 1, 1), date(2026, 12, 31)) == []
+
+
+def test_closed_days_range_is_inclusive():
+    cal = _calendar()
+    assert cal.closed_days("大貓熊館", date(2026, 2, 2), date(2026, 2, 2)) == [date(2026, 2, 2)]
+    assert cal.closed_days("大貓熊館", date(2026, 2, 3), date(2026, 3, 1)) == []
+    assert cal.closed_days("大貓熊館", date(2026, 2, 1), date(2026, 3, 31)) == [date(2026, 2, 2), date(2026, 3, 2)]
+
+
+def test_closed_days_spans_year_boundary():
+    cal = _calendar()
+    days = cal.closed_days("大貓熊館", date(2025, 12, 1), date(2026, 1, 31))
+    assert days == [date(2025, 12, 1), date(2026, 1, 5)]
+
+
+def test_closed_days_matches_rules_day_by_day():
+    """位元圖展開的結果與逐日套用規則一致（含連假順延）。"""
+    cal = _calendar()
+    start, end = date(2025, 11, 15), date(2027, 2, 15)
+    for venue in ("大貓熊館", "企鵝館", "教育中心"):
+        expected = []
+        d = start
+        while d <= end:
+            rules = [r for r in RULES if r["venue_name"] == venue]
+            if venue in HOLIDAYS.get((d.month, d.day), ()) or any(_rule_closed(r, d) for r in rules):
+                expected.append(d)
+            d += timedelta(days=1)
+        assert cal.closed_days(venue, start, end) == expected
+
+
+def test_closed_venues_keeps_csv_order():
+    cal = _calendar()
+    # 2026-02-02 是第 1 個週一：大貓熊館與每週一公休的教育中心
+    assert cal.closed_venues(date(2026, 2, 2)) == ["大貓熊館", "教育中心"]
+    assert cal.closed_venues(date(2026, 2, 3)) == []
+
+
+def test_rule_returns_first_rule_or_none():
+    cal = _calendar()
+    assert cal.rule("企鵝館")["week_number"] == "2"
+    assert cal.rule("不存在的館") is None
+
+
+def test_load_holiday_closures(tmp_path):
+    path = tmp_path / "holidays.csv"
+    path.write_text(
+        "month,day,venue_name,notes\n4,7,教育中心,順延\n4,7,大貓熊館,順延\nx,1,壞資料,\n",
+        encoding="utf-8",
+    )
+    assert load_holiday_closures(str(path)) == {(4, 7): ["教育中心", "大貓熊館"]}
+    assert load_holiday_closures(str(tmp_path / "missing.csv")) == {}
+
+
+# ── route_message 端到端 ──────────────────────────────────────
+
+@pytest.mark.parametrize("message", ["今天哪些館休", "今天哪些館休館"])
+def test_which_venues_closed_today_uses_closure_calendar(message):
+    reply, interest = route_message(message, Config(), "", datetime(2026, 2, 17, 10, 0))
+    assert reply.startswith("【館區公休時間表】（今天：2月17日（週二））")
+    assert "沒有安排課程" not in reply
+    assert interest == "low_interest"
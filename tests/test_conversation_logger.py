@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""對話紀錄 write-behind（conversation_logger.ConversationLogger）寫入暫存 SQLite 檔"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import sessionmaker
+
+from database.db import create_db_engine
+from database.models import Base, Conversation, User
+from services.conversation_logger import LOG_LOCK_RETRIES, LOG_RECORDS, ConversationLogger
+
+T0 = datetime(2026, 2, 17, 10, 0)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "zoo_bot.db"
+
+
+@pytest.fixture
+def session_factory(db_path):
+    engine = create_db_engine(f"sqlite:///{db_path}", busy_timeout_ms=50)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _logger(session_factory, **kwargs):
+    kwargs.setdefault("flush_interval", 60)
+    return ConversationLogger(session_factory, **kwargs)
+
+
+def _count(session_factory, model):
+    """資料表筆數；背景執行緒第一次寫入前資料表還不存在，視為 0。"""
+    if not _table_exists(session_factory, model.__tablename__):
+        return 0
+    with session_factory() as session:
+        return session.scalar(select(func.count()).select_from(model))
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待逾時"
+        time.sleep(0.01)
+
+
+def test_sqlite_connections_use_wal_and_busy_timeout(session_factory):
+    with session_factory() as session:
+        assert session.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert session.execute(text("PRAGMA busy_timeout")).scalar() == 50
+
+
+def test_batches_are_inserted(session_factory):
+    logger = _logger(session_factory, batch_size=3)
+    for i in range(6):
+        assert logger.log("U1", f"訊息 {i}", created_at=T0 + timedelta(seconds=i))
+
+    # 達到 batch_size 即寫入，不必等 flush_interval 或 shutdown
+    _wait_until(lambda: _count(session_factory, Conversation) == 6)
+    logger.shutdown()
+
+    with session_factory() as session:
+        rows = session.scalars(select(Conversation).order_by(Conversation.id)).all()
+    assert [r.message for r in rows] == [f"訊息 {i}" for i in range(6)]
+    assert all(r.user_id == "U1" and r.is_user for r in rows)
+
+
+def test_last_active_at_is_upserted(session_factory):
+    Base.metadata.create_all(bind=session_factory.kw["bind"])
+    with session_factory() as session:
+        session.add(User(user_id="U1", created_at=T0 - timedelta(days=3), last_active_at=T0 - timedelta(days=3)))
+        session.commit()
+
+    logger = _logger(session_factory)
+    logger.log_exchange("U1", "今天有什麼課", "以下是今天的課程", intent_label="maybe_interest")
+    logger.log("U1", "謝謝", created_at=T0 + timedelta(minutes=5))
+    logger.log("U1", "早一點的訊息", created_at=T0)
+    logger.log("U2", "第一次來", created_at=T0 + timedelta(minutes=1))
+    logger.shutdown()
+
+    with session_factory() as session:
+        users = {u.user_id: u for u in session.scalars(select(User))}
+        labels = session.scalars(select(Conversation.intent_label).where(Conversation.is_user)).all()
+    assert set(users) == {"U1", "U2"}
+    assert users["U1"].created_at == T0 - timedelta(days=3)
+    assert users["U1"].last_active_at > T0 + timedelta(minutes=5)      # log_exchange 以現在時間記錄
+    assert users["U2"].created_at == users["U2"].last_active_at == T0 + timedelta(minutes=1)
+    assert "maybe_interest" in labels
+
+
+def test_shutdown_drains_queue(session_factory):
+    logger = _logger(session_factory, batch_size=100)
+    for i in range(25):
+        logger.log(f"U{i % 4}", f"訊息 {i}", created_at=T0)
+    assert not _table_exists(session_factory, "conversations")      # 未達 batch_size、未到 flush_interval：尚未寫入
+
+    logger.shutdown()
+
+    assert _count(session_factory, Conversation) == 25
+    assert _count(session_factory, User) == 4
+    assert logger.pending() == 0
+
+
+def test_retries_while_another_worker_holds_the_write_lock(session_factory, db_path):
+    logger = _logger(session_factory, batch_size=1, lock_backoff=0.05)
+    logger.log("U1", "建立資料表", created_at=T0)
+    _wait_until(lambda: _count(session_factory, Conversation) == 1)
+
+    # 另一個 worker 持有寫入鎖 0.3 秒，超過 busy_timeout（50ms）
+    other = sqlite3.connect(str(db_path), timeout=0, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    retries = LOG_LOCK_RETRIES.value()
+    failed = LOG_RECORDS.value(result="failed")
+    releaser = threading.Timer(0.3, other.execute, args=("COMMIT",))
+    releaser.start()
+
+    logger.log("U1", "鎖定期間的訊息", created_at=T0 + timedelta(seconds=1))
+    _wait_until(lambda: _count(session_factory, Conversation) == 2)
+    logger.shutdown()
+    releaser.join()
+    other.close()
+
+    assert LOG_LOCK_RETRIES.value() > retries
+    assert LOG_RECORDS.value(result="failed") == failed
+
+
+def test_two_workers_share_one_sqlite_file(db_path):
+    engines = [create_db_engine(f"sqlite:///{db_path}", busy_timeout_ms=2000) for _ in range(2)]
+    Base.metadata.create_all(bind=engines[0])
+    loggers = [ConversationLogger(sessionmaker(bind=e), batch_size=5, flush_interval=0.05) for e in engines]
+    failed = LOG_RECORDS.value(result="failed")
+
+    def produce(logger, worker):
+        for i in range(100):
+            logger.log(f"U{i % 7}", f"worker{worker} 訊息 {i}", created_at=T0 + timedelta(seconds=i))
+
+    threads = [threading.Thread(target=produce, args=(lg, n)) for n, lg in enumerate(loggers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for lg in loggers:
+        lg.shutdown()
+
+    factory = sessionmaker(bind=engines[0])
+    assert _count(factory, Conversation) == 200
+    assert _count(factory, User) == 7
+    assert LOG_RECORDS.value(result="failed") == failed
+    for e in engines:
+        e.dispose()
+
+
+def _table_exists(session_factory, name):
+    with session_factory() as session:
+        return session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {"name": name}
+        ).first() is not None
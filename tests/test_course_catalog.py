@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""課程紀錄與課程目錄（course_model.Course.held_on、CourseCatalog 的日期 / 星期索引與換版）"""
+
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from services.course_catalog import CatalogManager, CourseCatalog, catalog_from_file
+from services.course_model import parse_courses
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+HEADER = "category,topic,weekday,start_date,end_date,time,location,coordinates,closed_dates,cert,env_hours,cert_type\n"
+
+FEBRUARY = HEADER + (
+    "D_Category,D_Title,D_Brief,D_StartDate,D_EndDate,D_Time,D_Location,D_Geo,D_AddDate,,,\n"
+    "保母講古,無尾熊,每週三,2026/2/1,2026/2/28,11:00-11:25,無尾熊館,,2/18,否,0,不適用\n"
+    "保母講古,大貓熊訓練,第3個週三,2026/2/1,2026/2/28,15:30-16:00,大貓熊館,,,否,0,不適用\n"
+    "定時定點,企鵝導覽,週六、週日,2026/2/7,2026/2/22,10:00-10:30,企鵝館,,,是,0.5,環教\n"
+)
+MARCH = HEADER + (
+    "保母講古,河馬,每週一,2026/3/1,2026/3/31,14:00-14:20,河馬館,,,否,0,不適用\n"
+)
+
+
+@pytest.fixture
+def course_dir(tmp_path):
+    (tmp_path / "courses-February.csv").write_text(FEBRUARY, encoding="utf-8")
+    return tmp_path
+
+
+def _catalog(*paths):
+    return CourseCatalog([(str(p), (os.stat(p).st_mtime_ns, os.stat(p).st_size)) for p in paths])
+
+
+def _topics(entry):
+    return [c.topic for courses in entry["buckets"].values() for c in courses] if entry else []
+
+
+# ── Course.held_on ────────────────────────────────────────────
+
+def test_held_on_applies_weekday_range_week_number_and_closed_dates(course_dir):
+    koala, panda, penguin = parse_courses(str(course_dir / "courses-February.csv"))
+
+    assert koala.held_on(date(2026, 2, 4))            # 週三
+    assert not koala.held_on(date(2026, 2, 5))        # 週四
+    assert not koala.held_on(date(2026, 2, 18))       # closed_dates
+    assert not koala.held_on(date(2026, 3, 4))        # 超過 end_date
+
+    assert panda.held_on(date(2026, 2, 18))           # 第 3 個週三
+    assert not panda.held_on(date(2026, 2, 11))
+
+    assert penguin.held_on(date(2026, 2, 7)) and penguin.held_on(date(2026, 2, 8))
+    assert not penguin.held_on(date(2026, 2, 1))      # 早於 start_date
+    assert not penguin.held_on(date(2026, 2, 28))     # 晚於 end_date
+
+
+def test_description_row_is_skipped(course_dir):
+    assert [c.topic for c in parse_courses(str(course_dir / "courses-February.csv"))] == \
+        ["無尾熊", "大貓熊訓練", "企鵝導覽"]
+
+
+# ── 日期索引 ──────────────────────────────────────────────────
+
+def test_day_index_matches_held_on(course_dir):
+    catalog = _catalog(course_dir / "courses-February.csv")
+    d = date(2026, 1, 25)
+    while d <= date(2026, 3, 7):
+        expected = [c.topic for c in catalog.courses if c.held_on(d)]
+        assert sorted(_topics(catalog.day(d))) == sorted(expected), d
+        d += timedelta(days=1)
+
+
+def test_day_entry_counts_and_renders(course_dir):
+    catalog = _catalog(course_dir / "courses-February.csv")
+    entry = catalog.day(date(2026, 2, 25))
+    assert entry["count"] == 1
+    assert "無尾熊" in entry["detail"]
+    assert catalog.day(date(2026, 2, 18))["count"] == 1      # 無尾熊停課，只剩大貓熊
+    assert catalog.day(date(2026, 2, 2)) is None
+
+
+def test_day_index_on_real_catalogue():
+    catalog = catalog_from_file(os.path.join(DATA_DIR, "courses-February.csv"))
+    assert catalog.first and catalog.last
+    d = catalog.first
+    while d <= catalog.last:
+        expected = sum(1 for c in catalog.courses if c.held_on(d))
+        entry = catalog.day(d)
+        assert (entry["count"] if entry else 0) == expected, d
+        d += timedelta(days=1)
+
+
+# ── 星期索引與涵蓋月份 ────────────────────────────────────────
+
+def test_weekday_index_by_month(course_dir):
+    catalog = _catalog(course_dir / "courses-February.csv", _write_march(course_dir))
+
+    assert sorted(_topics(catalog.weekday("週三"))) == ["大貓熊訓練", "無尾熊"]
+    assert sorted(_topics(catalog.weekday("週三", (2026, 2)))) == ["大貓熊訓練", "無尾熊"]
+    assert catalog.weekday("週三", (2026, 3)) is None
+    assert _topics(catalog.weekday("週一", (2026, 3))) == ["河馬"]
+    assert catalog.weekday("週一", (2026, 2)) is None
+    assert catalog.weekday("星期八") is None
+
+
+def test_covers_months(course_dir):
+    catalog = _catalog(course_dir / "courses-February.csv", _write_march(course_dir))
+    assert catalog.covers(date(2026, 2, 1)) and catalog.covers(date(2026, 3, 31))
+    assert not catalog.covers(date(2026, 4, 1))
+    assert catalog.covers_month(2026, 3) and not catalog.covers_month(2025, 2)
+    assert catalog.coverage_text() == "2026年2月、3月"
+
+
+def _write_march(directory):
+    path = directory / "courses-March.csv"
+    path.write_text(MARCH, encoding="utf-8")
+    return path
+
+
+# ── 合併與換版 ────────────────────────────────────────────────
+
+def test_monthly_files_merge_in_date_order(course_dir):
+    march = _write_march(course_dir)
+    catalog = _catalog(march, course_dir / "courses-February.csv")
+    assert [c.topic for c in catalog.courses] == ["無尾熊", "大貓熊訓練", "企鵝導覽", "河馬"]
+
+
+def test_manager_swaps_snapshot_when_files_change(course_dir):
+    manager = CatalogManager(str(course_dir), check_interval=0)
+    old = manager.current()
+    assert len(old) == 3 and not old.covers_month(2026, 3)
+
+    _write_march(course_dir)
+    new = manager.rebuild()
+
+    assert manager.current() is new
+    assert new.version != old.version
+    assert new.covers_month(2026, 3) and len(new) == 4
+    # 進行中的請求手上的舊快照不受影響
+    assert len(old) == 3 and old.day(date(2026, 3, 2)) is None
+
+
+def test_manager_falls_back_to_single_file(tmp_path, course_dir):
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    manager = CatalogManager(str(empty), fallback=str(course_dir / "courses-February.csv"))
+    assert len(manager.current()) == 3
+
+
+def test_manager_runs_one_background_rebuild_at_a_time(course_dir, monkeypatch):
+    manager = CatalogManager(str(course_dir), check_interval=0)
+    manager.current()
+    release = threading.Event()
+    calls = []
+
+    def slow_rebuild(files=None):
+        calls.append(files)
+        release.wait(5)
+
+    monkeypatch.setattr(manager, "rebuild", slow_rebuild)
+    _write_march(course_dir)
+    for _ in range(5):
+        manager.current()
+    release.set()
+    _wait_until(lambda: not manager._rebuilding)
+    assert len(calls) == 1
+
+    manager.current()                  # 前一次重建結束後可再排入新的重建
+    _wait_until(lambda: len(calls) == 2)
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待逾時"
+        time.sleep(0.01)
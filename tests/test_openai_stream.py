@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""串流回覆：_ReplyStreamWatcher 在 LINE 長度上限中止生成，以及 zoo_openai_tokens_total 的 token 計數"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from config.settings import Config
+from services.chatgpt_service import REPLY_MAX_CHARS, _ReplyStreamWatcher, get_reply_and_interest
+from services.openai_client import OPENAI_EARLY_STOPS, OPENAI_TOKENS, install_client, stream_chat_completion
+from utils.tokens import approx_tokens
+
+HEADER = "[興趣度: high_interest]\n"
+
+
+class FakeStream:
+    """逐段回傳 chunk，記錄被讀取的數量與是否被關閉。"""
+
+    def __init__(self, deltas, usage=None):
+        self.chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=d))], usage=None)
+            for d in deltas
+        ]
+        if usage is not None:
+            # OpenAI 的 stream_options.include_usage：最後一個 chunk 沒有 choices，只帶 usage
+            self.chunks.append(SimpleNamespace(choices=[], usage=SimpleNamespace(**usage)))
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self, stream):
+        self.stream = stream
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, stream=False, **kwargs):
+        assert stream
+        return self.stream
+
+
+@pytest.fixture
+def fake_stream():
+    def install(deltas, usage=None):
+        stream = FakeStream(deltas, usage)
+        install_client(FakeClient(stream))
+        return stream
+
+    yield install
+    install_client(None)
+
+
+def _tokens(model, kind):
+    return OPENAI_TOKENS.value(model=model, kind=kind)
+
+
+# ── _ReplyStreamWatcher ───────────────────────────────────────
+
+def test_watcher_parses_header_split_across_chunks():
+    watcher = _ReplyStreamWatcher(limit=10)
+    assert not watcher("[興趣度: hi")
+    assert not watcher("gh_interest]\n12345")
+    assert watcher.interest == "high_interest"
+    assert not watcher("67890")            # 標註行不計入：剛好 10 字
+    assert watcher("1")
+
+
+def test_watcher_counts_everything_without_header():
+    watcher = _ReplyStreamWatcher(limit=10)
+    assert not watcher("第一行沒有標註\n")      # 8 字
+    assert watcher.interest is None
+    assert watcher("abc")
+
+
+def test_watcher_stops_before_first_newline_when_over_limit():
+    watcher = _ReplyStreamWatcher(limit=5)
+    assert watcher("一二三四五六")
+
+
+# ── stream_chat_completion ────────────────────────────────────
+
+def test_stream_stops_at_the_chunk_that_crosses_the_limit(fake_stream):
+    model = "test-stream-stop"
+    stream = fake_stream([HEADER] + ["0123456789"] * 10)
+    early_stops = OPENAI_EARLY_STOPS.value(model=model)
+
+    text, timing = stream_chat_completion(Config(), [], should_stop=_ReplyStreamWatcher(limit=25), model=model)
+
+    assert text == HEADER + "0123456789" * 3
+    assert stream.consumed == 4 and stream.closed
+    assert timing["stopped_early"]
+    assert OPENAI_EARLY_STOPS.value(model=model) == early_stops + 1
+
+
+def test_stream_without_usage_records_local_estimate(fake_stream):
+    model = "test-stream-estimate"
+    fake_stream([HEADER, "今天有保母講古，", "地點在無尾熊館。"])
+    messages = [{"role": "system", "content": "系統提示" * 20}, {"role": "user", "content": "今天有什麼課"}]
+    prompt, completion = _tokens(model, "prompt"), _tokens(model, "completion")
+
+    text, _ = stream_chat_completion(Config(), messages, model=model)
+
+    expected_prompt = sum(approx_tokens(m["content"]) + 4 for m in messages)
+    assert _tokens(model, "prompt") == prompt + expected_prompt
+    assert _tokens(model, "completion") == completion + approx_tokens(text)
+
+
+def test_stream_reuses_callers_prompt_estimate(fake_stream):
+    model = "test-stream-known-prompt"
+    fake_stream([HEADER, "回覆內容"])
+    messages = [{"role": "system", "content": "系統提示"}, {"role": "user", "content": "嗨"}]
+    prompt = _tokens(model, "prompt")
+
+    stream_chat_completion(Config(), messages, prompt_tokens=500, model=model)
+
+    assert _tokens(model, "prompt") == prompt + 500 + 4 * len(messages)
+
+
+def test_stream_usage_chunk_is_recorded_as_is(fake_stream):
+    model = "test-stream-usage"
+    fake_stream([HEADER, "回覆內容"], usage={"prompt_tokens": 321, "completion_tokens": 12})
+    prompt, completion = _tokens(model, "prompt"), _tokens(model, "completion")
+
+    stream_chat_completion(Config(), [{"role": "user", "content": "嗨"}], model=model)
+
+    assert _tokens(model, "prompt") == prompt + 321
+    assert _tokens(model, "completion") == completion + 12
+
+
+def test_early_stop_counts_only_received_text(fake_stream):
+    model = "test-stream-partial"
+    fake_stream(["abcd"] * 50)
+    completion = _tokens(model, "completion")
+
+    text, _ = stream_chat_completion(Config(), [], should_stop=_ReplyStreamWatcher(limit=10), model=model)
+
+    assert text == "abcd" * 3
+    assert _tokens(model, "completion") == completion + approx_tokens(text)
+
+
+# ── get_reply_and_interest ────────────────────────────────────
+
+def test_long_streamed_reply_is_cut_at_line_limit(fake_stream):
+    stream = fake_stream([HEADER] + ["動物園課程介紹。" * 10] * 100)     # 每段 80 字，共 8000 字
+    config = Config()
+    config.OPENAI_API_KEY = "test"
+    config.GPT_STREAM = True
+    config.REPLY_CACHE_ENABLED = False
+    config.GPT_LATENCY_BUDGET_SECONDS = 0
+    config.GPT_BREAKER_FAILURES = 0
+
+    reply, interest = get_reply_and_interest("介紹一下課程", config)
+
+    assert interest == "high_interest"
+    assert stream.consumed == 1 + REPLY_MAX_CHARS // 80 + 1
+    body, _ = reply.split("\n\n（回覆過長已截斷")
+    assert len(body) == REPLY_MAX_CHARS and "興趣度" not in body
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""GPT 輸入 token 預算（prompt_budget.fit_sections 與 assemble_system_prompt 的預算處理）"""
+
+from config.settings import Config
+from services.chatgpt_service import (
+    assemble_system_prompt,
+    current_course_catalog,
+    load_courses_for_weekday,
+)
+from services.prompt_budget import (
+    PRIORITY_ATTACHMENT, PRIORITY_CONTEXT, PRIORITY_DETAIL, PRIORITY_SUMMARY,
+    TRIM_NOTE, Section, fit_sections, total_tokens,
+)
+from utils.tokens import approx_tokens
+
+
+def _lines(prefix, n):
+    return "\n".join(f"{prefix}{i:03d} 課程內容說明" for i in range(n))
+
+
+# ── fit_sections ──────────────────────────────────────────────
+
+def test_within_budget_is_untouched():
+    sections = [Section("prefix", "固定前綴"), Section("detail", _lines("d", 5), PRIORITY_DETAIL)]
+    before = [s.text for s in sections]
+    assert fit_sections(sections, 10_000) == total_tokens(sections)
+    assert [s.text for s in sections] == before
+    assert not any(s.trimmed for s in sections)
+
+
+def test_zero_budget_means_unlimited():
+    sections = [Section("detail", _lines("d", 200), PRIORITY_DETAIL)]
+    assert fit_sections(sections, 0) == sections[0].original_tokens
+    assert not sections[0].trimmed
+
+
+def test_trims_lowest_priority_first():
+    prefix = Section("prefix", _lines("p", 10))
+    summary = Section("day_summary", _lines("s", 10), PRIORITY_SUMMARY)
+    attachment = Section("attachment", _lines("a", 40), PRIORITY_ATTACHMENT)
+    context = Section("context", _lines("c", 40), PRIORITY_CONTEXT)
+    sections = [prefix, summary, attachment, context]
+    budget = total_tokens(sections) - context.tokens // 2
+
+    total = fit_sections(sections, budget)
+
+    assert total <= budget
+    assert context.trimmed and context.text.endswith(TRIM_NOTE)
+    assert not attachment.trimmed and not summary.trimmed and not prefix.trimmed
+
+
+def test_fixed_sections_are_never_trimmed():
+    prefix = Section("prefix", _lines("p", 50))
+    detail = Section("day_detail", _lines("d", 20), PRIORITY_DETAIL)
+    total = fit_sections([prefix, detail], prefix.tokens // 2)
+    assert not prefix.trimmed
+    assert detail.tokens == 0
+    assert total == prefix.tokens
+
+
+def test_floor_is_kept_even_when_fixed_prefix_exceeds_budget():
+    prefix = Section("prefix", _lines("p", 200))
+    detail = Section("day_detail", _lines("d", 40), PRIORITY_DETAIL, floor=10_000)
+    context = Section("context", _lines("c", 40), PRIORITY_CONTEXT)
+
+    total = fit_sections([prefix, detail, context], prefix.tokens - 1)
+
+    # floor 大於原本大小 → 整段保留；沒有下限的檢索段落照常截掉
+    assert detail.floor == detail.original_tokens
+    assert not detail.trimmed
+    assert context.tokens == 0
+    assert total == prefix.tokens + detail.tokens
+
+
+def test_partial_floor_trims_down_to_floor():
+    detail = Section("day_detail", _lines("d", 60), PRIORITY_DETAIL, floor=100)
+    fit_sections([Section("prefix", _lines("p", 30)), detail], 1)
+    assert detail.trimmed
+    assert 100 <= detail.tokens < detail.original_tokens
+    assert detail.tokens == approx_tokens(detail.text)
+
+
+# ── assemble_system_prompt ────────────────────────────────────
+
+def _sunday_courses(config):
+    catalog = current_course_catalog(config)
+    summary, detail = load_courses_for_weekday(catalog, "週日", (2026, 2))
+    assert detail, "測試資料應有週日課程"
+    return catalog, summary, detail
+
+
+def test_full_mode_over_budget_switches_to_retrieval_and_keeps_day_courses():
+    """full 的固定前綴（約 4300 tokens）超過預設預算 3000：改用 retrieval，當日課程完整保留。"""
+    config = Config()
+    config.PROMPT_CONTEXT_MODE = "full"
+    config.GPT_INPUT_TOKEN_BUDGET = 3000
+    catalog, summary, detail = _sunday_courses(config)
+
+    full_config = Config()
+    full_config.PROMPT_CONTEXT_MODE = "full"
+    full_config.GPT_INPUT_TOKEN_BUDGET = 0
+    full_prompt, full_stats = assemble_system_prompt(full_config, "NOW", summary, detail, "週日", catalog=catalog)
+    assert full_stats["sections"]["prefix"] > config.GPT_INPUT_TOKEN_BUDGET
+
+    prompt, stats = assemble_system_prompt(
+        config, "NOW", summary, detail, "週日", catalog=catalog, query="週日有什麼課",
+    )
+
+    assert stats["sections"]["prefix"] < full_stats["sections"]["prefix"]
+    assert "day_detail" not in stats["trimmed"] and "day_summary" not in stats["trimmed"]
+    assert detail in prompt and summary in prompt
+    assert stats["input_tokens"] <= config.GPT_INPUT_TOKEN_BUDGET
+
+
+def test_attachment_is_trimmed_before_day_courses():
+    config = Config()
+    config.PROMPT_CONTEXT_MODE = "retrieval"
+    config.GPT_INPUT_TOKEN_BUDGET = 3000
+    catalog, summary, detail = _sunday_courses(config)
+    attachment = Section("attachment", _lines("附近館區", 300), PRIORITY_ATTACHMENT)
+
+    prompt, stats = assemble_system_prompt(
+        config, "NOW", summary, detail, "週日", catalog=catalog, query="週日有什麼課",
+        user_sections=[Section("user", "週日有什麼課"), attachment],
+    )
+
+    assert attachment.trimmed
+    assert detail in prompt
+    assert stats["input_tokens"] <= config.GPT_INPUT_TOKEN_BUDGET
+
+
+def test_day_courses_keep_floor_when_budget_is_tiny():
+    config = Config()
+    config.PROMPT_CONTEXT_MODE = "retrieval"
+    config.GPT_INPUT_TOKEN_BUDGET = 1200
+    config.GPT_DAY_COURSES_MIN_TOKENS = 600
+    catalog, summary, detail = _sunday_courses(config)
+
+    _, stats = assemble_system_prompt(config, "NOW", summary, detail, "週日", catalog=catalog)
+
+    day_tokens = stats["sections"]["day_summary"] + stats["sections"]["day_detail"]
+    assert day_tokens >= 600
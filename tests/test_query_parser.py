@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""查詢解析（query_parser.parse_dates、parse_query 與唯讀的 ParsedQuery）"""
+
+from datetime import date, datetime
+
+import pytest
+
+from services.query_parser import ClosureTarget, ParsedQuery, parse_dates, parse_query
+from services.query_router import parse_message
+
+NOW = datetime(2026, 2, 11, 10, 0)     # 週三
+
+
+def _day(d):
+    return ClosureTarget("day", d)
+
+
+def _month(year, month):
+    return ClosureTarget("month", year=year, month=month)
+
+
+# ── parse_dates ───────────────────────────────────────────────
+
+@pytest.mark.parametrize("message, expected", [
+    ("明天有什麼課", (date(2026, 2, 12), "週四", _day(date(2026, 2, 12)))),
+    ("前天", (date(2026, 2, 9), "週一", _day(date(2026, 2, 9)))),
+    ("今天和昨天", (date(2026, 2, 11), "週三", _day(date(2026, 2, 11)))),      # 依相對日期優先順序
+    ("2月18日有課嗎", (date(2026, 2, 18), "週三", _day(date(2026, 2, 18)))),
+    ("3/5", (date(2026, 3, 5), "週四", _day(date(2026, 3, 5)))),
+    ("你好", (None, None, None)),
+])
+def test_specific_dates(message, expected):
+    assert parse_dates(message, NOW) == expected
+
+
+def test_relative_date_wins_over_month_day():
+    assert parse_dates("明天是2/20嗎", NOW)[0] == date(2026, 2, 12)
+
+
+def test_invalid_month_day_is_ignored_without_falling_through():
+    assert parse_dates("2/30", NOW) == (None, None, None)
+    assert parse_dates("2/30 或 3/1", NOW)[0] is None
+
+
+def test_weekday_names():
+    # 課程查詢取星期順序最前者；公休目標取訊息中第一個
+    target, weekday, closure = parse_dates("週五和週二的課", NOW)
+    assert (target, weekday) == (None, "週二")
+    assert closure == _day(date(2026, 2, 13))
+
+    # 「禮拜X / 週天」只用於公休查詢
+    assert parse_dates("禮拜天", NOW) == (None, None, _day(date(2026, 2, 15)))
+    assert parse_dates("星期三", NOW)[2] == _day(date(2026, 2, 11))
+
+
+def test_week_prefixes():
+    assert parse_dates("下週三企鵝館有開嗎", NOW)[2] == _day(date(2026, 2, 18))
+    assert parse_dates("這週一", NOW)[2] == _day(date(2026, 2, 9))
+    assert parse_dates("本週日", NOW)[2] == _day(date(2026, 2, 15))
+
+
+def test_month_targets():
+    assert parse_dates("下個月公休", NOW)[2] == _month(2026, 3)
+    assert parse_dates("下月", datetime(2026, 12, 5))[2] == _month(2027, 1)
+    assert parse_dates("本月", NOW)[2] == _month(2026, 2)
+    assert parse_dates("這個月", NOW)[2] == _month(2026, 2)
+    assert parse_dates("十二月公休", NOW)[2] == _month(2026, 12)
+    assert parse_dates("12月", NOW)[2] == _month(2026, 12)
+    assert parse_dates("13月", NOW)[2] is None
+
+
+def test_specific_date_wins_over_month():
+    assert parse_dates("下個月3月5日", NOW)[2] == _day(date(2026, 3, 5))
+
+
+# ── parse_query / ParsedQuery ─────────────────────────────────
+
+def test_without_matches_only_dates_are_parsed():
+    parsed = parse_query("明天列車幾點", NOW)
+    assert isinstance(parsed, ParsedQuery)
+    assert parsed.date == date(2026, 2, 12) and parsed.weekday == "週四"
+    assert parsed.hours_venue == "遊客列車"
+    assert parsed.route is None and parsed.matches is None and parsed.triggers == frozenset()
+
+
+@pytest.mark.parametrize("message, route", [
+    ("企鵝館附近有什麼", "nearby"),
+    ("門票多少錢", "ticket"),
+    ("大貓熊館明天有開嗎", "closure"),
+    ("列車幾點", "hours"),
+    ("週三有什麼課", "course_date"),
+    ("你好", None),
+])
+def test_route(message, route):
+    assert parse_message(message, NOW).route == route
+
+
+def test_keyword_fields():
+    parsed = parse_message("大貓熊館明天有開嗎", NOW)
+    assert parsed.venue == "大貓熊館"
+    assert parsed.closure_target == _day(date(2026, 2, 12))
+
+    parsed = parse_message("學生票", NOW)
+    assert parsed.ticket_group == ("eligible_group", "學生")
+
+    parsed = parse_message("企鵝館附近有什麼", NOW)
+    assert "nearby" in parsed.triggers and parsed.area is not None
+
+
+def test_parsed_query_is_read_only():
+    parsed = parse_message("週三有什麼課", NOW)
+    with pytest.raises(AttributeError):
+        parsed.weekday = "週四"
+    assert parsed._replace(weekday="週四").weekday == "週四"
+    assert parsed.weekday == "週三"
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""GPT 回覆快取（reply_cache.ReplyCache 與快取鍵）"""
+
+import pytest
+
+from services import reply_cache
+from services.reply_cache import ReplyCache, make_cache_key, normalize_message
+
+
+@pytest.fixture(autouse=True)
+def _frozen_time(clock, monkeypatch):
+    monkeypatch.setattr(reply_cache.time, "time", clock)
+
+
+# ── 快取鍵 ────────────────────────────────────────────────────
+
+def test_normalize_message():
+    assert normalize_message("  有哪些課？？ ") == "有哪些課"
+    assert normalize_message("ＡＢＣ  課程!") == "abc 課程"
+
+
+def test_cache_key_ignores_surface_differences_only():
+    settings = ("gpt-4o-mini", 0.7)
+    key = make_cache_key("週三有什麼課？", "週三", settings, "v1")
+    assert key == make_cache_key("週三有什麼課", "週三", settings, "v1")
+    assert key != make_cache_key("週三有什麼課", "週四", settings, "v1")
+    assert key != make_cache_key("週三有什麼課", "週三", ("gpt-4o", 0.7), "v1")
+    assert key != make_cache_key("週三有什麼課", "週三", settings, "v2")
+
+
+# ── TTL ──────────────────────────────────────────────────────
+
+def test_hit_before_ttl_and_miss_after(clock):
+    cache = ReplyCache(ttl=60)
+    cache.put("k", "v1", "回覆", "maybe_interest")
+
+    clock.now += 59
+    assert cache.get("k", "v1") == ("回覆", "maybe_interest")
+
+    clock.now += 2
+    assert cache.get("k", "v1") is None
+    st = cache.stats()
+    assert (st["hits"], st["misses"], st["entries"]) == (1, 1, 0)
+
+
+def test_put_refreshes_ttl(clock):
+    cache = ReplyCache(ttl=60)
+    cache.put("k", "v1", "舊回覆", None)
+    clock.now += 50
+    cache.put("k", "v1", "新回覆", None)
+    clock.now += 50
+    assert cache.get("k", "v1") == ("新回覆", None)
+
+
+# ── 資料版本 ──────────────────────────────────────────────────
+
+def test_version_change_invalidates_all_entries(clock):
+    cache = ReplyCache(ttl=3600)
+    cache.put("a", "v1", "A", None)
+    cache.put("b", "v1", "B", None)
+
+    assert cache.get("a", "v2") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["data_version"] == "v2"
+    # 回到舊版本也不會取回已清除的項目
+    assert cache.get("b", "v1") is None
+
+
+def test_sqlite_layer_survives_restart_and_respects_version(clock, tmp_path):
+    path = str(tmp_path / "cache.db")
+    ReplyCache(ttl=60, sqlite_path=path).put("k", "v1", "回覆", "high_interest")
+
+    restarted = ReplyCache(ttl=60, sqlite_path=path)
+    assert restarted.get("k", "v1") == ("回覆", "high_interest")
+
+    clock.now += 61
+    assert ReplyCache(ttl=60, sqlite_path=path).get("k", "v1") is None
+
+    other = ReplyCache(ttl=60, sqlite_path=path)
+    other.put("k", "v1", "回覆", None)
+    assert other.get("k", "v2") is None
+    assert ReplyCache(ttl=60, sqlite_path=path).get("k", "v1") is None
+
+
+# ── 容量 ─────────────────────────────────────────────────────
+
+def test_lru_eviction_by_entry_count(clock):
+    cache = ReplyCache(max_entries=2, ttl=60)
+    cache.put("a", "v1", "A", None)
+    cache.put("b", "v1", "B", None)
+    assert cache.get("a", "v1") is not None      # a 變成最近使用
+    cache.put("c", "v1", "C", None)
+
+    assert cache.get("b", "v1") is None
+    assert cache.get("a", "v1") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_limit(clock):
+    cache = ReplyCache(max_entries=100, max_bytes=1000, ttl=60)
+    cache.put("big", "v1", "x" * 2000, None)      # 單筆超過上限：不存
+    assert cache.get("big", "v1") is None
+    for i in range(10):
+        cache.put(f"k{i}", "v1", "y" * 200, None)
+    assert cache.stats()["bytes"] <= 1000
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""背景回覆派送（reply_dispatcher.ReplyDispatcher）：同一使用者依序、佇列滿時不超前、shutdown 清空佇列"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services.reply_dispatcher import ReplyDispatcher
+
+
+def _event(user, seq):
+    return SimpleNamespace(source=SimpleNamespace(user_id=user), reply_token=f"{user}-{seq}", seq=seq)
+
+
+class Recorder:
+    """compose / reply / push 替身：記錄送出順序與同時處理數。"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.gates = {}            # reply_token → Event：處理到該事件時等待
+        self.active = {}
+        self.peak_users = 0
+        self.overlap_same_user = False
+        self._lock = threading.Lock()
+
+    def compose(self, event):
+        user = event.source.user_id
+        with self._lock:
+            if self.active.get(user):
+                self.overlap_same_user = True
+            self.active[user] = self.active.get(user, 0) + 1
+            self.peak_users = max(self.peak_users, sum(1 for n in self.active.values() if n))
+        try:
+            gate = self.gates.get(event.reply_token)
+            if gate is not None:
+                assert gate.wait(5)
+            time.sleep(self.delay)
+            return f"reply {event.seq}"
+        finally:
+            with self._lock:
+                self.active[user] -= 1
+
+    def reply(self, token, text):
+        with self._lock:
+            self.sent.append(token)
+
+    def push(self, to, text):
+        raise AssertionError("reply token 仍有效時不應改用 push")
+
+    def order(self, user):
+        return [int(token.split("-")[1]) for token in self.sent if token.startswith(f"{user}-")]
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+def _dispatcher(recorder, **kwargs):
+    return ReplyDispatcher(recorder.compose, recorder.reply, recorder.push, **kwargs)
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待逾時"
+        time.sleep(0.005)
+
+
+def test_same_user_in_order_while_users_run_in_parallel():
+    recorder = Recorder(delay=0.005)
+    dispatcher = _dispatcher(recorder, workers=4, max_queue=100)
+    users = ["U1", "U2", "U3", "U4"]
+    for seq in range(15):
+        for user in users:
+            assert dispatcher.submit(_event(user, seq))
+    dispatcher.shutdown(timeout=10)
+
+    for user in users:
+        assert recorder.order(user) == list(range(15))
+    assert not recorder.overlap_same_user
+    assert recorder.peak_users > 1
+    stats = dispatcher.stats()
+    assert stats["completed"] == 60 and stats["queue_depth"] == 0 and stats["active_lanes"] == 0
+
+
+def test_queue_full_keeps_per_user_order(recorder):
+    dispatcher = _dispatcher(recorder, workers=1, max_queue=2)
+    a1_gate, c1_gate = threading.Event(), threading.Event()
+    recorder.gates["A-1"] = a1_gate
+    recorder.gates["C-1"] = c1_gate
+
+    assert dispatcher.submit(_event("A", 1))               # worker 處理中（卡住）
+    assert dispatcher.submit(_event("A", 2))               # 排在 A 的 lane
+    assert dispatcher.submit(_event("A", 3))               # 已滿，但 A 有事件處理中 → 仍排進 lane
+    assert not dispatcher.submit(_event("B", 1))           # 已滿且 B 沒有 lane → 就地處理
+    assert recorder.order("B") == [1]
+
+    # C-1 就地處理期間佔住 C 的 lane：同時進來的 C-2 必須排在後面
+    inline = threading.Thread(target=lambda: dispatcher.submit(_event("C", 1)))
+    inline.start()
+    _wait_until(lambda: recorder.active.get("C"))
+    assert dispatcher.submit(_event("C", 2))
+    c1_gate.set()
+    inline.join(5)
+    a1_gate.set()
+    dispatcher.shutdown(timeout=5)
+
+    assert recorder.order("A") == [1, 2, 3]
+    assert recorder.order("C") == [1, 2]
+    stats = dispatcher.stats()
+    assert (stats["overflowed"], stats["rejected"]) == (2, 2)
+    assert stats["completed"] == 6
+
+
+def test_run_batch_waits_for_all_events(recorder):
+    dispatcher = _dispatcher(recorder, workers=2)
+    assert dispatcher.run_batch([_event("A", 1), _event("B", 1), _event("A", 2)], timeout=5)
+    assert recorder.order("A") == [1, 2] and recorder.order("B") == [1]
+    dispatcher.shutdown()
+
+
+def test_shutdown_drains_pending_replies():
+    recorder = Recorder(delay=0.01)
+    dispatcher = _dispatcher(recorder, workers=2, max_queue=100)
+    for seq in range(20):
+        dispatcher.submit(_event(f"U{seq % 3}", seq))
+
+    dispatcher.shutdown(timeout=5)
+
+    assert len(recorder.sent) == 20
+    assert dispatcher.stats()["queue_depth"] == 0
+    assert dispatcher._threads == []
+
+
+def test_shutdown_gives_up_after_timeout(recorder):
+    dispatcher = _dispatcher(recorder, workers=1)
+    gate = threading.Event()
+    recorder.gates["A-1"] = gate
+    dispatcher.submit(_event("A", 1))
+    dispatcher.submit(_event("A", 2))
+
+    started = time.monotonic()
+    dispatcher.shutdown(timeout=0.2)
+
+    assert time.monotonic() - started < 1
+    assert dispatcher.stats()["queue_depth"] == 2
+    gate.set()
+
+
+def test_expired_reply_token_falls_back_to_push():
+    pushed = []
+    dispatcher = ReplyDispatcher(
+        lambda event: "回覆", lambda token, text: pytest.fail("不應使用過期的 reply token"),
+        lambda to, text: pushed.append(to), workers=1, token_ttl=50.0,
+    )
+    dispatcher.submit(_event("A", 1), received_at=time.monotonic() - 60)
+    dispatcher.shutdown(timeout=5)
+    assert pushed == ["A"]
+    assert dispatcher.stats()["deadline_misses"] == 1
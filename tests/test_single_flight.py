@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Single-flight（single_flight.SingleFlight）：同鍵合併、不同鍵並行、例外共用、跨行程檔案鎖"""
+
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+N = 8
+
+
+def _run_threads(n, target):
+    results = [None] * n
+
+    def run(i):
+        try:
+            results[i] = ("ok", target())
+        except Exception as e:
+            results[i] = ("error", e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results
+
+
+def _wait_for_followers(flight, key, started, n):
+    """等所有執行緒都進入 do()：leader 已登記呼叫、其餘 n - 1 個已開始等待。"""
+    deadline = time.monotonic() + 5
+    while not (len(started) == n and key in flight._calls):
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    time.sleep(0.05)
+
+
+@pytest.fixture(params=["memory", "file_lock"])
+def flight(request, tmp_path):
+    lock_dir = str(tmp_path / "locks") if request.param == "file_lock" else ""
+    return SingleFlight(wait_timeout=5, lock_dir=lock_dir)
+
+
+def test_identical_calls_invoke_producer_once(flight):
+    calls, started = [], []
+    release = threading.Event()
+
+    def produce():
+        calls.append(1)
+        release.wait(5)
+        return {"reply": "今天有保母講古"}
+
+    def call():
+        started.append(1)
+        return flight.do("key-1", produce)
+
+    releaser = threading.Thread(target=lambda: (_wait_for_followers(flight, "key-1", started, N), release.set()))
+    releaser.start()
+    results = _run_threads(N, call)
+    releaser.join()
+
+    assert len(calls) == 1
+    assert all(status == "ok" for status, _ in results)
+    assert len({id(value) for _, value in results}) == 1
+    assert flight.inflight() == 0
+
+
+def test_distinct_keys_do_not_serialize(flight):
+    # 兩個鍵前兩個字元相同；producer 彼此等待，若被同一把鎖串行化就會卡到 barrier 逾時
+    barrier = threading.Barrier(2, timeout=3)
+
+    def call(key):
+        def produce():
+            barrier.wait()
+            return key
+        return flight.do(key, produce)
+
+    keys = iter(["abc123", "abd456"])
+    results = _run_threads(2, lambda: call(next(keys)))
+
+    assert sorted(value for _, value in results) == ["abc123", "abd456"]
+
+
+def test_producer_error_reaches_every_waiter_and_is_not_cached(flight):
+    calls, started = [], []
+    release = threading.Event()
+
+    def failing():
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("OpenAI 503")
+
+    def call():
+        started.append(1)
+        return flight.do("key-err", failing)
+
+    releaser = threading.Thread(target=lambda: (_wait_for_followers(flight, "key-err", started, N), release.set()))
+    releaser.start()
+    results = _run_threads(N, call)
+    releaser.join()
+
+    assert len(calls) == 1
+    assert all(status == "error" and isinstance(e, ValueError) for status, e in results)
+    # 失敗不留下結果：下一次呼叫重新執行 producer
+    assert flight.do("key-err", lambda: "retry ok") == "retry ok"
+    assert flight.inflight() == 0
+
+
+def test_follower_timeout_calls_producer_itself():
+    flight = SingleFlight(wait_timeout=0.1)
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do("slow", lambda: release.wait(5)))
+    leader.start()
+    while "slow" not in flight._calls:
+        time.sleep(0.005)
+
+    assert flight.do("slow", lambda: "own") == "own"
+    release.set()
+    leader.join()
+
+
+# ── 跨行程檔案鎖 ──────────────────────────────────────────────
+
+def _worker(lock_dir, shared_dir, barrier, out):
+    """子行程：以共用檔案模擬 SQLite 回覆快取，producer 執行時在 calls.log 記一筆。"""
+    result_path = os.path.join(shared_dir, "result")
+    flight = SingleFlight(wait_timeout=5, lock_dir=lock_dir)
+
+    def produce():
+        with open(os.path.join(shared_dir, "calls.log"), "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(0.3)
+        with open(result_path, "w") as f:
+            f.write("shared reply")
+        return "shared reply"
+
+    def recheck():
+        if os.path.exists(result_path):
+            with open(result_path) as f:
+                return f.read()
+        return None
+
+    barrier.wait()
+    out.put(flight.do("flight-key", produce, recheck=recheck))
+
+
+def test_file_lock_shares_result_across_processes(tmp_path):
+    pytest.importorskip("fcntl")
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("需要 fork 啟動子行程")
+    ctx = multiprocessing.get_context("fork")
+    lock_dir = tmp_path / "locks"
+    barrier = ctx.Barrier(2)
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(str(lock_dir), str(tmp_path), barrier, out)) for _ in range(2)]
+    for p in procs:
+        p.start()
+    results = [out.get(timeout=10) for _ in procs]
+    for p in procs:
+        p.join(10)
+
+    assert results == ["shared reply", "shared reply"]
+    assert len((tmp_path / "calls.log").read_text().splitlines()) == 1
+    assert os.listdir(lock_dir) == []          # leader 釋放前刪除鎖檔
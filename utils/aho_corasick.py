@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Aho-Corasick 多字串比對：所有關鍵字編譯成一個自動機，
+掃描一次訊息即可找出全部命中（含重疊），時間與訊息長度成正比，
+與關鍵字數量無關。
+"""
+
+from collections import deque
+
+
+class KeywordAutomaton:
+    """
+    用法：
+        ac = KeywordAutomaton()
+        ac.add("門票", payload)
+        ac.build()
+        for start, pattern, payload in ac.scan(text): ...
+    """
+
+    def __init__(self):
+        self._goto = [{}]        # 節點 → {字元: 子節點}
+        self._fail = [0]
+        self._own = [[]]         # 節點 → 以此節點結尾的 [(pattern, payload), ...]
+        self._out = [[]]         # 節點 → 含 failure 路徑的全部輸出（build 時重算）
+        self._built = False
+
+    def __len__(self):
+        return sum(len(o) for o in self._own)
+
+    def add(self, pattern, payload=None):
+        """加入關鍵字；同一字串可對應多個 payload。"""
+        if not pattern:
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+            node = nxt
+        self._own[node].append((pattern, payload))
+        self._built = False
+
+    def build(self):
+        """
+        以 BFS 計算 failure link，並把 failure 路徑上的輸出合併進節點。
+        每次都從 add() 的原始輸出重算，build 之後再 add 也不會重複回報。
+        """
+        self._fail = [0] * len(self._goto)
+        self._out = [list(o) for o in self._own]
+        queue = deque()
+        queue.extend(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+        return self
+
+    def scan(self, text):
+        """回傳 [(start, pattern, payload), ...]，依結束位置排序。"""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for pattern, payload in out[node]:
+                    hits.append((i - len(pattern) + 1, pattern, payload))
+        return hits
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+輕量指標：Counter / Histogram / 回呼式指標，輸出 Prometheus 文字格式（0.0.4）。
+
+- 每個指標一把鎖，臨界區只有一次 dict 更新（histogram 的 bucket 位置在鎖外計算）
+- 回呼式指標在 render() 時才向來源模組取值（快取、佇列等已有 stats() 的元件）
+- 指標屬於行程內；gunicorn 多 worker 時每次 scrape 只會看到處理該請求的 worker
+
+用法：
+    from utils.metrics import registry
+    LATENCY = registry.histogram("x_seconds", "說明", ("branch",))
+    LATENCY.observe(0.12, branch="gpt")
+"""
+
+import math
+import threading
+from bisect import bisect_left
+
+# 預設延遲 bucket（秒）：涵蓋本地路由（< 1 ms）到 GPT 呼叫（數十秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _label_str(labelnames, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        lines += [f"{self.name}{_label_str(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self._values = {}        # key -> [bucket 計數..., +Inf 計數, sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)   # 落在 le >= value 的第一個 bucket
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[idx] += 1
+            row[-1] += value
+
+    def count(self, **labels):
+        row = self._values.get(self._key(labels))
+        return sum(row[:-1]) if row else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self.header()
+        bounds = self.buckets + (math.inf,)
+        for key, row in items:
+            cumulative = 0
+            for bound, n in zip(bounds, row[:-1]):
+                cumulative += n
+                labels = _label_str(self.labelnames, key, (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_str(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(row[-1], 6))}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """render 時呼叫 fn() 取值；fn 回傳數值，或 {標籤值 tuple: 數值}。"""
+
+    def __init__(self, name, documentation, fn, labelnames=(), type_name="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.type_name = type_name
+        self._fn = fn
+
+    def render(self):
+        try:
+            values = self._fn()
+        except Exception:
+            return []
+        if values is None:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = self.header()
+        for key, v in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {_format_value(v)}")
+        return lines
+
+
+class MetricsRegistry:
+    """同名指標只註冊一次（模組重新 import 時回傳既有物件）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, fn, labelnames=(), type_name="gauge"):
+        """回呼式指標；同名再次註冊時以新的 fn 取代（例如單例重建）。"""
+        metric = CallbackMetric(name, documentation, fn, labelnames, type_name)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+冷啟動量測：各初始化階段耗時，以及（STARTUP_PROFILE=True 時）每個模組的 import 時間。
+
+- 階段：mark(name) 記錄距上一個 mark 的時間；phase(name) 記錄一段 with 區塊
+- 模組 import：在 sys.meta_path 最前面掛一個 finder，包住各模組的 loader 計時
+  （cumulative 含其間 import 的子模組，self 扣除子模組）；只在量測模式啟用
+- 結果寫入 log（report()）與 /metrics（zoo_startup_seconds{phase}、zoo_startup_import_seconds{module}）
+
+用法（app.py 最前面）：
+    from utils.startup import startup_profile
+    startup_profile.begin(trace_imports=True)
+    ...
+    startup_profile.mark("imports")
+"""
+
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+from utils.metrics import registry
+
+_IMPORT_METRIC_TOP = 20     # /metrics 只輸出 self 時間最長的前幾個模組
+
+
+class _TimedLoader:
+    """包住原本的 loader，計時 create_module + exec_module；執行完還原 __loader__。"""
+
+    def __init__(self, loader, profile):
+        self._loader = loader
+        self._profile = profile
+
+    def create_module(self, spec):
+        create = getattr(self._loader, "create_module", None)
+        if create is None:
+            return None
+        with self._profile._timing(spec.name):
+            return create(spec)
+
+    def exec_module(self, module):
+        try:
+            with self._profile._timing(module.__name__):
+                self._loader.exec_module(module)
+        finally:
+            module.__loader__ = self._loader
+            if getattr(module, "__spec__", None) is not None:
+                module.__spec__.loader = self._loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _ImportTimer:
+    """sys.meta_path finder：向其後的 finder 取得 spec，再換上 _TimedLoader。"""
+
+    def __init__(self, profile):
+        self._profile = profile
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self._profile)
+        return spec
+
+
+class StartupProfile:
+    """單一行程的啟動量測（每個 gunicorn worker 各自一份）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = None
+        self._last = None
+        self.phases = {}         # 階段 → 秒
+        self.imports = {}        # 模組 → [cumulative 秒, self 秒]
+        self._local = threading.local()   # 各執行緒進行中的 import 堆疊：[子模組累計秒]
+        self._timer = None
+
+    def begin(self, trace_imports=False):
+        """開始量測；trace_imports=True 時記錄之後每個模組的 import 時間。"""
+        now = time.perf_counter()
+        self._started = self._last = now
+        if trace_imports and self._timer is None:
+            self._timer = _ImportTimer(self)
+            sys.meta_path.insert(0, self._timer)
+
+    def stop_imports(self):
+        """移除 import 計時（預熱完成後呼叫，避免影響之後動態 import 的模組）。"""
+        if self._timer is not None:
+            try:
+                sys.meta_path.remove(self._timer)
+            except ValueError:
+                pass
+            self._timer = None
+
+    def mark(self, name):
+        """記錄距上一個 mark / begin 的時間為一個階段。"""
+        now = time.perf_counter()
+        if self._last is None:
+            self._started = self._last = now
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + (now - self._last)
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        """記錄 with 區塊的耗時為一個階段（可巢狀、可在背景執行緒使用）。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def elapsed(self):
+        """begin() 到現在的秒數。"""
+        return time.perf_counter() - self._started if self._started is not None else 0.0
+
+    def top_imports(self, n=15):
+        """依 self 時間排序的 [(模組, cumulative 秒, self 秒)]。"""
+        with self._lock:
+            items = [(name, cum, own) for name, (cum, own) in self.imports.items()]
+        return sorted(items, key=lambda x: -x[2])[:n]
+
+    def report(self, n=15):
+        """可寫入 log 的多行摘要。"""
+        with self._lock:
+            phases = list(self.phases.items())
+        lines = [f"[startup] 啟動共 {self.elapsed() * 1000:.0f} ms"]
+        lines += [f"[startup]   {name:<24}{seconds * 1000:>9.1f} ms" for name, seconds in phases]
+        if self.imports:
+            lines.append(f"[startup] import 共 {len(self.imports)} 個模組，self 時間最長：")
+            lines += [
+                f"[startup]   {name:<40}{own * 1000:>9.1f} ms（含子模組 {cum * 1000:.1f} ms）"
+                for name, cum, own in self.top_imports(n)
+            ]
+        return "\n".join(lines)
+
+    # ── 內部 ────────────────────────────────────────────────────
+
+    @contextmanager
+    def _timing(self, module):
+        # 不同執行緒可能同時 import 不同模組：堆疊依執行緒分開
+        stack = self._thread_stack()
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                row = self.imports.setdefault(module, [0.0, 0.0])
+                row[0] += elapsed
+                row[1] += elapsed - children
+
+    def _thread_stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+startup_profile = StartupProfile()
+
+registry.callback(
+    "zoo_startup_seconds", "啟動各階段耗時（import、app 初始化、預熱各步驟）",
+    lambda: {(name,): round(seconds, 6) for name, seconds in startup_profile.phases.items()} or None,
+    labelnames=("phase",),
+)
+registry.callback(
+    "zoo_startup_import_seconds", "STARTUP_PROFILE 模式下 self 時間最長的模組 import 耗時",
+    lambda: {(name,): round(own, 6) for name, _, own in startup_profile.top_imports(_IMPORT_METRIC_TOP)} or None,
+    labelnames=("module",),
+)
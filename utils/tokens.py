@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地 token 估算（不呼叫 API、不需 tokenizer 套件）。
+
+- 中日韓字與全形標點：一字約一個 token（cl100k / o200k 實測約 0.7–1.2）
+- 其餘字元（英數、半形標點、空白）：約四個字元一個 token
+- 寧可略為高估：用於預算控管，不用於計費
+"""
+
+import re
+
+# CJK 統一漢字（含擴充 A、相容字）與全形標點 / 注音
+_WIDE_RE = re.compile(r'[㐀-鿿豈-﫿　-〿㄀-ㄯ＀-￯]')
+
+
+def approx_tokens(text):
+    """粗估 token 數。"""
+    if not text:
+        return 0
+    wide = _WIDE_RE.subn("", text)[1]     # 只取代換次數，不建立逐字 list
+    return wide + (len(text) - wide + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens, note="", at_least=False):
+    """
+    依行截短到 max_tokens 以內（保留前面的行），有截短時在結尾附上 note。
+    一行都放不下時回傳空字串。
+    at_least=True：改為保留到總量剛好不少於 max_tokens 的那一行（保留下限用）。
+    """
+    if approx_tokens(text) <= max_tokens:
+        return text
+    if at_least:
+        lines = text.split("\n")
+        for n in range(1, len(lines)):
+            out = "\n".join(lines[:n]) + (f"\n{note}" if note else "")
+            if approx_tokens(out) >= max_tokens:
+                return out
+        return text
+    limit = max_tokens - approx_tokens(note)
+    kept, used = [], 0
+    for line in text.split("\n"):
+        cost = approx_tokens(line) + 1          # 換行
+        if used + cost > limit:
+            break
+        kept.append(line)
+        used += cost
+    while kept and not kept[-1].strip():
+        kept.pop()
+    if not kept:
+        return ""
+    return "\n".join(kept) + (f"\n{note}" if note else "")